@@ -1,5 +1,10 @@
 from django.contrib import admin
-from adminsortable2.admin import SortableInlineAdminMixin, SortableAdminBase
+from django.core.exceptions import ValidationError
+from adminsortable2.admin import (
+    CustomInlineFormSet,
+    SortableInlineAdminMixin,
+    SortableAdminBase,
+)
 from polymorphic.admin import (
     PolymorphicParentModelAdmin,
     PolymorphicChildModelAdmin,
@@ -10,8 +15,22 @@ from filer.models import Image as FilerImage
 from .models import *
 
 
+class DeckMembershipFormSet(CustomInlineFormSet):
+    def clean(self):
+        """Checks that only one image in the deck is marked as primary."""
+        super().clean()
+        primary = [
+            form
+            for form in self.forms
+            if form.cleaned_data.get("primary") and not form.cleaned_data.get("DELETE")
+        ]
+        if len(primary) > 1:
+            raise ValidationError("Only one image can be the primary image of a deck.")
+
+
 class DeckMembershipInline(SortableInlineAdminMixin, admin.TabularInline):
     model = DeckMembership
+    formset = DeckMembershipFormSet
     extra = 0
     raw_id_fields = ("image",)
 
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ImagedeckConfig(AppConfig):
     name = "imagedeck"
+
+    def ready(self):
+        from . import checks  # noqa: F401
@@ -0,0 +1,49 @@
+from django.templatetags.static import static
+from imagekit.cachefiles.backends import CacheFileState
+
+from . import settings as imagedeck_settings
+
+
+class NonBlocking:
+    """
+    An imagekit cache file strategy which doesn't check for or generate thumbnails when their URL is requested.
+
+    Thumbnails are (re)generated when the source image is saved.
+    DeckImage.thumbnail checks the cached state of the file and schedules generation if it doesn't exist.
+    Use an asynchronous cache file backend (e.g. imagekit.cachefiles.backends.Celery) so that generation happens in the background.
+    """
+
+    def on_source_saved(self, file):
+        file.generate(force=True)
+
+    def should_verify_existence(self, file):
+        return False
+
+
+class OnDemand(NonBlocking):
+    """
+    Like NonBlocking, but thumbnails aren't generated when the source image is saved.
+
+    DeckImage uses this for the thumbnails in the other rendition formats (e.g. WebP)
+    so that they are only generated if a browser asks for them.
+    """
+
+    def on_source_saved(self, file):
+        pass
+
+
+def cachefile_exists(file):
+    """Returns True if a cache file is known to exist. This uses the state cached by the backend where possible."""
+    return file.cachefile_backend.get_state(file) == CacheFileState.EXISTS
+
+
+def is_async(backend):
+    """Returns True if an imagekit cache file backend generates files in the background."""
+    return getattr(backend, "is_async", False)
+
+
+def thumbnail_placeholder():
+    """Returns the URL of the image shown while a thumbnail is generated (IMAGEDECK_THUMBNAIL_PLACEHOLDER or a plain grey image)."""
+    return imagedeck_settings.IMAGEDECK_THUMBNAIL_PLACEHOLDER or static(
+        "imagedeck/thumbnail-placeholder.svg"
+    )
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from django.utils.module_loading import import_string
+
+from .cachefiles import is_async
+
+
+@register()
+def check_thumbnail_backend(app_configs, **kwargs):
+    """
+    Warns if the imagekit cache file backend generates thumbnails synchronously.
+
+    DeckImage thumbnails are then generated when an image is saved and in the request which first needs them.
+    """
+    backend = getattr(
+        settings,
+        "IMAGEKIT_DEFAULT_CACHEFILE_BACKEND",
+        "imagekit.cachefiles.backends.Simple",
+    )
+    if is_async(import_string(backend)):
+        return []
+    return [
+        Warning(
+            "Thumbnails of DeckImage objects are generated while saving images and in requests.",
+            hint=(
+                "Set IMAGEKIT_DEFAULT_CACHEFILE_BACKEND to an asynchronous backend "
+                "(e.g. 'imagekit.cachefiles.backends.Celery') so that they are generated in the background "
+                "and IMAGEDECK_THUMBNAIL_PLACEHOLDER is shown in the meantime."
+            ),
+            id="imagedeck.W001",
+        )
+    ]
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from . import settings as imagedeck_settings
+from .models import DeckImageBase
+
+
+def contact_sheet_directory(deck):
+    return posixpath.join(imagedeck_settings.IMAGEDECK_CONTACT_SHEET_DIR, str(deck.pk))
+
+
+def fit_in_cell(aspect_ratio, cell_width, cell_height):
+    """Returns the largest width and height with the aspect ratio which fits in a cell."""
+    aspect_ratio = aspect_ratio or 1.0
+    width, height = cell_width, round(cell_width / aspect_ratio)
+    if height > cell_height:
+        width, height = round(cell_height * aspect_ratio), cell_height
+    return max(width, 1), max(height, 1)
+
+
+def render_sheet(entries, images, size, background):
+    """Draws the thumbnails of the images onto a single sprite image."""
+    sheet = Image.new("RGB", size, background)
+    for entry in entries:
+        image = images.get(entry["image"])
+        thumbnail = (
+            image.get_pil_image(entry["width"], entry["height"]) if image else None
+        )
+        if thumbnail is None:
+            continue
+        thumbnail = thumbnail.convert("RGB").resize(
+            (entry["width"], entry["height"]), Image.LANCZOS
+        )
+        sheet.paste(thumbnail, (entry["x"], entry["y"]))
+
+    data = BytesIO()
+    sheet.save(
+        data, format="JPEG", quality=imagedeck_settings.IMAGEDECK_THUMBNAIL_QUALITY
+    )
+    return data.getvalue()
+
+
+def update_contact_sheet(
+    deck,
+    columns=None,
+    images_per_sheet=None,
+    cell_width=None,
+    cell_height=None,
+    storage=None,
+):
+    """
+    Renders the thumbnails of a deck in rank order onto sprite images and returns a map of where each image is.
+
+    Each sheet is named with a hash of the memberships and images on it so only the sheets
+    which have changed since the last time are rendered again.
+    The map is also saved in the storage as 'contact-sheet.json' in the same directory as the sheets.
+    """
+    columns = columns or imagedeck_settings.IMAGEDECK_CONTACT_SHEET_COLUMNS
+    images_per_sheet = (
+        images_per_sheet or imagedeck_settings.IMAGEDECK_CONTACT_SHEET_IMAGES
+    )
+    cell_width = cell_width or imagedeck_settings.IMAGEDECK_CONTACT_SHEET_CELL_WIDTH
+    cell_height = cell_height or imagedeck_settings.IMAGEDECK_CONTACT_SHEET_CELL_HEIGHT
+    storage = storage or default_storage
+    directory = contact_sheet_directory(deck)
+
+    memberships = list(
+        deck.memberships().values_list(
+            "id", "image_id", "image__modified", "image__aspect_ratio"
+        )
+    )
+
+    # Lay out the images
+    entries = []
+    for index, (membership_id, image_id, modified, aspect_ratio) in enumerate(
+        memberships
+    ):
+        position = index % images_per_sheet
+        width, height = fit_in_cell(aspect_ratio, cell_width, cell_height)
+        entries.append(
+            dict(
+                membership=membership_id,
+                image=image_id,
+                sheet=index // images_per_sheet,
+                x=(position % columns) * cell_width + (cell_width - width) // 2,
+                y=(position // columns) * cell_height + (cell_height - height) // 2,
+                width=width,
+                height=height,
+                modified=modified.isoformat() if modified else "",
+            )
+        )
+
+    # Render the sheets which have changed
+    sheets = []
+    changed = False
+    for sheet_index in range(0, len(entries), images_per_sheet):
+        sheet_entries = entries[sheet_index : sheet_index + images_per_sheet]
+        rows = (len(sheet_entries) + columns - 1) // columns
+        size = (columns * cell_width, rows * cell_height)
+
+        signature = hashlib.sha1(
+            json.dumps([size, sheet_entries], sort_keys=True).encode()
+        ).hexdigest()[:16]
+        name = posixpath.join(
+            directory, f"sheet-{sheet_index // images_per_sheet}-{signature}.jpg"
+        )
+        if not storage.exists(name):
+            images = DeckImageBase.objects.in_bulk(
+                [entry["image"] for entry in sheet_entries]
+            )
+            content = render_sheet(
+                sheet_entries,
+                images,
+                size,
+                imagedeck_settings.IMAGEDECK_CONTACT_SHEET_BACKGROUND,
+            )
+            storage.save(name, ContentFile(content))
+            changed = True
+
+        sheets.append(
+            dict(name=name, url=storage.url(name), width=size[0], height=size[1])
+        )
+
+    for entry in entries:
+        del entry["modified"]
+
+    contact_sheet = dict(
+        deck=deck.pk,
+        columns=columns,
+        cell_width=cell_width,
+        cell_height=cell_height,
+        sheets=sheets,
+        images=entries,
+    )
+
+    map_name = posixpath.join(directory, "contact-sheet.json")
+    if changed or not storage.exists(map_name):
+        # Remove the sheets which are no longer used
+        current = {posixpath.basename(sheet["name"]) for sheet in sheets}
+        if storage.exists(directory):
+            for filename in storage.listdir(directory)[1]:
+                if filename.startswith("sheet-") and filename not in current:
+                    storage.delete(posixpath.join(directory, filename))
+
+        if storage.exists(map_name):
+            storage.delete(map_name)
+        storage.save(map_name, ContentFile(json.dumps(contact_sheet).encode()))
+
+    return contact_sheet
@@ -0,0 +1,153 @@
+"""
+Fetches the dimensions of many images at once.
+
+Remote images (e.g. DeckImageExternal and DeckImageIIIF) are fetched concurrently in a thread pool
+with a shared session so that connections to each server are kept alive and reused.
+The number of requests made to each host at a time is limited so that image servers are not overwhelmed.
+The worker threads only use the database if IIIF image information is cached there (IMAGEDECK_INFO_JSON_DB).
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from urllib.parse import urlparse
+
+import requests
+from django.db import close_old_connections
+from django.db.models import Q
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import settings as imagedeck_settings
+from .models import DeckImageBase
+from .workers import chunked
+
+
+def make_session(pool_size=10, retries=3, backoff_factor=0.5):
+    """
+    Returns a requests session which keeps a pool of connections to each host.
+
+    Connection errors and responses with a status of 429 or 5xx are retried with an exponential backoff.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def host_lanes(images_by_host, per_host):
+    """
+    Splits the images of each host into at most 'per_host' lists which are fetched one image after another.
+
+    The lists are interleaved so that the first list of every host comes before the second list of any host.
+    """
+    lanes = [
+        [images[start::per_host] for start in range(min(per_host, len(images)))]
+        for images in images_by_host.values()
+    ]
+    return [lane for group in zip_longest(*lanes) for lane in group if lane]
+
+
+def image_host(image):
+    """Returns the host that the dimensions of an image are fetched from or an empty string for local images."""
+    # Images which can be proxied through this site are fetched from their remote URL
+    url = image.remote_url() if hasattr(image, "remote_url") else image.url()
+    return urlparse(url or "").netloc
+
+
+def missing_dimensions():
+    """Returns a queryset of the images which don't have a width or height yet."""
+    return DeckImageBase.objects.filter(Q(width=0) | Q(height=0))
+
+
+def backfill_dimensions(
+    images=None,
+    workers=16,
+    per_host=4,
+    timeout=None,
+    retries=3,
+    chunk_size=500,
+    callback=None,
+):
+    """
+    Fetches and stores the width, height and aspect ratio of images.
+
+    The images are a queryset of DeckImageBase which defaults to all images without dimensions.
+    They are read in chunks and the results of each chunk are saved with one bulk_update.
+    Requests to remote hosts are made in a pool of 'workers' threads with at most 'per_host' to any one host at a time.
+    The images of each host are split between at most 'per_host' jobs so that a slow host only holds up that many workers.
+    Local images are read in the calling thread.
+    The callback is called with the number of images updated and missing so far after each chunk.
+
+    Returns a tuple of the number of images updated and the number which could not be found.
+    """
+    if images is None:
+        images = missing_dimensions()
+    timeout = timeout or imagedeck_settings.IMAGEDECK_REQUEST_TIMEOUT
+
+    session = make_session(pool_size=max(workers, per_host), retries=retries)
+
+    def fetch(images):
+        try:
+            dimensions = []
+            for image in images:
+                try:
+                    dimensions.append(
+                        image.fetch_dimensions(session=session, timeout=timeout)
+                    )
+                except Exception:
+                    dimensions.append(None)
+            return dimensions
+        finally:
+            # Fetching IIIF image information can use the database (with IMAGEDECK_INFO_JSON_DB)
+            close_old_connections()
+
+    image_ids = images.order_by("pk").values_list("pk", flat=True).iterator()
+    updated_count = 0
+    missing_count = 0
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunked(image_ids, chunk_size):
+            results = []
+            images_by_host = defaultdict(list)
+            for image in DeckImageBase.objects.filter(pk__in=chunk):
+                host = image_host(image)
+                if host:
+                    images_by_host[host].append(image)
+                else:
+                    results.append((image, image.fetch_dimensions()))
+
+            # Each job fetches its images in turn so that there are never more than 'per_host' requests
+            # to a host at once, without workers waiting on a slow host while other hosts have requests to make
+            jobs = [
+                (lane, executor.submit(fetch, lane))
+                for lane in host_lanes(images_by_host, per_host)
+            ]
+            for lane, job in jobs:
+                results.extend(zip(lane, job.result()))
+
+            updated = []
+            for image, dimensions in results:
+                if not dimensions:
+                    missing_count += 1
+                    continue
+                image.set_size(*dimensions)
+                updated.append(image)
+
+            DeckImageBase.objects.bulk_update(
+                updated, ["width", "height", "aspect_ratio"]
+            )
+            updated_count += len(updated)
+            if callback:
+                callback(updated_count, missing_count)
+
+    return updated_count, missing_count
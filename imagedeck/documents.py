@@ -0,0 +1,224 @@
+"""
+Fetches remote documents (e.g. IIIF manifests) with HTTP caching.
+
+Each document is kept in the DeckCachedDocument table with its ETag and Last-Modified headers.
+Within the TTL the stored copy is used without any request. After that, it is revalidated with a conditional request
+so that an unchanged document isn't downloaded again.
+Parsed JSON is memoized in the process so large documents aren't parsed again until they change.
+
+IIIF image information (info.json) is shared through the Django cache so that every image with the same
+image service uses the same copy. Copies older than the TTL are served while they are revalidated in the background.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import requests
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import settings as imagedeck_settings
+from .locks import KeyedLocks
+from .models import DeckCachedDocument
+
+logger = logging.getLogger(__name__)
+
+# The number of seconds to wait before trying to revalidate an info.json again after it fails
+REVALIDATE_INTERVAL = 60
+
+_parsed = OrderedDict()
+_parsed_lock = threading.Lock()
+
+# Downloads of the same info.json in this process wait for each other
+_info_locks = KeyedLocks()
+
+
+def fetch_document(url, ttl=None, session=None, timeout=None, refresh=False):
+    """
+    Returns the DeckCachedDocument for a URL, downloading or revalidating it if it is older than the TTL (in seconds).
+
+    If 'refresh' is True then it is revalidated regardless of the TTL.
+    If the server cannot be reached but there is a stored copy, then the stored copy is returned.
+    """
+    ttl = imagedeck_settings.IMAGEDECK_MANIFEST_TTL if ttl is None else ttl
+    timeout = timeout or imagedeck_settings.IMAGEDECK_REQUEST_TIMEOUT
+    now = timezone.now()
+
+    document = DeckCachedDocument.objects.filter(url=url).first()
+    if document and not refresh and now - document.checked < timedelta(seconds=ttl):
+        return document
+
+    headers = {}
+    if document and document.etag:
+        headers["If-None-Match"] = document.etag
+    if document and document.last_modified:
+        headers["If-Modified-Since"] = document.last_modified
+
+    try:
+        response = (session or requests).get(url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+    except requests.RequestException:
+        if document:
+            return document
+        raise
+
+    if document and response.status_code == 304:
+        document.checked = now
+        document.save(update_fields=["checked"])
+        return document
+
+    document = document or DeckCachedDocument(url=url)
+    document.body = response.text
+    document.content_type = response.headers.get("Content-Type", "")
+    document.etag = response.headers.get("ETag", "")
+    document.last_modified = response.headers.get("Last-Modified", "")
+    document.fetched = now
+    document.checked = now
+    document.save()
+    return document
+
+
+def fetch_json(url, ttl=None, session=None, timeout=None, refresh=False):
+    """
+    Returns the parsed JSON of the document at a URL.
+
+    The parsed result is shared between calls until the document changes so it should not be modified.
+    Within the TTL, the result is returned from memory without querying the database.
+    """
+    ttl = imagedeck_settings.IMAGEDECK_MANIFEST_TTL if ttl is None else ttl
+    now = timezone.now()
+
+    with _parsed_lock:
+        memo = _parsed.get(url)
+    if memo and not refresh and now - memo["checked"] < timedelta(seconds=ttl):
+        return memo["data"]
+
+    document = fetch_document(
+        url, ttl=ttl, session=session, timeout=timeout, refresh=refresh
+    )
+    if memo and memo["fetched"] == document.fetched:
+        data = memo["data"]
+    else:
+        data = json.loads(document.body)
+
+    with _parsed_lock:
+        _parsed[url] = dict(
+            data=data, fetched=document.fetched, checked=document.checked
+        )
+        _parsed.move_to_end(url)
+        while len(_parsed) > imagedeck_settings.IMAGEDECK_PARSED_DOCUMENTS:
+            _parsed.popitem(last=False)
+    return data
+
+
+def clear_parsed():
+    """Forgets the parsed documents in this process."""
+    with _parsed_lock:
+        _parsed.clear()
+
+
+def info_json_cache():
+    return caches[imagedeck_settings.IMAGEDECK_INFO_JSON_CACHE]
+
+
+def info_json_cache_key(url):
+    return "imagedeck:info-json:" + hashlib.sha1(url.encode()).hexdigest()
+
+
+def cached_info_json(url):
+    """Returns the cached info.json for a URL (however old it is) without making a request or None if it isn't cached."""
+    entry = info_json_cache().get(info_json_cache_key(url))
+    return entry["data"] if entry else None
+
+
+def refresh_info_json(url, session=None, timeout=None):
+    """
+    Downloads the info.json at a URL, stores it in the cache and returns it.
+
+    If IMAGEDECK_INFO_JSON_DB is True then it is also kept in the DeckCachedDocument table
+    and revalidated with a conditional request so that it is only downloaded again if it has changed.
+    """
+    timeout = timeout or imagedeck_settings.IMAGEDECK_REQUEST_TIMEOUT
+    if imagedeck_settings.IMAGEDECK_INFO_JSON_DB:
+        document = fetch_document(
+            url, ttl=0, session=session, timeout=timeout, refresh=True
+        )
+        data = json.loads(document.body)
+    else:
+        response = (session or requests).get(url, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+
+    ttl = imagedeck_settings.IMAGEDECK_INFO_JSON_TTL
+    stale = imagedeck_settings.IMAGEDECK_INFO_JSON_STALE
+    info_json_cache().set(
+        info_json_cache_key(url), dict(data=data, fetched=time.time()), ttl + stale
+    )
+    return data
+
+
+def revalidate_info_json(url, session=None, timeout=None):
+    """
+    Downloads a fresh copy of a stale info.json.
+
+    If it fails, the stale copy is kept and the ':refreshing' marker is left to expire
+    so that it isn't tried again for REVALIDATE_INTERVAL seconds.
+    """
+    try:
+        refresh_info_json(url, session=session, timeout=timeout)
+    except Exception:
+        logger.warning(
+            "Cannot revalidate the IIIF image information at %s", url, exc_info=True
+        )
+        return
+    info_json_cache().delete(info_json_cache_key(url) + ":refreshing")
+
+
+def run_in_background(function, *args, **kwargs):
+    """Runs a function in a daemon thread which closes its database connection when it finishes."""
+
+    def target():
+        try:
+            function(*args, **kwargs)
+        except Exception:
+            logger.exception("Error in background task %s", function.__name__)
+        finally:
+            close_old_connections()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def fetch_info_json(url, session=None, timeout=None):
+    """
+    Returns the IIIF image information (info.json) at a URL from a cache shared by all the images of that service.
+
+    Copies younger than IMAGEDECK_INFO_JSON_TTL seconds are returned as they are.
+    Older copies are returned for up to IMAGEDECK_INFO_JSON_STALE seconds more while they are revalidated in the background.
+    Otherwise it is downloaded, with concurrent requests for the same URL in this process waiting for a single download.
+    """
+    cache = info_json_cache()
+    key = info_json_cache_key(url)
+    entry = cache.get(key)
+    if entry:
+        age = time.time() - entry["fetched"]
+        # Only one process revalidates it at a time
+        if age >= imagedeck_settings.IMAGEDECK_INFO_JSON_TTL and cache.add(
+            key + ":refreshing", True, timeout=REVALIDATE_INTERVAL
+        ):
+            run_in_background(revalidate_info_json, url, session, timeout)
+        return entry["data"]
+
+    return _info_locks.get_or_create(
+        url,
+        lambda: cached_info_json(url),
+        lambda: refresh_info_json(url, session=session, timeout=timeout),
+    )
@@ -0,0 +1,68 @@
+"""
+Chooses the format of image renditions from the formats that the browser accepts.
+
+Renditions are made in the first format of IMAGEDECK_RENDITION_FORMATS which is in the request's Accept header
+and which Pillow can write. Otherwise the default format is used (JPEG unless configured otherwise).
+"""
+
+from PIL import features
+
+from . import settings as imagedeck_settings
+
+MIME_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "png": "image/png",
+}
+
+
+def available_formats():
+    """Returns the formats in IMAGEDECK_RENDITION_FORMATS that Pillow can write in order of preference."""
+    formats = []
+    for format in imagedeck_settings.IMAGEDECK_RENDITION_FORMATS:
+        format = format.lower()
+        if format not in MIME_TYPES:
+            continue
+        if format in ("avif", "webp") and not features.check(format):
+            continue
+        formats.append(format)
+    return formats
+
+
+def accepted_mime_types(accept):
+    """Returns the set of media types which are explicitly accepted in the value of an Accept header."""
+    mime_types = set()
+    for item in (accept or "").split(","):
+        media_type, *parameters = item.strip().split(";")
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if media_type and quality > 0:
+            mime_types.add(media_type.strip().lower())
+    return mime_types
+
+
+def negotiate_format(request_or_accept):
+    """
+    Returns the preferred rendition format for a request (or the value of its Accept header).
+
+    Wildcards like 'image/*' are ignored because browsers send them whether or not they can display the newer formats.
+    Returns an empty string if the default format should be used.
+    """
+    accept = request_or_accept
+    if hasattr(request_or_accept, "headers"):
+        accept = request_or_accept.headers.get("Accept", "")
+    if not accept:
+        return ""
+
+    mime_types = accepted_mime_types(accept)
+    for format in available_formats():
+        if MIME_TYPES[format] in mime_types:
+            return format
+    return ""
@@ -0,0 +1,363 @@
+"""
+Extracts the images from IIIF Presentation 2.x and 3.0 manifests.
+
+Manifests can be given as parsed JSON or as JSON text (a string, a file or an iterable of chunks).
+A list whose items are all strings or bytes is taken to be chunks of JSON text rather than parsed JSON.
+JSON text is parsed incrementally and each canvas is discarded once its images have been yielded,
+so very large manifests don't need to be held in memory as a whole.
+Nothing is recursive so deeply nested documents can't hit the recursion limit.
+"""
+
+import codecs
+import json
+import re
+from json.decoder import scanstring
+from typing import NamedTuple
+
+CHUNK_SIZE = 65536
+SKIP_REGEX = re.compile(r"[ \t\r\n:]*")
+NUMBER_REGEX = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+NUMBER_DELIMITERS = {",", "]", "}", " ", "\t", "\r", "\n"}
+LITERALS = {"true": True, "false": False, "null": None}
+
+
+class IIIFImageRecord(NamedTuple):
+    """An image found in a IIIF manifest."""
+
+    service_id: str
+    width: int = 0
+    height: int = 0
+    label: str = ""
+
+
+class IIIFImageInfo:
+    """
+    The image information (info.json) of a IIIF Image API 2.x or 3.0 service.
+
+    This gives the sizes and tiles which the server has precomputed so that requests can be made for them.
+    """
+
+    def __init__(self, data):
+        self.data = data or {}
+
+    @property
+    def width(self):
+        return iiif_dimension(self.data.get("width"))
+
+    @property
+    def height(self):
+        return iiif_dimension(self.data.get("height"))
+
+    @property
+    def sizes(self):
+        """A sorted list of the (width, height) of the sizes of the full image that the server prefers."""
+        sizes = [
+            (iiif_dimension(size.get("width")), iiif_dimension(size.get("height")))
+            for size in as_list(self.data.get("sizes"))
+            if isinstance(size, dict)
+        ]
+        return sorted(size for size in sizes if size[0])
+
+    @property
+    def tiles(self):
+        """A list of dictionaries with the 'width', 'height' and 'scaleFactors' of the tiles."""
+        tiles = []
+        for tile in as_list(self.data.get("tiles")):
+            if not isinstance(tile, dict) or not tile.get("width"):
+                continue
+            tiles.append(
+                dict(
+                    width=iiif_dimension(tile["width"]),
+                    height=iiif_dimension(tile.get("height") or tile["width"]),
+                    scaleFactors=[
+                        int(factor) for factor in tile.get("scaleFactors", [1])
+                    ],
+                )
+            )
+        return tiles
+
+    def snap_width(self, width):
+        """
+        Returns the width of the smallest precomputed size which is at least as wide as the requested width.
+
+        If there are no precomputed sizes that wide then the requested width is returned.
+        """
+        width = int(float(width))
+        for size_width, _ in self.sizes:
+            if size_width >= width:
+                return size_width
+        return width
+
+
+def iiif_label(label):
+    """Returns a IIIF label (a string, a list, a value object or a language map) as a single string."""
+    if isinstance(label, dict):
+        if "@value" in label:
+            return str(label["@value"])
+        label = [value for values in label.values() for value in values]
+    if isinstance(label, list):
+        return " ".join(iiif_label(value) for value in label)
+    return str(label or "")
+
+
+def iiif_dimension(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def is_canvas(element):
+    return element.get("@type") == "sc:Canvas" or element.get("type") == "Canvas"
+
+
+def service_id(resource):
+    """Returns the id of the first IIIF Image API service of a resource or None if it doesn't have one."""
+    for service in as_list(resource.get("service")):
+        if isinstance(service, dict):
+            identifier = service.get("@id") or service.get("id")
+            if identifier:
+                return identifier
+    return None
+
+
+def painted_resources(canvas):
+    """Yields the resources painted onto a canvas in IIIF Presentation 2.x or 3.0."""
+    # Presentation 2.x: canvas.images[].resource
+    for annotation in as_list(canvas.get("images")):
+        if isinstance(annotation, dict):
+            yield from as_list(annotation.get("resource"))
+
+    # Presentation 3.0: canvas.items[] (AnnotationPage) .items[] (Annotation) .body
+    for page in as_list(canvas.get("items")):
+        if not isinstance(page, dict):
+            continue
+        for annotation in as_list(page.get("items")):
+            if isinstance(annotation, dict) and annotation.get("motivation") in (
+                None,
+                "painting",
+            ):
+                yield from as_list(annotation.get("body"))
+
+
+def canvas_records(canvas):
+    """Yields an IIIFImageRecord for each image with an image service on a canvas."""
+    label = iiif_label(canvas.get("label"))
+    for resource in painted_resources(canvas):
+        if not isinstance(resource, dict):
+            continue
+        # Use the default item of a choice
+        if resource.get("@type") == "oa:Choice":
+            resource = resource.get("default") or {}
+        elif resource.get("type") == "Choice":
+            resource = next(iter(as_list(resource.get("items"))), {})
+        if not isinstance(resource, dict):
+            continue
+
+        identifier = service_id(resource)
+        if not identifier:
+            continue
+
+        # Prefer the dimensions of the image itself over the canvas
+        source = resource if resource.get("width") else canvas
+        yield IIIFImageRecord(
+            service_id=identifier,
+            width=iiif_dimension(source.get("width")),
+            height=iiif_dimension(source.get("height")),
+            label=label,
+        )
+
+
+def iter_json_events(chunks):
+    """
+    Parses JSON text which arrives in chunks and yields events as pairs of (event, value).
+
+    The events are 'start_map', 'map_key', 'end_map', 'start_array', 'end_array' and 'value'.
+    The chunks can be strings or bytes (which are decoded as UTF-8).
+    """
+    chunks = iter(chunks)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    finished = False
+    containers = []
+    expect_key = False
+
+    def read_more():
+        nonlocal buffer, position, finished
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk)
+            if chunk:
+                buffer = buffer[position:] + chunk
+                position = 0
+                return True
+        finished = True
+        return False
+
+    while True:
+        position = SKIP_REGEX.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == ",":
+            if containers and containers[-1] == "map":
+                expect_key = True
+            position += 1
+            continue
+        if position >= len(buffer):
+            if read_more():
+                continue
+            if containers:
+                raise ValueError("The JSON document ended unexpectedly.")
+            return
+
+        character = buffer[position]
+        if character == "{":
+            containers.append("map")
+            expect_key = True
+            position += 1
+            yield "start_map", None
+        elif character == "}":
+            containers.pop()
+            expect_key = False
+            position += 1
+            yield "end_map", None
+        elif character == "[":
+            containers.append("array")
+            expect_key = False
+            position += 1
+            yield "start_array", None
+        elif character == "]":
+            containers.pop()
+            position += 1
+            yield "end_array", None
+        elif character == '"':
+            try:
+                value, end = scanstring(buffer, position + 1)
+            except json.JSONDecodeError:
+                # The string continues in the next chunk
+                if not finished and read_more():
+                    continue
+                raise
+            position = end
+            if expect_key:
+                expect_key = False
+                yield "map_key", value
+            else:
+                yield "value", value
+        else:
+            match = NUMBER_REGEX.match(buffer, position)
+            if match:
+                # A number is only complete once it is followed by a delimiter
+                following = buffer[match.end() : match.end() + 1]
+                if following not in NUMBER_DELIMITERS and not finished and read_more():
+                    continue
+                text = match.group()
+                position = match.end()
+                if "." in text or "e" in text or "E" in text:
+                    yield "value", float(text)
+                else:
+                    yield "value", int(text)
+                continue
+
+            for literal, value in LITERALS.items():
+                if buffer.startswith(literal, position):
+                    position += len(literal)
+                    yield "value", value
+                    break
+            else:
+                if len(buffer) - position < 5 and not finished and read_more():
+                    continue
+                raise ValueError(
+                    f"Unexpected character {character!r} in JSON at position {position}."
+                )
+
+
+def iter_canvases_from_events(events):
+    """
+    Builds the canvases of a manifest from JSON events and yields each one as it is completed.
+
+    Canvases aren't kept once they have been yielded so only one is in memory at a time.
+    """
+    stack = []
+    for event, value in events:
+        if event == "start_map":
+            stack.append([{}, None])
+            continue
+        if event == "start_array":
+            stack.append([[], None])
+            continue
+        if event == "map_key":
+            stack[-1][1] = value
+            continue
+
+        if event in ("end_map", "end_array"):
+            value = stack.pop()[0]
+            if isinstance(value, dict) and is_canvas(value):
+                yield value
+                continue
+
+        if stack:
+            container, key = stack[-1]
+            if isinstance(container, list):
+                container.append(value)
+            else:
+                container[key] = value
+
+
+def iter_canvases_in_object(data):
+    """Yields the canvases in parsed JSON in document order."""
+    stack = [data]
+    while stack:
+        element = stack.pop()
+        if isinstance(element, dict):
+            if is_canvas(element):
+                yield element
+                continue
+            stack.extend(reversed(list(element.values())))
+        elif isinstance(element, list):
+            stack.extend(reversed(element))
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yields the text of a string, bytes or file in chunks."""
+    if isinstance(source, (str, bytes)):
+        for start in range(0, len(source), chunk_size):
+            yield source[start : start + chunk_size]
+        return
+
+    while chunk := source.read(chunk_size):
+        yield chunk
+
+
+def iiif_image_records(manifest):
+    """
+    Yields an IIIFImageRecord for each image in a IIIF Presentation 2.x or 3.0 manifest in order.
+
+    The manifest can be parsed JSON, a string or bytes of JSON, a file opened for reading or an iterable of chunks of JSON text.
+    A dict is parsed JSON. A list is parsed JSON unless it is non-empty and all of its items are strings or bytes,
+    in which case it is a list of chunks of JSON text.
+    """
+    if isinstance(manifest, dict) or (
+        isinstance(manifest, list)
+        and not (manifest and all(isinstance(item, (str, bytes)) for item in manifest))
+    ):
+        canvases = iter_canvases_in_object(manifest)
+    else:
+        if isinstance(manifest, (str, bytes)) or hasattr(manifest, "read"):
+            manifest = iter_chunks(manifest)
+        canvases = iter_canvases_from_events(iter_json_events(manifest))
+
+    for canvas in canvases:
+        yield from canvas_records(canvas)
+
+
+def images_in_iiif_json(data):
+    """Returns a list of the image service ids of all the images in a IIIF presentation."""
+    return [record.service_id for record in iiif_image_records(data)]
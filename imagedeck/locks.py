@@ -0,0 +1,38 @@
+"""
+Locks which stop threads in the same process from doing the same work (e.g. downloading the same URL) at once.
+"""
+
+import threading
+import zlib
+
+
+class KeyedLocks:
+    """
+    A lock for each key (e.g. a URL).
+
+    The keys are spread over a fixed number of locks so that this doesn't grow with the number of keys.
+    """
+
+    def __init__(self, count=64):
+        self.locks = [threading.Lock() for _ in range(count)]
+
+    def __call__(self, key):
+        return self.locks[zlib.crc32(str(key).encode()) % len(self.locks)]
+
+    def get_or_create(self, key, get, create):
+        """
+        Returns the result of get() or, if that is None, the result of create().
+
+        Only one thread creates the value for a key at a time. Threads which were waiting for it use the value
+        which was created if get() returns it.
+        """
+        value = get()
+        if value is not None:
+            return value
+
+        with self(key):
+            # Another thread may have created it while this one was waiting
+            value = get()
+            if value is not None:
+                return value
+            return create()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from imagedeck.management.options import get_decks
+
+
+class Command(BaseCommand):
+    help = "Renders the contact sheets of decks which have changed since they were last rendered."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "decks", nargs="*", type=str, help="The names of the decks to render."
+        )
+        parser.add_argument(
+            "--all", action="store_true", help="Render the contact sheets of all decks."
+        )
+        parser.add_argument("--columns", type=int, help="The number of columns.")
+        parser.add_argument(
+            "--images-per-sheet", type=int, help="The number of images on each sheet."
+        )
+        parser.add_argument("--cell-width", type=int, help="The width of each cell.")
+        parser.add_argument("--cell-height", type=int, help="The height of each cell.")
+
+    def handle(self, *args, **options):
+        for deck in get_decks(options["decks"], all_decks=options["all"]):
+            contact_sheet = deck.contact_sheet(
+                columns=options["columns"],
+                images_per_sheet=options["images_per_sheet"],
+                cell_width=options["cell_width"],
+                cell_height=options["cell_height"],
+            )
+            self.stdout.write(
+                f"{deck}: {len(contact_sheet['images'])} images on {len(contact_sheet['sheets'])} sheets"
+            )
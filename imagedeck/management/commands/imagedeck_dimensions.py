@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from imagedeck.dimensions import backfill_dimensions, missing_dimensions
+from imagedeck.management.options import get_image_type
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores the width, height and aspect ratio of images which don't have them yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="The number of images to update in each query. (Default 500).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=16,
+            help="The number of threads to fetch the dimensions of remote images. (Default 16).",
+        )
+        parser.add_argument(
+            "--per-host",
+            type=int,
+            default=4,
+            help="The most requests to make to one host at the same time. (Default 4).",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            help="The timeout in seconds for each request. (Default IMAGEDECK_REQUEST_TIMEOUT).",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=3,
+            help="The number of times to retry a failed request. (Default 3).",
+        )
+        parser.add_argument(
+            "--type",
+            type=str,
+            help="Only fetch the dimensions of images of this type (e.g. DeckImageIIIF).",
+        )
+
+    def handle(self, *args, **options):
+        images = missing_dimensions()
+        if options.get("type"):
+            images = images.instance_of(get_image_type(options["type"]))
+
+        def report(updated_count, missing_count):
+            self.stdout.write(f"Updated {updated_count} images")
+
+        updated_count, missing_count = backfill_dimensions(
+            images,
+            workers=options["workers"],
+            per_host=options["per_host"],
+            timeout=options.get("timeout"),
+            retries=options["retries"],
+            chunk_size=options["chunk_size"],
+            callback=report,
+        )
+
+        self.stdout.write(
+            f"Updated {updated_count} images. Could not find the dimensions of {missing_count} images."
+        )
@@ -1,18 +1,125 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+from imagedeck.management.options import get_image_type
 from imagedeck.models import DeckImageBase
+from imagedeck.workers import chunked, generate_renditions, setup_worker
 
 
 class Command(BaseCommand):
+    help = "Generates the thumbnails and the renditions of images at the given widths."
+
     def add_arguments(self, parser):
         parser.add_argument(
-            "widths", nargs="+", type=str, help="The widths to generate."
+            "widths", nargs="*", type=int, help="The widths to generate."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="The number of processes to use to generate the renditions. (Default 1).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=100,
+            help="The number of images to give a worker at a time. (Default 100).",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            help="A file to record progress in. If it exists, the command resumes after the last image recorded.",
+        )
+        parser.add_argument(
+            "--deck", type=str, help="Only generate images in the deck with this name."
+        )
+        parser.add_argument(
+            "--type",
+            type=str,
+            help="Only generate images of this type (e.g. DeckImageFiler).",
         )
+        parser.add_argument(
+            "--modified-since",
+            type=str,
+            help="Only generate images modified since this date or datetime (ISO 8601).",
+        )
+
+    def get_images(self, options):
+        images = DeckImageBase.objects.all()
+
+        if options.get("deck"):
+            images = images.filter(deckmembership__deck__name=options["deck"])
+
+        if options.get("type"):
+            images = images.instance_of(get_image_type(options["type"]))
+
+        if options.get("modified_since"):
+            since = options["modified_since"]
+            if parsed := parse_datetime(since):
+                images = images.filter(modified__gte=parsed)
+            elif parsed := parse_date(since):
+                images = images.filter(modified__date__gte=parsed)
+            else:
+                raise CommandError(f"Cannot parse date '{since}'.")
+
+        return images.distinct()
 
     def handle(self, *args, **options):
+        widths = options["widths"]
+        checkpoint = Path(options["checkpoint"]) if options.get("checkpoint") else None
+
+        images = self.get_images(options)
+        if checkpoint and checkpoint.exists():
+            last_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after image {last_id}")
+            images = images.filter(pk__gt=last_id)
+
+        image_ids = images.order_by("pk").values_list("pk", flat=True).iterator()
+        chunks = chunked(image_ids, options["chunk_size"])
 
-        for image in DeckImageBase.objects.all():
-            print(image)
-            print("Thumbnail:", image.thumbnail())
+        executor = None
+        if options["workers"] > 1:
+            # Spawn the workers so that they don't inherit this process's database connections
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=setup_worker,
+            )
+            # Take a chunk for each worker at a time so that the IDs are still streamed
+            results = self.map_in_batches(executor, chunks, widths, options["workers"])
+        else:
+            results = ((chunk, generate_renditions(chunk, widths)) for chunk in chunks)
+
+        start = time.perf_counter()
+        image_count = 0
+        rendition_count = 0
+        try:
+            for chunk, (chunk_images, chunk_renditions) in results:
+                image_count += chunk_images
+                rendition_count += chunk_renditions
+                if checkpoint:
+                    checkpoint.write_text(str(chunk[-1]))
+                self.stdout.write(f"Processed {image_count} images (up to {chunk[-1]})")
+        finally:
+            if executor:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - start
+        rate = image_count / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"Processed {image_count} images and generated {rendition_count} renditions in {elapsed:.1f}s "
+            f"({rate:.1f} images/s)"
+        )
 
-            for width in options["widths"]:
-                print(f"{width} wide:", image.url(width=width))
+    def map_in_batches(self, executor, chunks, widths, workers):
+        """Yields each chunk with its result in order, keeping only a few chunks queued at once."""
+        for batch in chunked(chunks, workers * 2):
+            futures = [
+                executor.submit(generate_renditions, chunk, widths) for chunk in batch
+            ]
+            for chunk, future in zip(batch, futures):
+                yield chunk, future.result()
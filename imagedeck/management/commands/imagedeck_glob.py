@@ -16,6 +16,18 @@ class Command(BaseCommand):
             help="The name of the image deck. (Default is the name of the destination folder).",
         )
         parser.add_argument("--owner", type=str, help="The username of the folder.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="The number of processes to read the files. (Default 1).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="The number of files to save in each transaction. (Default 100).",
+        )
 
     def handle(self, *args, **options):
         Deck.import_glob(
@@ -23,4 +35,6 @@ class Command(BaseCommand):
             pattern=options["pattern"],
             deck_name=options.get("deck"),
             owner=options.get("owner"),
+            workers=options["workers"],
+            batch_size=options["batch_size"],
         )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from imagedeck.management.options import get_decks
+from imagedeck.models import DeckImageBase
+
+
+class Command(BaseCommand):
+    help = "Generates the tiles for the IIIF Image API endpoint of the local images in decks ahead of time."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "decks", nargs="*", type=str, help="The names of the decks to tile."
+        )
+        parser.add_argument(
+            "--all", action="store_true", help="Generate the tiles of all images."
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Check for missing tiles even if an image has already been tiled.",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            images = DeckImageBase.objects.all()
+        else:
+            decks = get_decks(options["decks"])
+            images = DeckImageBase.objects.filter(deckmembership__deck__in=decks)
+
+        image_count = 0
+        tile_count = 0
+        for image in images.distinct().order_by("pk").iterator():
+            if not image.tile_source():
+                continue
+            tile_count += image.generate_tiles(force=options["force"])
+            image_count += 1
+
+        self.stdout.write(f"Generated {tile_count} tiles for {image_count} images.")
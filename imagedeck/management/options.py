@@ -0,0 +1,30 @@
+"""
+Resolves the options which are shared by the imagedeck management commands.
+"""
+
+from django.apps import apps
+from django.core.management.base import CommandError
+
+from imagedeck.models import DeckBase
+
+
+def get_image_type(name):
+    """Returns the image model for the value of a '--type' option (e.g. 'DeckImageFiler')."""
+    try:
+        return apps.get_model("imagedeck", name)
+    except LookupError:
+        raise CommandError(f"Cannot find image type '{name}'.")
+
+
+def get_decks(names, all_decks=False):
+    """Returns a queryset of the decks with the given names (or all decks) and raises a CommandError if any are missing."""
+    if all_decks:
+        return DeckBase.objects.all()
+    if not names:
+        raise CommandError("Give the names of the decks or use --all.")
+
+    decks = DeckBase.objects.filter(name__in=names)
+    missing = set(names) - set(decks.values_list("name", flat=True))
+    if missing:
+        raise CommandError(f"Cannot find decks: {', '.join(sorted(missing))}")
+    return decks
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_memberships(apps, schema_editor):
+    """Keeps only the first membership of each image in a deck so that the unique constraint can be added."""
+    DeckMembership = apps.get_model("imagedeck", "DeckMembership")
+    seen = set()
+    duplicates = []
+    for membership_id, deck_id, image_id in (
+        DeckMembership.objects.order_by("rank", "id")
+        .values_list("id", "deck_id", "image_id")
+        .iterator()
+    ):
+        key = (deck_id, image_id)
+        if key in seen:
+            duplicates.append(membership_id)
+        seen.add(key)
+
+    DeckMembership.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0011_auto_20210901_1642"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_memberships, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="deckmembership",
+            index=models.Index(
+                fields=["deck", "rank"], name="imagedeck_membership_rank"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deckmembership",
+            index=models.Index(
+                condition=models.Q(("primary", True)),
+                fields=["deck"],
+                name="imagedeck_membership_primary",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="deckmembership",
+            constraint=models.UniqueConstraint(
+                fields=("deck", "image"), name="imagedeck_unique_membership"
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_primary_memberships(apps, schema_editor):
+    """Keeps one primary membership per deck and points the deck at it."""
+    DeckBase = apps.get_model("imagedeck", "DeckBase")
+    DeckMembership = apps.get_model("imagedeck", "DeckMembership")
+    primary_memberships = {}
+    for membership_id, deck_id in (
+        DeckMembership.objects.filter(primary=True)
+        .order_by("rank", "id")
+        .values_list("id", "deck_id")
+        .iterator()
+    ):
+        primary_memberships.setdefault(deck_id, membership_id)
+
+    DeckMembership.objects.filter(primary=True).exclude(
+        id__in=primary_memberships.values()
+    ).update(primary=False)
+    for deck_id, membership_id in primary_memberships.items():
+        DeckBase.objects.filter(id=deck_id).update(primary_membership_id=membership_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0012_deckmembership_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deckbase",
+            name="primary_membership",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="The membership of the primary image of this deck. This is kept in sync with DeckMembership.primary.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="imagedeck.deckmembership",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="deckmembership",
+            name="imagedeck_membership_primary",
+        ),
+        migrations.RunPython(set_primary_memberships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="deckmembership",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("primary", True)),
+                fields=("deck",),
+                name="imagedeck_unique_primary",
+            ),
+        ),
+    ]
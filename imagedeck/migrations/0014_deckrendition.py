@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0013_deckbase_primary_membership"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeckRendition",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "width",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="The requested width. Zero means that it was unconstrained.",
+                    ),
+                ),
+                (
+                    "height",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="The requested height. Zero means that it was unconstrained.",
+                    ),
+                ),
+                ("crop", models.BooleanField(default=True)),
+                (
+                    "subject_location",
+                    models.CharField(blank=True, default="", max_length=64),
+                ),
+                (
+                    "format",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="The image format of the rendition. Blank means the default format.",
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="An identifier for the version of the source file (e.g. its SHA1 hash).",
+                        max_length=255,
+                    ),
+                ),
+                ("url", models.CharField(max_length=1023)),
+                ("rendition_width", models.PositiveIntegerField(default=0)),
+                ("rendition_height", models.PositiveIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="renditions",
+                        to="imagedeck.deckimagebase",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="deckrendition",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "image",
+                    "width",
+                    "height",
+                    "crop",
+                    "subject_location",
+                    "format",
+                    "source",
+                ),
+                name="imagedeck_unique_rendition",
+            ),
+        ),
+    ]
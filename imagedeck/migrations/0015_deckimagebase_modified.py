@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0014_deckrendition"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deckimagebase",
+            name="modified",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text="When this image was last changed.",
+            ),
+            preserve_default=False,
+        ),
+    ]
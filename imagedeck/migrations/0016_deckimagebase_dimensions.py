@@ -0,0 +1,87 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+def copy_dimensions(apps, schema_editor):
+    """Copies the dimensions of external and IIIF images to the base table."""
+    DeckImageBase = apps.get_model("imagedeck", "DeckImageBase")
+    for model_name in ("DeckImageExternal", "DeckImageIIIF"):
+        model = apps.get_model("imagedeck", model_name)
+        images = [
+            DeckImageBase(
+                pk=pk,
+                width=width,
+                height=height,
+                aspect_ratio=width / height if width and height else None,
+            )
+            for pk, width, height in model.objects.values_list(
+                "pk", "old_width", "old_height"
+            ).iterator()
+        ]
+        DeckImageBase.objects.bulk_update(
+            images, ["width", "height", "aspect_ratio"], batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0015_deckimagebase_modified"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="deckimageexternal", old_name="width", new_name="old_width"
+        ),
+        migrations.RenameField(
+            model_name="deckimageexternal", old_name="height", new_name="old_height"
+        ),
+        migrations.RenameField(
+            model_name="deckimageiiif", old_name="width", new_name="old_width"
+        ),
+        migrations.RenameField(
+            model_name="deckimageiiif", old_name="height", new_name="old_height"
+        ),
+        migrations.AddField(
+            model_name="deckimagebase",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=0,
+                help_text="The width of the full image in pixels.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="deckimagebase",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=0,
+                help_text="The height of the full image in pixels.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="deckimagebase",
+            name="aspect_ratio",
+            field=models.FloatField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="The width of the image divided by its height.",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(copy_dimensions, migrations.RunPython.noop),
+        migrations.RemoveField(model_name="deckimageexternal", name="old_width"),
+        migrations.RemoveField(model_name="deckimageexternal", name="old_height"),
+        migrations.RemoveField(model_name="deckimageiiif", name="old_width"),
+        migrations.RemoveField(model_name="deckimageiiif", name="old_height"),
+        migrations.AlterField(
+            model_name="deckimage",
+            name="image",
+            field=models.ImageField(
+                height_field="height", upload_to="", width_field="width"
+            ),
+        ),
+    ]
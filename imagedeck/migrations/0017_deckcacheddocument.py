@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0016_deckimagebase_dimensions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeckCachedDocument",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("url", models.URLField(max_length=511, unique=True)),
+                ("body", models.TextField(blank=True, default="")),
+                (
+                    "content_type",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("etag", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "last_modified",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "fetched",
+                    models.DateTimeField(
+                        help_text="When the body was last downloaded."
+                    ),
+                ),
+                (
+                    "checked",
+                    models.DateTimeField(
+                        help_text="When the body was last downloaded or confirmed to be unchanged."
+                    ),
+                ),
+            ],
+        ),
+    ]
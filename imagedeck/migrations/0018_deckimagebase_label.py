@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0017_deckcacheddocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deckimagebase",
+            name="label",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="A label for this image (e.g. the label of its canvas in a IIIF manifest).",
+                max_length=255,
+            ),
+        ),
+    ]
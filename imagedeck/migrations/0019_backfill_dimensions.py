@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:40
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def copy_filer_dimensions(apps, schema_editor):
+    """
+    Copies the dimensions of Filer images which Filer already has in the database.
+
+    The files of DeckImage objects aren't read here. Run the imagedeck_dimensions command to fill them in.
+    """
+    DeckImageBase = apps.get_model("imagedeck", "DeckImageBase")
+    DeckImageFiler = apps.get_model("imagedeck", "DeckImageFiler")
+    rows = (
+        DeckImageFiler.objects.filter(Q(width=0) | Q(height=0))
+        .exclude(filer_image___width=None)
+        .exclude(filer_image___height=None)
+        .values_list("pk", "filer_image___width", "filer_image___height")
+    )
+    images = []
+    for pk, width, height in rows.iterator():
+        width, height = int(width), int(height)
+        images.append(
+            DeckImageBase(
+                pk=pk,
+                width=width,
+                height=height,
+                aspect_ratio=width / height if width and height else None,
+            )
+        )
+    DeckImageBase.objects.bulk_update(
+        images, ["width", "height", "aspect_ratio"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("imagedeck", "0018_deckimagebase_label"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="deckimage",
+            name="image",
+            field=models.ImageField(upload_to=""),
+        ),
+        migrations.RunPython(copy_filer_dimensions, migrations.RunPython.noop),
+    ]
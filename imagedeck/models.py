@@ -1,13 +1,32 @@
 import re
 import os
-from django.db import models
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from django.db import models, transaction, IntegrityError, connections
 from django.db.models.signals import post_save
-from django.db.models import Max
+from django.db.models import (
+    Count,
+    F,
+    Max,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Window,
+    prefetch_related_objects,
+)
+from django.db.models.functions import RowNumber
 from django.dispatch import receiver
 from polymorphic.models import PolymorphicModel
+from polymorphic.managers import PolymorphicManager
+from polymorphic.query import PolymorphicQuerySet
 from django.core.files import File as DjangoFile
+from django.core.files.storage import default_storage
 from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
+from django.conf import settings as django_settings
+from django.utils import timezone
 
 from filer.models import Image as FilerImage
 from filer.models import File as FilerFile
@@ -15,7 +34,7 @@ from filer.models import Folder
 from filer.settings import FILER_IS_PUBLIC_DEFAULT
 
 from imagekit.models import ImageSpecField
-from imagekit.processors import Thumbnail
+from easy_thumbnails.conf import settings as thumbnail_settings
 from PIL import Image
 import requests
 from io import BytesIO
@@ -24,6 +43,23 @@ from pathlib import Path
 import glob
 
 from . import settings as imagedeck_settings
+from .cachefiles import cachefile_exists, is_async, thumbnail_placeholder
+from .formats import available_formats
+from .probe import probe_dimensions
+from .iiif import (
+    IIIFImageInfo,
+    IIIFImageRecord,
+    iiif_image_records,
+    images_in_iiif_json,
+)
+from .workers import chunked, sniff_file
+from .processors import (
+    DraftThumbnail,
+    draft_pil_image,
+    open_reduced,
+    reduction_factor,
+    scale_subject_location,
+)
 
 
 def check_owner(owner):
@@ -93,9 +129,127 @@ def import_file(file_path, folder, owner=None):
     return import_django_file(dj_file, folder, owner)
 
 
+def exif_datetime(value):
+    """Returns a datetime for a date in the EXIF format ('YYYY:MM:DD HH:MM:SS') or None if it is not valid."""
+    try:
+        value = datetime.strptime(str(value).strip(), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if django_settings.USE_TZ:
+        value = timezone.make_aware(value)
+    return value
+
+
+def import_sniffed_file(details, folder, owner, is_image):
+    """
+    Saves a file which has been read by imagedeck.workers.sniff_file to Django Filer.
+
+    Filer is given the size, hash, dimensions and EXIF date so that it doesn't read the file again.
+    The DeckImageFiler isn't created when the image is saved so that it can be created in bulk.
+    """
+    model = FilerImage if is_image else FilerFile
+    obj = model(
+        original_filename=details["name"],
+        folder=folder,
+        owner=owner,
+        is_public=FILER_IS_PUBLIC_DEFAULT,
+        _file_size=details["size"],
+        sha1=details["sha1"],
+        mime_type=details["mime_type"],
+    )
+    if is_image:
+        obj._width = details["width"]
+        obj._height = details["height"]
+        obj._transparent = details["transparent"]
+        obj.date_taken = exif_datetime(details["date_taken"]) or timezone.now()
+        obj._imagedeck_bulk_import = True
+
+    with open(details["path"], mode="rb") as f:
+        # Tell Filer that the details of the file are already known
+        obj._file_data_changed_hint = False
+        obj.file = DjangoFile(f, name=details["name"])
+        obj.save()
+    return obj
+
+
+def rank_from_filename(filename, rank_regex):
+    """Returns the last integer in a filename matched by rank_regex or None if there is no match."""
+    integer_matches = re.findall(rank_regex, str(filename))
+    return int(integer_matches[-1]) if integer_matches else None
+
+
+def bulk_create_images(images):
+    """
+    Creates many images of a single type in a query for each table.
+
+    Django's bulk_create doesn't support multi-table inheritance, so the DeckImageBase rows are created with bulk_create
+    and the rows for the subclass are inserted directly. If the database can't return the IDs of rows created
+    in bulk then the images are saved one at a time.
+    """
+    images = list(images)
+    if not images:
+        return images
+
+    model = type(images[0])
+    connection = connections[DeckImageBase.objects.db]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        for image in images:
+            image.save()
+        return images
+
+    content_type = ContentType.objects.get_for_model(model, for_concrete_model=False)
+    base_fields = [
+        field
+        for field in DeckImageBase._meta.concrete_fields
+        if not field.primary_key and field.attname != "polymorphic_ctype_id"
+    ]
+    bases = []
+    for image in images:
+        image.set_size(image.width, image.height)
+        bases.append(
+            DeckImageBase(
+                polymorphic_ctype=content_type,
+                **{
+                    field.attname: getattr(image, field.attname)
+                    for field in base_fields
+                },
+            )
+        )
+
+    with transaction.atomic():
+        DeckImageBase.objects.bulk_create(bases)
+
+        fields = model._meta.local_concrete_fields
+        quote_name = connection.ops.quote_name
+        rows = []
+        for image, base in zip(images, bases):
+            image.id = base.id
+            image.pk = base.pk
+            image.polymorphic_ctype_id = content_type.id
+            image.modified = base.modified
+            image._state.adding = False
+            image._state.db = base._state.db
+            rows.append(
+                [
+                    field.get_db_prep_save(getattr(image, field.attname), connection)
+                    for field in fields
+                ]
+            )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {quote_name(model._meta.db_table)} "
+                f"({', '.join(quote_name(field.column) for field in fields)}) "
+                f"VALUES ({', '.join(['%s'] * len(fields))})",
+                rows,
+            )
+    return images
+
+
 def image_from_url(url):
     try:
-        response = requests.get(url)
+        response = requests.get(
+            url, timeout=imagedeck_settings.IMAGEDECK_REQUEST_TIMEOUT
+        )
         return Image.open(BytesIO(response.content))
     except:
         return None
@@ -114,9 +268,48 @@ class DeckLicence(models.Model):
         return self.name
 
 
+class DeckBaseQuerySet(PolymorphicQuerySet):
+    def with_primary_image(self):
+        """
+        Prefetches the primary image of each deck.
+
+        The first membership of each deck is also prefetched for decks which have no primary image.
+        This fetches the cover images for a page of decks in a fixed number of queries.
+        """
+        first_membership = (
+            DeckMembership.objects.filter(deck=OuterRef("deck"))
+            .order_by("rank", "id")
+            .values("id")[:1]
+        )
+        first_memberships = DeckMembership.objects.filter(
+            id=Subquery(first_membership), deck__primary_membership__isnull=True
+        )
+        return self.select_related("primary_membership").prefetch_related(
+            "primary_membership__image",
+            Prefetch(
+                "deckmembership_set",
+                queryset=first_memberships,
+                to_attr="first_memberships",
+            ),
+            "first_memberships__image",
+        )
+
+
 class DeckBase(PolymorphicModel):
     name = models.CharField(max_length=255, default="", blank=True)
     images = models.ManyToManyField("DeckImageBase", through="DeckMembership")
+    primary_membership = models.ForeignKey(
+        "DeckMembership",
+        on_delete=models.SET_NULL,
+        default=None,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        help_text="The membership of the primary image of this deck. This is kept in sync with DeckMembership.primary.",
+    )
+
+    objects = PolymorphicManager.from_queryset(DeckBaseQuerySet)()
 
     class Meta:
         ordering = [
@@ -127,7 +320,26 @@ class DeckBase(PolymorphicModel):
         return self.name
 
     def primary_image(self):
-        return self.images.order_by("-deckmembership__primary").first()
+        """
+        Returns the primary image of this deck.
+
+        If no image has been marked as primary then the first image of the deck is returned.
+        """
+        if self.primary_membership_id:
+            return self.primary_membership.image
+        first_memberships = getattr(self, "first_memberships", None)
+        if first_memberships is not None:
+            # Prefetched by DeckBaseQuerySet.with_primary_image
+            return first_memberships[0].image if first_memberships else None
+        return self.images_ordered().first()
+
+    def set_primary_image(self, image):
+        """Marks an image in this deck as the primary image."""
+        membership = self.deckmembership_set.get(image=image)
+        membership.deck = self
+        membership.primary = True
+        membership.save()
+        return membership
 
     def images_ordered(self):
         """
@@ -140,6 +352,27 @@ class DeckBase(PolymorphicModel):
     def memberships(self):
         return DeckMembership.objects.filter(deck=self).order_by("rank")
 
+    def images_for_display(self):
+        """
+        Returns a list of the images in order with the related objects needed to display them already fetched.
+
+        The number of queries does not depend on the number of images in the deck.
+        """
+        images = list(self.images_ordered())
+        DeckImageBase.prefetch_for_display(images)
+        return images
+
+    def contact_sheet(self, **kwargs):
+        """
+        Returns a map of the images in this deck on sprite images of their thumbnails.
+
+        Only the sheets which have changed since they were last rendered are rendered again.
+        See imagedeck.contactsheets.update_contact_sheet for the options.
+        """
+        from .contactsheets import update_contact_sheet
+
+        return update_contact_sheet(self, **kwargs)
+
     # Don't add a __len__ function. For some reason it means that objects aren't saved in the database properly.
     # def __len__(self):
     #     return self.images.count()
@@ -149,25 +382,63 @@ class DeckBase(PolymorphicModel):
 
     def max_rank(self):
         """Returns the highest rank of a membership in this deck."""
-        if self.deckmembership_set.count() == 0:
-            return 0
-        return self.deckmembership_set.aggregate(Max("rank"))["rank__max"]
+        return self.deckmembership_set.aggregate(Max("rank"))["rank__max"] or 0
+
+    def _rank_subquery(self, image):
+        return self.deckmembership_set.filter(image=image).values("rank")[:1]
 
     def images_before(self, image):
-        membership = image.deckmembership_set.filter(deck=self)
-        if not membership:
-            return None
-        return self.images.filter(deckmembership__rank__lt=membership.rank).order_by(
-            "deckmembership__rank"
-        )
+        """Returns the images which come before an image in this deck (in order)."""
+        return DeckImageBase.objects.filter(
+            deckmembership__deck=self,
+            deckmembership__rank__lt=Subquery(self._rank_subquery(image)),
+        ).order_by("deckmembership__rank")
 
     def images_after(self, image):
-        membership = image.deckmembership_set.filter(deck=self)
-        if not membership:
-            return None
-        return self.images.filter(deckmembership__rank__gt=membership.rank).order_by(
-            "deckmembership__rank"
+        """Returns the images which come after an image in this deck (in order)."""
+        return DeckImageBase.objects.filter(
+            deckmembership__deck=self,
+            deckmembership__rank__gt=Subquery(self._rank_subquery(image)),
+        ).order_by("deckmembership__rank")
+
+    def neighbours(self, image, before=1, after=1):
+        """
+        Returns a list of the images around an image in this deck (in order), including the image itself.
+
+        At most 'before' images preceding it and 'after' images following it are included.
+        The memberships are found with a keyset range on the deck and rank in a single query.
+        If the image is not in this deck then an empty list is returned.
+        """
+        rank = Subquery(self._rank_subquery(image))
+        memberships = self.deckmembership_set.all()
+        previous_ids = (
+            memberships.filter(rank__lt=rank).order_by("-rank").values("id")[:before]
+        )
+        following_ids = (
+            memberships.filter(rank__gt=rank).order_by("rank").values("id")[:after]
+        )
+        window = memberships.filter(
+            Q(image=image) | Q(id__in=previous_ids) | Q(id__in=following_ids)
         )
+        return list(
+            DeckImageBase.objects.filter(deckmembership__in=window).order_by(
+                "deckmembership__rank"
+            )
+        )
+
+    def next_image(self, image):
+        """Returns the image which follows an image in this deck or None if it is the last one."""
+        neighbours = self.neighbours(image, before=0, after=1)
+        if len(neighbours) == 2:
+            return neighbours[1]
+        return None
+
+    def previous_image(self, image):
+        """Returns the image which precedes an image in this deck or None if it is the first one."""
+        neighbours = self.neighbours(image, before=1, after=0)
+        if len(neighbours) == 2:
+            return neighbours[0]
+        return None
 
     def save_image_file(self, file, owner=None):
         folder = create_filer_folder(self.name, owner=owner)
@@ -179,26 +450,286 @@ class DeckBase(PolymorphicModel):
         return image
 
     def add_image(self, image, rank=None):
-        if rank is None:
-            rank = self.max_rank() + 1
+        """
+        Adds an image to this deck and returns the membership.
+
+        If the image is already in the deck then its membership is returned and the rank is only changed if one is given.
+        """
+        explicit_rank = rank is not None
+        if not explicit_rank:
+            rank = self.max_rank() + imagedeck_settings.IMAGEDECK_RANK_GAP
+
+        try:
+            with transaction.atomic():
+                return DeckMembership.objects.create(deck=self, image=image, rank=rank)
+        except IntegrityError:
+            membership = DeckMembership.objects.get(deck=self, image=image)
+            if explicit_rank and membership.rank != rank:
+                membership.rank = rank
+                membership.save(update_fields=["rank"])
+            return membership
+
+    def add_images(self, images, ranks=None, primary=False):
+        """
+        Appends many images to this deck in a constant number of queries.
+
+        If ranks is given, it should be an iterable the same length as images. A rank of None
+        means that the image is placed after the current end of the deck.
+        Images which are already in the deck are skipped.
+        If primary is True then the first image added is marked as the primary image of the deck.
+
+        Returns a list of the new DeckMembership objects.
+        """
+        images = list(images)
+        ranks = [None] * len(images) if ranks is None else list(ranks)
+        if len(ranks) != len(images):
+            raise ValueError("The number of ranks must match the number of images.")
+
+        with transaction.atomic():
+            existing = set(
+                self.deckmembership_set.filter(
+                    image__in=[image.pk for image in images]
+                ).values_list("image_id", flat=True)
+            )
+
+            gap = imagedeck_settings.IMAGEDECK_RANK_GAP
+            next_rank = self.max_rank() + gap
+            memberships = []
+            for image, rank in zip(images, ranks):
+                if image.pk in existing:
+                    continue
+                existing.add(image.pk)
+
+                if rank is None:
+                    rank = next_rank
+                next_rank = max(next_rank, rank + gap)
+
+                memberships.append(DeckMembership(deck=self, image=image, rank=rank))
+
+            if primary and memberships:
+                self.deckmembership_set.filter(primary=True).update(primary=False)
+                memberships[0].primary = True
+
+            memberships = DeckMembership.objects.bulk_create(memberships)
+
+            if primary and memberships:
+                self.primary_membership = memberships[0]
+                DeckBase.objects.filter(pk=self.pk).update(
+                    primary_membership=memberships[0]
+                )
+
+            return memberships
 
-        membership, _ = DeckMembership.objects.update_or_create(
-            deck=self, image=image, rank=rank
+    def split(self, width_pct: int = 50, rtl=False):
+        """
+        Creates a new Deck with each IIIF image in this deck split into two images (e.g. for open page spreads).
+
+        Images of other types can't be split by region so they are added to the new deck as they are.
+        The new images and memberships are written in bulk so this takes a constant number of queries.
+
+        Returns the new Deck.
+        """
+        images = list(self.images_ordered())
+        iiif_images = [image for image in images if isinstance(image, DeckImageIIIF)]
+        halves = iter(
+            DeckImageIIIF.split_images(iiif_images, width_pct=width_pct, rtl=rtl)
         )
+
+        new_images = []
+        for image in images:
+            if isinstance(image, DeckImageIIIF):
+                new_images += [next(halves), next(halves)]
+            else:
+                new_images.append(image)
+
+        with transaction.atomic():
+            new_deck = Deck.objects.create(
+                name=f"{self.name} split width {width_pct}",
+            )
+            new_deck.add_images(new_images)
+        return new_deck
+
+    def rebalance_ranks(self):
+        """
+        Renumbers the memberships of this deck so that the ranks are evenly spaced by IMAGEDECK_RANK_GAP.
+
+        This only needs to happen when there is no gap left between two ranks.
+        """
+        gap = imagedeck_settings.IMAGEDECK_RANK_GAP
+        memberships = list(self.memberships().only("id", "rank"))
+        for index, membership in enumerate(memberships):
+            membership.rank = (index + 1) * gap
+        DeckMembership.objects.bulk_update(memberships, ["rank"])
+
+    def _rank_between(self, lower, upper):
+        """Returns a rank strictly between two ranks (either can be None) or None if there is no gap."""
+        lower = lower or 0
+        if upper is None:
+            return lower + imagedeck_settings.IMAGEDECK_RANK_GAP
+        if upper - lower < 2:
+            return None
+        return (lower + upper) // 2
+
+    def _place_image(self, image, get_bounds):
+        """
+        Sets the rank of an image in this deck between the two ranks returned by get_bounds.
+
+        Only the membership of this image is written unless the ranks need rebalancing.
+        """
+        with transaction.atomic():
+            rank = self._rank_between(*get_bounds())
+            if rank is None:
+                self.rebalance_ranks()
+                rank = self._rank_between(*get_bounds())
+
+            membership, _ = DeckMembership.objects.update_or_create(
+                deck=self, image=image, defaults=dict(rank=rank)
+            )
         return membership
 
+    def insert_image(self, image, position):
+        """
+        Inserts an image so that it has the given (zero-based) index in this deck.
+
+        If the image is already in the deck then it is moved to that position.
+        """
+
+        def get_bounds():
+            others = self.memberships().exclude(image=image)
+            if position <= 0:
+                return None, others.values_list("rank", flat=True).first()
+
+            ranks = list(
+                others.values_list("rank", flat=True)[position - 1 : position + 1]
+            )
+            if not ranks:
+                return others.aggregate(Max("rank"))["rank__max"], None
+            return ranks[0], ranks[1] if len(ranks) > 1 else None
+
+        return self._place_image(image, get_bounds)
+
+    def move_image(self, image, before=None, after=None):
+        """
+        Moves an image so that it comes directly before or after another image in this deck.
+
+        Exactly one of 'before' or 'after' must be given.
+        """
+        if (before is None) == (after is None):
+            raise ValueError("Exactly one of 'before' or 'after' must be given.")
+
+        def get_bounds():
+            others = self.memberships().exclude(image=image)
+            if after is not None:
+                lower = others.get(image=after).rank
+                upper = (
+                    others.filter(rank__gt=lower).values_list("rank", flat=True).first()
+                )
+            else:
+                upper = others.get(image=before).rank
+                lower = (
+                    others.filter(rank__lt=upper)
+                    .order_by("-rank")
+                    .values_list("rank", flat=True)
+                    .first()
+                )
+            return lower, upper
+
+        return self._place_image(image, get_bounds)
+
     def import_file(self, filename, folder, owner, rank_regex):
         # Create image
         file = import_file(filename, folder, owner=owner)
         if type(file) == FilerImage:
-            # Get rank
-            integer_matches = re.findall(rank_regex, str(filename))
-            rank = int(integer_matches[-1]) if integer_matches else None
-
             # Add to deck
-            self.add_image(file.deckimagefiler, rank=rank)
+            self.add_image(
+                file.deckimagefiler, rank=rank_from_filename(filename, rank_regex)
+            )
         return file
 
+    def import_files(
+        self, filenames, folder, owner, rank_regex, workers=1, batch_size=100
+    ):
+        """
+        Imports files into Django Filer and appends the images to this deck in bulk.
+
+        The files are hashed and read for their format and dimensions in a pool of 'workers' processes.
+        The rows for each batch of files are written in a single transaction in this process.
+        Images which are already in the folder (with the same SHA1) are added to the deck without being imported again.
+
+        Returns a list of the DeckImageFiler objects for the images.
+        """
+        owner = check_owner(owner)
+        executor = None
+        if workers > 1:
+            # Spawn the workers so that they don't inherit this process's database connections
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            details = executor.map(sniff_file, filenames, chunksize=16)
+        else:
+            details = map(sniff_file, filenames)
+
+        images = []
+        try:
+            for batch in chunked(details, batch_size):
+                images += self.import_sniffed_files(batch, folder, owner, rank_regex)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        return images
+
+    def import_sniffed_files(self, details, folder, owner, rank_regex):
+        """
+        Imports a batch of files which have been read by imagedeck.workers.sniff_file in one transaction.
+
+        The hashes, dimensions and EXIF dates are given to Django Filer so that it doesn't read the files again.
+        Returns a list of the DeckImageFiler objects for the images.
+        """
+        with transaction.atomic():
+            existing = {
+                filer_image.sha1: filer_image
+                for filer_image in FilerImage.objects.filter(
+                    folder=folder,
+                    sha1__in=[item["sha1"] for item in details if not item["error"]],
+                ).select_related("deckimagefiler")
+            }
+
+            images = []
+            ranks = []
+            created = []
+            for item in details:
+                if item["error"]:
+                    print(f"Cannot read {item['path']}: {item['error']}")
+                    continue
+
+                is_image = item["is_image"] and FilerImage.matches_file_type(
+                    item["name"], None, item["mime_type"]
+                )
+                if is_image and item["sha1"] in existing:
+                    filer_image = existing[item["sha1"]]
+                    try:
+                        image = filer_image.deckimagefiler
+                    except DeckImageFiler.DoesNotExist:
+                        image = DeckImageFiler(filer_image=filer_image)
+                        image.set_size(*image.fetch_dimensions())
+                        created.append(image)
+                else:
+                    print(f"Adding {item['path']}")
+                    file = import_sniffed_file(item, folder, owner, is_image)
+                    if not is_image:
+                        continue
+                    existing[item["sha1"]] = file
+                    image = DeckImageFiler(filer_image=file)
+                    image.set_size(*image.fetch_dimensions())
+                    created.append(image)
+
+                images.append(image)
+                ranks.append(rank_from_filename(item["path"], rank_regex))
+
+            bulk_create_images(created)
+            self.add_images(images, ranks=ranks)
+        return images
+
     @classmethod
     def combine(cls, new_deck, decks_to_combine):
         images = []
@@ -210,16 +741,26 @@ class DeckBase(PolymorphicModel):
         if type(new_deck) == str:
             new_deck, _ = Deck.objects.update_or_create(name=new_deck)
 
-        for image in images:
-            new_deck.add_image(image)
+        new_deck.add_images(images)
 
         return new_deck
 
     @classmethod
     def import_glob(
-        cls, destination, pattern, deck_name="", owner=None, rank_regex="(\d+)"
+        cls,
+        destination,
+        pattern,
+        deck_name="",
+        owner=None,
+        rank_regex="(\d+)",
+        workers=1,
+        batch_size=100,
     ):
-        """Import files using a glob pattern."""
+        """
+        Import files using a glob pattern.
+
+        See import_files for 'workers' and 'batch_size'.
+        """
         folder = create_filer_folder(destination, owner=owner)
 
         if not deck_name:
@@ -228,9 +769,14 @@ class DeckBase(PolymorphicModel):
         deck, _ = Deck.objects.update_or_create(name=deck_name)
         deck.save()
 
-        for filename in glob.glob(pattern):
-            print(f"Adding {filename}")
-            deck.import_file(filename, folder, owner, rank_regex)
+        deck.import_files(
+            glob.glob(pattern),
+            folder,
+            owner,
+            rank_regex,
+            workers=workers,
+            batch_size=batch_size,
+        )
 
         return deck
 
@@ -245,8 +791,14 @@ class Deck(DeckBase):
         deck_name="",
         owner=None,
         rank_regex="(\d+)",
+        workers=1,
+        batch_size=100,
     ):
-        """Import files using a regex pattern."""
+        """
+        Import files using a regex pattern.
+
+        See import_files for 'workers' and 'batch_size'.
+        """
         folder = create_filer_folder(destination, owner=owner)
 
         if not deck_name:
@@ -258,11 +810,19 @@ class Deck(DeckBase):
         if type(source_dir) == str:
             source_dir = Path(source_dir)
 
-        for filename in os.listdir(source_dir):
-            if re.match(pattern, filename):
-                print(f"Adding {filename}")
-
-                deck.import_file(source_dir / filename, folder, owner, rank_regex)
+        filenames = [
+            source_dir / filename
+            for filename in os.listdir(source_dir)
+            if re.match(pattern, filename)
+        ]
+        deck.import_files(
+            filenames,
+            folder,
+            owner,
+            rank_regex,
+            workers=workers,
+            batch_size=batch_size,
+        )
 
         return deck
 
@@ -271,53 +831,43 @@ class DeckGallica(DeckBase):
     base_url = models.URLField(max_length=511)
 
 
-def images_in_iiif_json_element(element, result, prefix=""):
-    """Recursively checks a JSON element from a IIIF Manifest for an image."""
-    if type(element) == dict:
-        if (
-            "@type" in element
-            and element["@type"] == "dctypes:Image"
-            and "service" in element
-            and "@id" in element["service"]
-        ):
-            result.append(element["service"]["@id"])
-
-        for child in element:
-            images_in_iiif_json_element(element[child], result, prefix=f"\t{prefix}")
-
-    elif type(element) == list:
-        for child in element:
-            images_in_iiif_json_element(child, result, prefix=f"\t{prefix}")
+class DeckIIIF(DeckBase):
+    manifest_url = models.URLField(max_length=511)
 
+    def get_manifest_text(self, refresh=False):
+        """
+        Returns the text of the manifest.
 
-def images_in_iiif_json(data):
-    """Returns a list of all the images in a IIIF presentation."""
-    result = []
-    images_in_iiif_json_element(data, result)
-    return result
+        It is downloaded once and then revalidated when it is older than IMAGEDECK_MANIFEST_TTL seconds.
+        """
+        from .documents import fetch_document
 
+        return fetch_document(self.manifest_url, refresh=refresh).body
 
-class DeckIIIF(DeckBase):
-    manifest_url = models.URLField(max_length=511)
+    def get_manifest_json(self, refresh=False):
+        """
+        Returns the parsed manifest.
 
-    def get_manifest_text(self):
-        f = requests.get(self.manifest_url)
-        return f.text
+        The result is shared between calls in the same process until the manifest changes so it should not be modified.
+        """
+        from .documents import fetch_json
 
-    def get_manifest_json(self):
-        f = requests.get(self.manifest_url)
-        return f.json()
+        return fetch_json(self.manifest_url, refresh=refresh)
 
     def image_base_urls(self):
         return images_in_iiif_json(self.get_manifest_json())
 
     def images_from_manifest(self):
-        urls = self.image_base_urls()
+        """
+        Adds the images in the manifest to this deck.
 
-        for url in urls:
-            image, _ = DeckImageIIIF.objects.update_or_create(base_url=url)
-            if self.images.filter(id=image.id).count() == 0:
-                self.add_image(image)
+        The dimensions and labels in the manifest are stored with the images so they don't need to fetch their info.json.
+        The images are created or updated in bulk so this takes a small number of queries regardless of the size of the manifest.
+        """
+        # Parse the text incrementally so that the whole manifest isn't loaded as objects at once
+        records = iiif_image_records(self.get_manifest_text())
+        images = DeckImageIIIF.upsert_records(records)
+        self.add_images(images)
 
     # Override save to get the images from the manifest if there aren't already images there
     def save(self, *args, **kwargs):
@@ -326,16 +876,6 @@ class DeckIIIF(DeckBase):
         if self.images.count() == 0 and self.manifest_url:
             self.images_from_manifest()
 
-    def split(self, width_pct: int = 50, rtl=False):
-        new_deck = Deck.objects.create(
-            name=f"{self.name} split width {width_pct}",
-        )
-        for image in self.images_ordered():
-            new_images = image.split(width_pct=width_pct, rtl=rtl)
-            for new_image in new_images:
-                new_deck.add_image(new_image)
-        return new_deck
-
 
 class DeckImageBase(PolymorphicModel):
     licence = models.ForeignKey(
@@ -352,19 +892,95 @@ class DeckImageBase(PolymorphicModel):
         default="",
         blank=True,
     )
+    label = models.CharField(
+        max_length=255,
+        default="",
+        blank=True,
+        help_text="A label for this image (e.g. the label of its canvas in a IIIF manifest).",
+    )
+    modified = models.DateTimeField(
+        auto_now=True, help_text="When this image was last changed."
+    )
+    width = models.PositiveIntegerField(
+        default=0, blank=True, help_text="The width of the full image in pixels."
+    )
+    height = models.PositiveIntegerField(
+        default=0, blank=True, help_text="The height of the full image in pixels."
+    )
+    aspect_ratio = models.FloatField(
+        default=None,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="The width of the image divided by its height.",
+    )
+
+    # The related objects (other than the licence) to prefetch when displaying images of this type.
+    display_prefetch = ()
 
     # TODO add permissions
     # https://django-guardian.readthedocs.io/en/stable/userguide/assign.html ?
 
-    def url(self, width=None, height=None):
+    @classmethod
+    def prefetch_for_display(cls, images):
+        """
+        Prefetches the related objects of a list of images needed for thumbnails, captions and dimensions.
+
+        Each type of image is prefetched according to its 'display_prefetch' attribute so this costs a fixed number of queries per type.
+        """
+        prefetch_related_objects(images, "licence")
+
+        images_per_type = {}
+        for image in images:
+            images_per_type.setdefault(type(image), []).append(image)
+
+        for image_type, images_of_type in images_per_type.items():
+            prefetch_related_objects(images_of_type, *image_type.display_prefetch)
+
+    def url(self, width=None, height=None, format=None):
         """
         Returns a URL to a version of this image.
 
         If width and height are null then it returns the fullsized image.
+        The format (e.g. 'webp') is a preference which is ignored by image types which only have one format.
         """
         return None
 
+    def save(self, *args, **kwargs):
+        self.set_size(self.width, self.height)
+        super().save(*args, **kwargs)
+
+    def set_size(self, width, height):
+        """Sets the width, height and aspect ratio of this image without saving it."""
+        self.width = width or 0
+        self.height = height or 0
+        self.aspect_ratio = (
+            self.width / self.height if self.width and self.height else None
+        )
+
+    def fetch_dimensions(self, session=None, timeout=None):
+        """
+        Reads the width and height of the full image from its source.
+
+        Returns a tuple of the width and height or None if they cannot be found.
+        This can involve reading the file or making a network request so it should only be done at ingest or in a backfill.
+        Network requests are made with the requests session (if given) and the timeout (or IMAGEDECK_REQUEST_TIMEOUT).
+        """
+        return None
+
+    def set_dimensions(self):
+        """Fetches the dimensions of this image from its source and saves them."""
+        dimensions = self.fetch_dimensions()
+        if dimensions:
+            self.set_size(*dimensions)
+            self.save()
+
     def thumbnail_dimensions(self):
+        """
+        Returns the width and height of the thumbnail of this image.
+
+        This is calculated from the stored aspect ratio so it doesn't read the image or make any network requests.
+        """
         width = imagedeck_settings.IMAGEDECK_THUMBNAIL_WIDTH
         height = imagedeck_settings.IMAGEDECK_THUMBNAIL_HEIGHT
 
@@ -372,27 +988,91 @@ class DeckImageBase(PolymorphicModel):
             width = 250
 
         # Try to keep aspect ratio
+        aspect_ratio = self.aspect_ratio or (
+            imagedeck_settings.IMAGEDECK_DEFAULT_WIDTH
+            / imagedeck_settings.IMAGEDECK_DEFAULT_HEIGHT
+        )
         if not height:
-            height = width / self.get_width() * self.get_height()
+            height = width / aspect_ratio
 
         if not width:
-            width = height / self.get_height() * self.get_width()
+            width = height * aspect_ratio
 
         return width, height
 
-    def thumbnail(self):
+    def thumbnail(self, format=None):
         """Returns a URL to a thumbnail of this image."""
         width, height = self.thumbnail_dimensions()
-        return self.url(width=width, height=height)
+        return self.url(width=width, height=height, format=format)
+
+    def srcset(self, widths, format=None):
+        """Returns a value for the 'srcset' attribute of an img element with versions of this image at each width."""
+        return ", ".join(
+            f"{self.url(width=width, format=format)} {width}w" for width in widths
+        )
+
+    def get_pil_image(self, width=None, height=None):
+        """
+        Returns this image as a PIL Image which is at least as large as the given dimensions (where possible).
+
+        Returns None if the image cannot be read.
+        """
+        return image_from_url(self.url(width=width, height=height))
+
+    def generate_renditions(self, widths):
+        """
+        Generates the thumbnail and the renditions at each width which don't exist yet.
+
+        Returns the number of renditions which were generated. Images which are served by another server have none.
+        """
+        return 0
+
+    def tile_source(self):
+        """
+        Returns the Django file of the source of this image for the IIIF Image API endpoint (see imagedeck.tiles).
+
+        Returns None if this image isn't stored locally.
+        """
+        return None
+
+    def tile_version(self):
+        """Returns a string which changes when the source of this image changes so that its tiles are made again."""
+        return ""
+
+    def tile_storage(self):
+        """Returns the storage for the tiles of this image (see imagedeck.tiles)."""
+        return default_storage
+
+    def is_public(self):
+        """Returns whether anyone can view this image. Responses for images which aren't public are never cached publicly."""
+        return True
+
+    def has_read_permission(self, request):
+        """Returns whether the user of a request can view this image through the views of this app."""
+        return self.is_public()
+
+    def iiif_service_url(self, version=3):
+        """Returns the URL of the IIIF image service of this image or None if it doesn't have one."""
+        if not self.pk or not self.tile_source():
+            return None
+        return reverse("imagedeck:iiif-base", kwargs=dict(version=version, pk=self.pk))
+
+    def generate_tiles(self, force=False):
+        """Generates the tiles for deep zoom viewers through the IIIF Image API endpoint ahead of time."""
+        from .tiles import generate_tiles
+
+        return generate_tiles(self, force=force)
 
     def get_width(self):
-        return imagedeck_settings.IMAGEDECK_DEFAULT_WIDTH
+        return self.width or imagedeck_settings.IMAGEDECK_DEFAULT_WIDTH
 
     def get_height(self):
-        return imagedeck_settings.IMAGEDECK_DEFAULT_HEIGHT
+        return self.height or imagedeck_settings.IMAGEDECK_DEFAULT_HEIGHT
 
     def get_caption(self):
         components = []
+        if self.label:
+            components.append(f"{self.label}.")
         if self.attribution:
             components.append(f"Attribution: {self.attribution}")
         if self.source_url:
@@ -402,36 +1082,110 @@ class DeckImageBase(PolymorphicModel):
         return " ".join(components)
 
 
-class DeckImage(DeckImageBase):
-    image = models.ImageField()
-    thumbnail_generator = ImageSpecField(
+def thumbnail_spec(format, cachefile_strategy="imagedeck.cachefiles.NonBlocking"):
+    return ImageSpecField(
         source="image",
         processors=[
-            Thumbnail(
+            DraftThumbnail(
                 imagedeck_settings.IMAGEDECK_THUMBNAIL_WIDTH,
                 imagedeck_settings.IMAGEDECK_THUMBNAIL_HEIGHT,
             )
         ],
-        format=imagedeck_settings.IMAGEDECK_THUMBNAIL_FORMAT,
+        format=format,
         options={"quality": imagedeck_settings.IMAGEDECK_THUMBNAIL_QUALITY},
+        cachefile_strategy=cachefile_strategy,
     )
 
+
+class DeckImage(DeckImageBase):
+    image = models.ImageField()
+    thumbnail_generator = thumbnail_spec(imagedeck_settings.IMAGEDECK_THUMBNAIL_FORMAT)
+
     def __str__(self):
         return self.image.name
 
-    def url(self, width=None, height=None):
-        return self.image.url
+    def save(self, *args, **kwargs):
+        # The dimensions are read from the file when a new one is saved rather than whenever an image is loaded
+        if self.image and (
+            not self.image._committed or not (self.width and self.height)
+        ):
+            self.set_size(*self.fetch_dimensions())
+        super().save(*args, **kwargs)
 
-    def thumbnail(self):
+    def url(self, width=None, height=None, format=None):
         return self.image.url
-        # See issue https://github.com/matthewwithanm/django-imagekit/issues/391#issuecomment-275367006
-        return self.thumbnail_generator.url
 
-    def get_width(self):
-        return self.image.width
+    def srcset(self, widths, format=None):
+        # The original is used at every width so it is only listed once at its own width
+        if self.width:
+            return f"{self.url()} {self.width}w"
+        return self.url()
 
-    def get_height(self):
-        return self.image.height
+    def generate_renditions(self, widths):
+        # The original is used at every width so only the thumbnail is generated
+        if not self.image:
+            return 0
+        thumbnail = self.get_thumbnail_generator()
+        if cachefile_exists(thumbnail):
+            return 0
+        thumbnail.generate()
+        return 1
+
+    def tile_source(self):
+        return self.image or None
+
+    def tile_version(self):
+        return f"{self.image.name}:{self.width}x{self.height}"
+
+    def get_thumbnail_generator(self, format=None):
+        """
+        Returns the imagekit spec for the thumbnail in the format (or the default thumbnail format).
+
+        There is a spec for each format of IMAGEDECK_RENDITION_FORMATS which Pillow can write.
+        """
+        return getattr(self, f"thumbnail_{format}", None) or self.thumbnail_generator
+
+    def thumbnail(self, format=None):
+        """
+        Returns the URL of the cached thumbnail of this image.
+
+        If the thumbnail doesn't exist yet, then it is generated by the imagekit cache file backend.
+        With an asynchronous backend, the generation is queued and a placeholder is returned in the meantime.
+        Without one, it is generated in the request (see imagedeck.checks).
+        """
+        if not self.image:
+            return thumbnail_placeholder()
+
+        thumbnail = self.get_thumbnail_generator(format)
+        if cachefile_exists(thumbnail):
+            return thumbnail.url
+
+        thumbnail.generate()
+        if is_async(thumbnail.cachefile_backend):
+            return thumbnail_placeholder()
+
+        return thumbnail.url
+
+    def fetch_dimensions(self, session=None, timeout=None):
+        if self.image:
+            return self.image.width, self.image.height
+        return None
+
+    def get_pil_image(self, width=None, height=None):
+        if not self.image:
+            return None
+        return open_reduced(self.image, (self.width, self.height), (width, height))
+
+
+# Thumbnails in the other rendition formats are generated the first time they are requested rather than on save
+for format in available_formats():
+    DeckImage.add_to_class(
+        f"thumbnail_{format}",
+        thumbnail_spec(
+            "JPEG" if format == "jpg" else format.upper(),
+            "imagedeck.cachefiles.OnDemand",
+        ),
+    )
 
 
 class DeckImageFiler(DeckImageBase):
@@ -439,90 +1193,267 @@ class DeckImageFiler(DeckImageBase):
         FilerImage, on_delete=models.CASCADE, related_name="deckimagefiler"
     )
 
+    display_prefetch = (
+        "filer_image",
+        "filer_image__owner",
+        Prefetch("renditions", to_attr="display_renditions"),
+    )
+
     def __str__(self):
         return str(self.filer_image)
 
-    def get_width(self):
-        return self.filer_image.width
+    def save(self, *args, **kwargs):
+        # Keep the dimensions in sync with the Filer image
+        self.set_size(*self.fetch_dimensions())
+        super().save(*args, **kwargs)
 
-    def get_height(self):
-        return self.filer_image.height
+    def fetch_dimensions(self, session=None, timeout=None):
+        return self.filer_image.width, self.filer_image.height
+
+    def get_pil_image(self, width=None, height=None):
+        return open_reduced(
+            self.filer_image.file, (self.width, self.height), (width, height)
+        )
+
+    def tile_source(self):
+        return self.filer_image.file
+
+    def tile_version(self):
+        return self.filer_image.sha1 or self.filer_image.file.name
 
-    def thumbnail(self):
+    def tile_storage(self):
+        # The tiles of private files are kept with them in Filer's private storage
+        if self.filer_image.is_public:
+            return super().tile_storage()
+        return self.filer_image.file.storages["private"]
+
+    def is_public(self):
+        return self.filer_image.is_public
+
+    def has_read_permission(self, request):
+        return self.filer_image.is_public or self.filer_image.has_read_permission(
+            request
+        )
+
+    def thumbnail(self, format=None):
         width, height = self.thumbnail_dimensions()
 
-        return self.url(width=width, height=height)
+        return self.url(width=width, height=height, format=format)
 
-    def url(self, width=None, height=None):
+    def url(self, width=None, height=None, format=None):
         if width == None and height == None:
             return self.filer_image.url
 
-        if height == None:
-            height = 0
+        return self.get_rendition(width=width, height=height, format=format).url
+
+    def rendition_key(self, width, height, format=None):
+        """Returns the fields which identify a rendition of the current version of this image."""
+        return dict(
+            image=self,
+            width=int(float(width or 0)),
+            height=int(float(height or 0)),
+            crop=True,
+            subject_location=self.filer_image.subject_location or "",
+            format=format or "",
+            source=self.filer_image.sha1,
+        )
 
-        if width == None:
-            width = 0
+    def get_thumbnailer(self, format=None, source_generators=None):
+        """
+        Returns the easy-thumbnails thumbnailer of the Filer image.
 
-        thumbnail_name = f"{width}x{height}"
-        required_thumbnails = {
-            thumbnail_name: {
+        Thumbnails are saved in the format (e.g. 'webp') or in easy-thumbnails' default format if it is empty.
+        """
+        thumbnailer = self.filer_image.file
+        thumbnailer.source_generators = source_generators
+        if format:
+            thumbnailer.thumbnail_extension = format
+            thumbnailer.thumbnail_transparency_extension = format
+            thumbnailer.thumbnail_preserve_extensions = False
+        else:
+            thumbnailer.thumbnail_extension = thumbnail_settings.THUMBNAIL_EXTENSION
+            thumbnailer.thumbnail_transparency_extension = (
+                thumbnail_settings.THUMBNAIL_TRANSPARENCY_EXTENSION
+            )
+            thumbnailer.thumbnail_preserve_extensions = (
+                thumbnail_settings.THUMBNAIL_PRESERVE_EXTENSIONS
+            )
+        return thumbnailer
+
+    def prefetched_renditions(self):
+        """Returns the list of renditions of this image if they were prefetched (see 'display_prefetch') or None."""
+        return getattr(self, "display_renditions", None)
+
+    def find_renditions(self, **key):
+        """Returns the renditions which match the key, using the prefetched renditions if there are any."""
+        prefetched = self.prefetched_renditions()
+        if prefetched is None:
+            return list(DeckRendition.objects.filter(**key))
+
+        lookups = {field: value for field, value in key.items() if field != "image"}
+        widths = lookups.pop("width__in", None)
+        return [
+            rendition
+            for rendition in prefetched
+            if (widths is None or rendition.width in widths)
+            and all(
+                getattr(rendition, field) == value for field, value in lookups.items()
+            )
+        ]
+
+    def register_rendition(self, key, thumbnail):
+        rendition, _ = DeckRendition.objects.get_or_create(
+            **key,
+            defaults=dict(
+                url=thumbnail.url,
+                rendition_width=thumbnail.width,
+                rendition_height=thumbnail.height,
+            ),
+        )
+        prefetched = self.prefetched_renditions()
+        if prefetched is not None:
+            prefetched.append(rendition)
+        return rendition
+
+    def get_rendition(self, width=None, height=None, format=None):
+        """
+        Returns the DeckRendition for a thumbnail of this image with the given dimensions.
+
+        The thumbnail is generated with easy-thumbnails and recorded in the rendition registry the first time it is requested.
+        After that, it is returned from the registry without checking the storage.
+        """
+        key = self.rendition_key(width, height, format)
+        renditions = self.find_renditions(**key)
+        if renditions:
+            return renditions[0]
+
+        # Decode the source at a reduced scale if it is much larger than the thumbnail
+        width, height = key["width"], key["height"]
+        factor = reduction_factor(
+            (self.filer_image.width, self.filer_image.height), (width, height)
+        )
+        thumbnailer = self.get_thumbnailer(
+            format, [draft_pil_image] if factor > 1 else None
+        )
+        thumbnail = thumbnailer.get_thumbnail(
+            {
                 "size": (width, height),
                 "crop": True,
                 "upscale": True,
-                "subject_location": self.filer_image.subject_location,
+                "subject_location": scale_subject_location(
+                    self.filer_image.subject_location, factor
+                ),
+                "reduce": factor,
             }
+        )
+        return self.register_rendition(key, thumbnail)
+
+    def get_renditions(self, widths, format=None):
+        """
+        Returns a dictionary of the renditions of this image at each width (with the height unconstrained).
+
+        Renditions which are not in the registry are made from a single decode of the source.
+        The widths are generated from largest to smallest with each one resized from the one before.
+        """
+        keys = {
+            int(float(width)): self.rendition_key(width, 0, format) for width in widths
         }
-        thumbnails = self.filer_image._generate_thumbnails(required_thumbnails)
+        common_key = {
+            field: value
+            for field, value in self.rendition_key(0, 0, format).items()
+            if field != "width"
+        }
+        renditions = {
+            rendition.width: rendition
+            for rendition in self.find_renditions(width__in=keys.keys(), **common_key)
+        }
+        missing = sorted(set(keys) - set(renditions), reverse=True)
+        if not missing:
+            return renditions
+
+        level = self.get_pil_image(width=missing[0])
 
-        return thumbnails[thumbnail_name]
+        def current_level(source, **options):
+            return level
+
+        thumbnailer = self.get_thumbnailer(format, [current_level])
+        for width in missing:
+            height = max(round(width * level.height / level.width), 1)
+            if width < level.width:
+                level = level.resize((width, height), Image.LANCZOS)
+
+            thumbnail = thumbnailer.get_thumbnail(
+                {"size": (width, 0), "crop": True, "upscale": True}
+            )
+            renditions[width] = self.register_rendition(keys[width], thumbnail)
+
+        return renditions
+
+    def generate_renditions(self, widths):
+        before = self.renditions.count()
+        self.thumbnail()
+        self.get_renditions(widths)
+        return self.renditions.count() - before
+
+    def srcset(self, widths, format=None):
+        renditions = self.get_renditions(widths, format)
+        return ", ".join(
+            f"{renditions[int(float(width))].url} {int(float(width))}w"
+            for width in widths
+        )
 
 
 @receiver(post_save, sender=FilerImage)
 def create_or_update_filer_image(sender, instance, created, **kwargs):
+    if getattr(instance, "_imagedeck_bulk_import", False):
+        # The DeckImageFiler is created in bulk by DeckBase.import_sniffed_files
+        return
     if created:
         DeckImageFiler.objects.create(filer_image=instance)
+    else:
+        # Remove renditions made from a previous version of the file or subject location
+        DeckRendition.objects.filter(image=instance.deckimagefiler).exclude(
+            source=instance.sha1, subject_location=instance.subject_location or ""
+        ).delete()
+        if not instance.is_public:
+            # Remove any public tiles which were made before the file was made private
+            from .tiles import delete_tiles
+
+            delete_tiles(instance.deckimagefiler, default_storage)
     instance.deckimagefiler.save()
 
 
 class DeckImageExternal(DeckImageBase):
     external_url = models.URLField(max_length=511)
-    width = models.PositiveIntegerField(default=0, blank=True)
-    height = models.PositiveIntegerField(default=0, blank=True)
 
     def __str__(self):
         return self.external_url
 
-    def url(self, width=None, height=None):
+    def url(self, width=None, height=None, format=None):
         return self.external_url
 
-    def get_width(self):
+    def srcset(self, widths, format=None):
+        # There is only one version of an external image
         if self.width:
-            return self.width
-        self.set_dimensions()
-        if self.width:
-            return self.width
-        return imagedeck_settings.IMAGEDECK_DEFAULT_WIDTH
+            return f"{self.external_url} {self.width}w"
+        return self.external_url
+
+    def get_width(self):
+        if not self.width:
+            self.set_dimensions()
+        return super().get_width()
 
     def get_height(self):
-        if self.height:
-            return self.height
-        self.set_dimensions()
-        if self.height:
-            return self.height
-        return imagedeck_settings.IMAGEDECK_DEFAULT_HEIGHT
+        if not self.height:
+            self.set_dimensions()
+        return super().get_height()
 
-    def set_dimensions(self):
-        img = image_from_url(self.url())
-        if img:
-            self.width = img.width
-            self.height = img.height
-            self.save()
+    def fetch_dimensions(self, session=None, timeout=None):
+        return probe_dimensions(self.url(), session=session, timeout=timeout)
 
 
 class DeckImageIIIF(DeckImageBase):
     base_url = models.URLField(max_length=511)
-    width = models.PositiveIntegerField(default=0, blank=True)
-    height = models.PositiveIntegerField(default=0, blank=True)
     region = models.CharField(
         max_length=255,
         default="full",
@@ -538,82 +1469,391 @@ class DeckImageIIIF(DeckImageBase):
         region = region or self.region
         return f"{self.base_url}/{region}/{size}/{rotation}/{quality}.{format}"
 
-    def url(self, width=None, height=None):
+    def iiif_size(self, width=None, height=None):
         if width is None and height is None:
-            size = "full"
-        else:
-            if width is None:
-                width = ""
-            if height is None:
-                height = ""
-            size = f"{width},{height}"
+            return "full"
 
-        return self.iiif_url(size=size)
+        width = self.snap_width(width) if height is None else width
+        if width is None:
+            width = ""
+        if height is None:
+            height = ""
+        return f"{width},{height}"
 
-    def get_width(self):
-        if self.width:
-            return self.width
-        self.set_dimensions()
-        if self.width:
-            return self.width
-        return imagedeck_settings.IMAGEDECK_DEFAULT_WIDTH
+    def remote_url(self, width=None, height=None):
+        """Returns the URL of this image on the IIIF image server."""
+        return self.iiif_url(size=self.iiif_size(width, height))
 
-    def get_height(self):
-        if self.height:
-            return self.height
-        return imagedeck_settings.IMAGEDECK_DEFAULT_HEIGHT
+    def proxy_url(self, width=None, height=None):
+        """Returns the URL of this image through the local caching proxy (see imagedeck.proxy)."""
+        return reverse(
+            "imagedeck:iiif-proxy",
+            kwargs=dict(
+                pk=self.pk,
+                region=self.region,
+                size=self.iiif_size(width, height),
+                rotation="0",
+                quality="default",
+                format="jpg",
+            ),
+        )
+
+    def is_proxy_size(self, size):
+        """
+        Returns True if a IIIF size is one that proxy_url() generates for this image.
+
+        These are 'full' or a width and/or height in pixels of at most IMAGEDECK_IIIF_PROXY_MAX_SIZE,
+        with widths snapped to the sizes that the server has precomputed.
+        The proxy only serves these sizes so that it can't be used to fill its cache with arbitrary requests.
+        """
+        if size == "full":
+            return True
+
+        width, comma, height = size.partition(",")
+        try:
+            width = int(width) if width else None
+            height = int(height) if height else None
+        except ValueError:
+            return False
+        if not comma or (width is None and height is None):
+            return False
+        for value in (width, height):
+            if value is not None and not (
+                0 < value <= imagedeck_settings.IMAGEDECK_IIIF_PROXY_MAX_SIZE
+            ):
+                return False
+        return size == self.iiif_size(width, height)
+
+    def url(self, width=None, height=None, format=None):
+        """
+        Returns the URL of this image for browsers.
+
+        If IMAGEDECK_IIIF_PROXY is True then this is the URL through the local caching proxy,
+        unless the proxy doesn't serve the size (see is_proxy_size).
+        """
+        if (
+            imagedeck_settings.IMAGEDECK_IIIF_PROXY
+            and self.pk
+            and self.is_proxy_size(self.iiif_size(width, height))
+        ):
+            return self.proxy_url(width, height)
+        return self.remote_url(width, height)
+
+    def get_pil_image(self, width=None, height=None):
+        return image_from_url(self.remote_url(width=width, height=height))
+
+    def srcset(self, widths, format=None):
+        # Widths which snap to the same precomputed size only need to be listed once
+        candidates = {}
+        for width in widths:
+            snapped = int(float(self.snap_width(width)))
+            candidates.setdefault(snapped, self.url(width=snapped, format=format))
+        return ", ".join(f"{url} {width}w" for width, url in candidates.items())
+
+    def get_width(self):
+        if not self.width:
+            self.set_dimensions()
+        return super().get_width()
 
     def info_json_url(self):
         return f"{self.base_url}/info.json"
 
-    def get_info_json(self):
-        f = requests.get(self.info_json_url())
-        return f.json()
+    def iiif_service_url(self, version=3):
+        return self.base_url
 
-    def set_dimensions(self):
-        info_json = self.get_info_json()
-        save = False
-        if "width" in info_json:
-            self.width = info_json["width"]
-            save = True
-        if "height" in info_json:
-            self.height = info_json["height"]
-            save = True
-        if save:
-            self.save()
+    def get_info_json(self, session=None, timeout=None):
+        """
+        Returns the image information (info.json) of the image service.
+
+        This is shared by all the images with the same service through the Django cache.
+        """
+        from .documents import fetch_info_json
+
+        return fetch_info_json(self.info_json_url(), session=session, timeout=timeout)
+
+    def get_info(self, session=None, timeout=None):
+        """Returns the image information as an IIIFImageInfo object with the sizes and tiles that the server offers."""
+        return IIIFImageInfo(self.get_info_json(session=session, timeout=timeout))
+
+    def snap_width(self, width):
+        """
+        Returns the width of the smallest size the server has precomputed which is at least the requested width.
+
+        This only uses image information that is already cached so it never makes a request.
+        The width is returned unchanged if the information isn't cached or if this image is a region of the full image.
+        """
+        if width is None or self.region != "full":
+            return width
+
+        from .documents import cached_info_json
+
+        info_json = cached_info_json(self.info_json_url())
+        if not info_json:
+            return width
+        return IIIFImageInfo(info_json).snap_width(width)
+
+    def region_dimensions(self, width, height):
+        """
+        Returns the width and height of the region of this image in a full image of the given size.
+
+        Regions which can't be parsed are treated as the full image.
+        """
+        region = self.region or "full"
+        if region == "square":
+            return min(width, height), min(width, height)
+
+        percent = region.startswith("pct:")
+        try:
+            x, y, w, h = (
+                float(value) for value in region[4 if percent else 0 :].split(",")
+            )
+        except ValueError:
+            return width, height
+
+        if percent:
+            x, w = x * width / 100, w * width / 100
+            y, h = y * height / 100, h * height / 100
+
+        # Regions which extend past the edges of the image are cropped to it
+        return (
+            max(round(min(x + w, width) - max(x, 0)), 0),
+            max(round(min(y + h, height) - max(y, 0)), 0),
+        )
+
+    def fetch_dimensions(self, session=None, timeout=None):
+        info_json = self.get_info_json(session=session, timeout=timeout)
+        if "width" in info_json and "height" in info_json:
+            return self.region_dimensions(info_json["width"], info_json["height"])
+        if "width" in info_json or "height" in info_json:
+            return (
+                info_json.get("width", self.width),
+                info_json.get("height", self.height),
+            )
+        return None
 
     def thumbnail_dimensions(self):
         width = imagedeck_settings.IMAGEDECK_THUMBNAIL_WIDTH or 250
         return width, None
 
-    def split(self, width_pct: int = 50, rtl=False):
+    @classmethod
+    def upsert_records(cls, records):
         """
-        Creates two new IIIF images.
-
-        Useful for imgaes of an open page spread that needs to be divided.
+        Returns a list of the full images for IIIFImageRecord objects, creating the ones which don't exist yet.
 
-        Returns a list of two DeckImageIIIF objects.
+        Existing images have their dimensions and label updated from the records.
+        All the images are read, updated and created in bulk.
         """
+        # Only use the first record for each image service
+        unique = {}
+        for record in records:
+            unique.setdefault(record.service_id, record)
+        records = list(unique.values())
+
+        existing = {}
+        for chunk in chunked(unique.keys(), 500):
+            images_in_chunk = cls.objects.filter(base_url__in=chunk, region="full")
+            for image in images_in_chunk.order_by("-pk"):
+                existing[image.base_url] = image
+
+        images = []
+        updated = []
+        created = []
+        for record in records:
+            image = existing.get(record.service_id)
+            if not image:
+                image = cls(base_url=record.service_id, region="full")
+                created.append(image)
+
+            changed = False
+            dimensions = (record.width, record.height)
+            if all(dimensions) and dimensions != (image.width, image.height):
+                image.set_size(*dimensions)
+                changed = True
+            label = record.label[:255]
+            if label and label != image.label:
+                image.label = label
+                changed = True
+            if changed and image.pk:
+                updated.append(image)
+            images.append(image)
+
+        with transaction.atomic():
+            cls.objects.bulk_update(
+                updated, ["width", "height", "aspect_ratio", "label"], batch_size=500
+            )
+            bulk_create_images(created)
+
+        return images
+
+    @staticmethod
+    def split_regions(width_pct: int = 50, rtl=False):
+        """Returns the regions of the two halves of a split image in reading order."""
         regions = (
             f"pct:0,0,{width_pct},100",
             f"pct:{100-width_pct},0,100,100",
         )
         if rtl:
             regions = (regions[1], regions[0])
+        return regions
+
+    def split(self, width_pct: int = 50, rtl=False):
+        """
+        Creates two new IIIF images.
+
+        Useful for images of an open page spread that needs to be divided.
+
+        Returns a list of two DeckImageIIIF objects.
+        """
+        return type(self).split_images([self], width_pct=width_pct, rtl=rtl)
+
+    @classmethod
+    def split_images(cls, images, width_pct: int = 50, rtl=False):
+        """
+        Splits many IIIF images into two new images each in a constant number of queries.
+
+        The regions are all calculated in memory. Images for regions which already exist are reused
+        (and their dimensions updated) and the rest are created in bulk.
+
+        Returns a list of the new images in order with the two halves of each image next to each other.
+        """
+        regions = cls.split_regions(width_pct=width_pct, rtl=rtl)
+        halves = []
+        for image in images:
+            # Each half is width_pct percent of the width of the full image
+            width = round(image.width * width_pct / 100) if image.width else 0
+            for region in regions:
+                halves.append((image.base_url, region, width, image.height))
+
+        existing = {}
+        base_urls = {base_url for base_url, *_ in halves}
+        for chunk in chunked(base_urls, 500):
+            images_in_chunk = cls.objects.filter(base_url__in=chunk, region__in=regions)
+            for image in images_in_chunk.order_by("pk"):
+                existing.setdefault((image.base_url, image.region), image)
 
         result = []
-        for region in regions:
-            width = int(self.width * width_pct * 100) if self.width else self.width
-            image, _ = type(self).objects.update_or_create(
-                base_url=self.base_url,
-                width=width,
-                height=self.height,
-                region=region,
-            )
+        updated = []
+        created = []
+        for base_url, region, width, height in halves:
+            image = existing.get((base_url, region))
+            if not image:
+                image = cls(base_url=base_url, region=region)
+                image.set_size(width, height)
+                existing[(base_url, region)] = image
+                created.append(image)
+            elif (image.width, image.height) != (width, height):
+                image.set_size(width, height)
+                if image not in updated:
+                    updated.append(image)
             result.append(image)
+
+        with transaction.atomic():
+            cls.objects.bulk_update(
+                updated, ["width", "height", "aspect_ratio"], batch_size=500
+            )
+            bulk_create_images(created)
+
         return result
 
 
+class DeckRendition(models.Model):
+    """
+    A registry of generated versions of an image at a particular size.
+
+    This means that thumbnails don't need to be generated (or checked for in storage) on every request.
+    """
+
+    image = models.ForeignKey(
+        DeckImageBase, on_delete=models.CASCADE, related_name="renditions"
+    )
+    width = models.PositiveIntegerField(
+        default=0,
+        help_text="The requested width. Zero means that it was unconstrained.",
+    )
+    height = models.PositiveIntegerField(
+        default=0,
+        help_text="The requested height. Zero means that it was unconstrained.",
+    )
+    crop = models.BooleanField(default=True)
+    subject_location = models.CharField(max_length=64, default="", blank=True)
+    format = models.CharField(
+        max_length=16,
+        default="",
+        blank=True,
+        help_text="The image format of the rendition. Blank means the default format.",
+    )
+    source = models.CharField(
+        max_length=255,
+        default="",
+        blank=True,
+        help_text="An identifier for the version of the source file (e.g. its SHA1 hash).",
+    )
+    url = models.CharField(max_length=1023)
+    rendition_width = models.PositiveIntegerField(default=0)
+    rendition_height = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "image",
+                    "width",
+                    "height",
+                    "crop",
+                    "subject_location",
+                    "format",
+                    "source",
+                ],
+                name="imagedeck_unique_rendition",
+            ),
+        ]
+
+    def __str__(self):
+        return self.url
+
+
+class DeckCachedDocument(models.Model):
+    """
+    A copy of a remote document (e.g. a IIIF manifest) with the headers needed to revalidate it.
+
+    See imagedeck.documents for how these are fetched and revalidated.
+    """
+
+    url = models.URLField(max_length=511, unique=True)
+    body = models.TextField(default="", blank=True)
+    content_type = models.CharField(max_length=255, default="", blank=True)
+    etag = models.CharField(max_length=255, default="", blank=True)
+    last_modified = models.CharField(max_length=255, default="", blank=True)
+    fetched = models.DateTimeField(
+        help_text="When the body was last downloaded.",
+    )
+    checked = models.DateTimeField(
+        help_text="When the body was last downloaded or confirmed to be unchanged.",
+    )
+
+    def __str__(self):
+        return self.url
+
+
+class DeckMembershipQuerySet(models.QuerySet):
+    def with_position(self):
+        """
+        Annotates each membership with its 'position' in its deck (starting at one) and the 'total' number of memberships in the deck.
+
+        Both are calculated with window functions in a single query.
+        The window is over the memberships in this queryset so filter by deck before calling this.
+        """
+        return self.annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F("deck")],
+                order_by=[F("rank").asc(), F("id").asc()],
+            ),
+            total=Window(Count("id"), partition_by=[F("deck")]),
+        )
+
+
 class DeckMembership(models.Model):
     deck = models.ForeignKey(DeckBase, on_delete=models.CASCADE)
     image = models.ForeignKey(DeckImageBase, on_delete=models.CASCADE)
@@ -625,6 +1865,8 @@ class DeckMembership(models.Model):
         help_text="Whether or not this image should be conisdered the primary image for the deck.",
     )
 
+    objects = DeckMembershipQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.deck}, {self.image}, {self.rank}"
 
@@ -632,17 +1874,106 @@ class DeckMembership(models.Model):
         ordering = [
             "rank",
         ]
+        indexes = [
+            models.Index(fields=["deck", "rank"], name="imagedeck_membership_rank"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["deck", "image"], name="imagedeck_unique_membership"
+            ),
+            models.UniqueConstraint(
+                fields=["deck"],
+                condition=Q(primary=True),
+                name="imagedeck_unique_primary",
+            ),
+        ]
+
+    def get_constraints(self):
+        """
+        Returns the constraints which are checked when validating this membership (e.g. in a model form).
+
+        The constraint on a single primary membership per deck is left out because save() unsets
+        the previous primary membership, so marking another membership as primary is allowed.
+        """
+        return [
+            (
+                model_class,
+                [
+                    constraint
+                    for constraint in constraints
+                    if constraint.name != "imagedeck_unique_primary"
+                ],
+            )
+            for model_class, constraints in super().get_constraints()
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember whether this membership was primary so save() only syncs the deck when it changes
+        if "primary" in field_names:
+            instance._saved_primary = instance.primary
+        return instance
+
+    def affects_primary(self, update_fields=None):
+        """
+        Returns whether saving this membership could change the primary membership of its deck.
+
+        Saving a primary membership always does so that it replaces any other primary membership.
+        """
+        if update_fields is not None and "primary" not in update_fields:
+            return False
+        if self.primary:
+            return True
+        return not self._state.adding and getattr(self, "_saved_primary", True)
+
+    def save(self, *args, **kwargs):
+        """
+        Saves this membership and keeps the primary membership of the deck in sync.
+
+        If this membership is primary then any other primary membership in the deck is unset.
+        Saving a membership which wasn't primary and still isn't doesn't touch the deck.
+        """
+        if not self.affects_primary(kwargs.get("update_fields")):
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            memberships = DeckMembership.objects.filter(deck_id=self.deck_id)
+            if self.primary:
+                memberships.filter(primary=True).exclude(pk=self.pk).update(
+                    primary=False
+                )
+
+            super().save(*args, **kwargs)
+            self._saved_primary = self.primary
+
+            decks = DeckBase.objects.filter(pk=self.deck_id)
+            if self.primary:
+                decks.update(primary_membership=self)
+            else:
+                decks.filter(primary_membership=self).update(primary_membership=None)
+
+        if DeckMembership.deck.is_cached(self):
+            if self.primary:
+                self.deck.primary_membership = self
+            elif self.deck.primary_membership_id == self.pk:
+                self.deck.primary_membership = None
 
     def index(self):
         """
-        Returns the index of this image in the deck.
+        Returns the (zero-based) index of this image in the deck.
 
-        TODO: check if this is this always the same as rank-1?
+        If this membership comes from a queryset annotated with 'with_position' then no query is needed.
+        Ranks can have gaps so this is not necessarily the same as rank-1.
         """
+        position = getattr(self, "position", None)
+        if position is not None:
+            return position - 1
         return DeckMembership.objects.filter(deck=self.deck, rank__lt=self.rank).count()
 
-    def thumbnail(self):
-        return self.image.thumbnail()
+    def thumbnail(self, format=None):
+        return self.image.thumbnail(format=format)
 
     def url(self, **kwargs):
         return self.image.url(**kwargs)
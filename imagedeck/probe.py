@@ -0,0 +1,215 @@
+"""
+Reads the dimensions of remote images from the first few kilobytes of the file.
+
+The width and height of JPEG, PNG, GIF, WebP and TIFF images are stored in their headers
+so there is no need to download (or decode) the whole image to find them.
+"""
+
+import struct
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+from . import settings as imagedeck_settings
+
+JPEG_SOF_MARKERS = {
+    0xC0,
+    0xC1,
+    0xC2,
+    0xC3,
+    0xC5,
+    0xC6,
+    0xC7,
+    0xC9,
+    0xCA,
+    0xCB,
+    0xCD,
+    0xCE,
+    0xCF,
+}
+
+
+def png_dimensions(data):
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def gif_dimensions(data):
+    if len(data) < 10:
+        return None
+    return struct.unpack("<HH", data[6:10])
+
+
+def webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def jpeg_dimensions(data):
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            # Not at a marker so the file is not a valid JPEG
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # Markers without a length
+            position += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if position + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[position + 5 : position + 9])
+            return width, height
+        (length,) = struct.unpack(">H", data[position + 2 : position + 4])
+        position += 2 + length
+    return None
+
+
+def tiff_endian(data):
+    return "<" if data[:2] == b"II" else ">"
+
+
+def tiff_ifd_offset(data):
+    """Returns the offset of the first image file directory in a TIFF file or None if the data is not a TIFF header."""
+    if data[:4] not in (b"II*\x00", b"MM\x00*") or len(data) < 8:
+        return None
+    (offset,) = struct.unpack(tiff_endian(data) + "I", data[4:8])
+    return offset
+
+
+def tiff_ifd_dimensions(ifd, endian):
+    """Returns the width and height from the bytes of a TIFF image file directory."""
+    if len(ifd) < 2:
+        return None
+    (entry_count,) = struct.unpack(endian + "H", ifd[:2])
+
+    dimensions = {}
+    for index in range(entry_count):
+        start = 2 + index * 12
+        if start + 12 > len(ifd):
+            return None
+        tag, field_type = struct.unpack(endian + "HH", ifd[start : start + 4])
+        if tag not in (256, 257):
+            continue
+        if field_type == 3:
+            (value,) = struct.unpack(endian + "H", ifd[start + 8 : start + 10])
+        else:
+            (value,) = struct.unpack(endian + "I", ifd[start + 8 : start + 12])
+        dimensions[tag] = value
+        if len(dimensions) == 2:
+            return dimensions[256], dimensions[257]
+    return None
+
+
+def tiff_dimensions(data):
+    offset = tiff_ifd_offset(data)
+    if offset is None:
+        return None
+    return tiff_ifd_dimensions(data[offset:], tiff_endian(data))
+
+
+def dimensions_from_header(data):
+    """
+    Returns the width and height of an image from the start of its file.
+
+    Returns None if the format is not recognised or if more of the file is needed.
+    The dimensions are as they are stored in the file (i.e. without applying any EXIF orientation) like PIL's Image.size.
+    """
+    data = bytes(data)
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return png_dimensions(data)
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return gif_dimensions(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return webp_dimensions(data)
+    if data[:2] == b"\xff\xd8":
+        return jpeg_dimensions(data)
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return tiff_dimensions(data)
+    return None
+
+
+def probe_dimensions(url, session=None, max_bytes=None, timeout=None):
+    """
+    Returns the width and height of the image at a URL by downloading as little of it as possible.
+
+    It asks for the first 'max_bytes' of the file with a Range request and stops reading as soon as the dimensions are known.
+    Servers which ignore the Range header send the whole file but the connection is closed once there is enough of it.
+    For TIFF files with the image file directory at the end, that part of the file is requested separately.
+    If the header doesn't give the dimensions, then the whole image is downloaded and opened with PIL.
+    Returns None if the dimensions cannot be found.
+    """
+    session = session or requests
+    max_bytes = max_bytes or imagedeck_settings.IMAGEDECK_PROBE_BYTES
+    timeout = timeout or imagedeck_settings.IMAGEDECK_REQUEST_TIMEOUT
+
+    data = bytearray()
+    try:
+        with session.get(
+            url,
+            headers={"Range": f"bytes=0-{max_bytes - 1}"},
+            stream=True,
+            timeout=timeout,
+        ) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=4096):
+                data += chunk
+                dimensions = dimensions_from_header(data)
+                if dimensions:
+                    return dimensions
+                if len(data) >= max_bytes:
+                    break
+            complete = len(data) < max_bytes
+    except requests.RequestException:
+        return None
+
+    # TIFF files can have their image file directory at the end so ask for just that part
+    offset = tiff_ifd_offset(data)
+    if not complete and offset is not None and offset >= len(data):
+        try:
+            response = session.get(
+                url,
+                headers={"Range": f"bytes={offset}-{offset + 4095}"},
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            if response.status_code == 206:
+                dimensions = tiff_ifd_dimensions(response.content, tiff_endian(data))
+                if dimensions:
+                    return dimensions
+        except requests.RequestException:
+            pass
+
+    # The header is not enough so open the whole image
+    if complete:
+        source = BytesIO(data)
+    else:
+        try:
+            response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        source = BytesIO(response.content)
+
+    try:
+        with Image.open(source) as image:
+            return image.size
+    except Exception:
+        return None
@@ -0,0 +1,112 @@
+"""
+Image processors which decode large images at a reduced scale before resizing them.
+
+JPEG images are decoded at 1/2, 1/4 or 1/8 scale with ``Image.draft()`` which avoids decoding the full image at all.
+Other formats are reduced with ``Image.reduce()`` which is much cheaper than resampling the full image.
+"""
+
+from io import BytesIO
+from math import ceil
+
+from PIL import Image, ImageFile, ImageOps
+from imagekit.processors import Thumbnail
+
+MAX_REDUCTION_FACTOR = 8
+
+
+def reduction_factor(source_size, target_size, max_factor=MAX_REDUCTION_FACTOR):
+    """
+    Returns the largest power of two that an image can be scaled down by and still be at least as large as the target.
+
+    The smallest dimension of the source is compared with the largest dimension of the target
+    so that the result is safe for images which are rotated by their EXIF orientation.
+    Dimensions in the target which are None or zero are ignored.
+    """
+    target = max((dimension or 0 for dimension in target_size), default=0)
+    source = min((dimension or 0 for dimension in source_size), default=0)
+    if not target or not source:
+        return 1
+
+    factor = 1
+    while factor * 2 <= max_factor and source / (factor * 2) >= target:
+        factor *= 2
+    return factor
+
+
+def reduce_image(image, factor):
+    """
+    Scales down an image by an integer factor as part of decoding it if possible.
+
+    For JPEG images that have not been loaded yet, this uses draft mode so that the image is decoded at the reduced scale.
+    Otherwise the decoded image is reduced by box averaging.
+    """
+    if factor <= 1:
+        return image
+
+    width, height = image.size
+    target_size = (ceil(width / factor), ceil(height / factor))
+    if image.format == "JPEG":
+        image.draft(image.mode, target_size)
+
+    remaining_factor = image.size[0] // target_size[0]
+    if remaining_factor > 1:
+        try:
+            image = image.reduce(remaining_factor)
+        except ValueError:
+            # Some modes (e.g. palette images) cannot be reduced
+            pass
+    return image
+
+
+def draft_pil_image(source, reduce=1, exif_orientation=True, **options):
+    """
+    A source generator for easy-thumbnails which decodes the image at a reduced scale.
+
+    The 'reduce' option gives the factor to reduce the image by. It is set by DeckImageFiler when it requests a thumbnail.
+    Otherwise this behaves like easy_thumbnails.source_generators.pil_image.
+    """
+    if not source:
+        return
+    source = BytesIO(source.read())
+
+    image = Image.open(source)
+    image = reduce_image(image, reduce)
+    try:
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
+        image.load()
+    finally:
+        ImageFile.LOAD_TRUNCATED_IMAGES = False
+
+    if exif_orientation:
+        image = ImageOps.exif_transpose(image)
+    return image
+
+
+def open_reduced(file, source_size, target_size):
+    """Opens a Django file as a PIL image decoded at the largest reduction which is still at least the target size."""
+    file.open()
+    try:
+        return draft_pil_image(file, reduce=reduction_factor(source_size, target_size))
+    finally:
+        file.close()
+
+
+def scale_subject_location(subject_location, factor):
+    """Scales a subject location in the form 'x,y' down by a factor."""
+    if not subject_location or factor <= 1:
+        return subject_location
+    try:
+        x, y = (float(value) for value in str(subject_location).split(","))
+    except ValueError:
+        return subject_location
+    return f"{int(x / factor)},{int(y / factor)}"
+
+
+class DraftThumbnail(Thumbnail):
+    """
+    An imagekit Thumbnail processor which reduces the image to near the target size before resampling it.
+    """
+
+    def process(self, img):
+        factor = reduction_factor(img.size, (self.width, self.height))
+        return super().process(reduce_image(img, factor))
@@ -0,0 +1,174 @@
+"""
+A local cache for the images of remote IIIF image servers.
+
+When IMAGEDECK_IIIF_PROXY is True, DeckImageIIIF URLs point to the iiif_proxy view instead of the remote server.
+The first request for each image is downloaded from the remote server and kept on local disk in
+IMAGEDECK_IIIF_PROXY_DIR. Later requests are served from disk. The files are limited to
+IMAGEDECK_IIIF_PROXY_MAX_BYTES in total and the least recently used files are removed first.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import requests
+
+from . import settings as imagedeck_settings
+from .locks import KeyedLocks
+
+CHUNK_SIZE = 65536
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+# Downloads of the same image in this process wait for each other
+_download_locks = KeyedLocks()
+
+
+class DiskLRUCache:
+    """
+    Files in a directory which are limited to a total number of bytes.
+
+    When the total is over the limit, the files which were used least recently are deleted.
+    The order of use is kept in memory and is read from the modification times of the files when it is first needed,
+    so files which were written by other processes are also included.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = None
+        self.total = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def load_index(self):
+        """Reads the files in the directory into the index from the least to the most recently used."""
+        files = []
+        if os.path.isdir(self.directory):
+            for subdirectory in os.scandir(self.directory):
+                if not subdirectory.is_dir():
+                    continue
+                for entry in os.scandir(subdirectory.path):
+                    if entry.is_file() and not entry.name.startswith("."):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        self.index = OrderedDict(
+            (key, size) for _, key, size in sorted(files, key=lambda item: item[0])
+        )
+        self.total = sum(self.index.values())
+
+    def get(self, key):
+        """Returns the path of the file for a key and marks it as used or None if there isn't one."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                if self.index and key in self.index:
+                    self.total -= self.index.pop(key)
+            return None
+
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            if key in self.index:
+                self.index.move_to_end(key)
+            else:
+                # Written by another process
+                self.index[key] = os.path.getsize(path)
+                self.total += self.index[key]
+        return path
+
+    def put(self, key, chunks):
+        """
+        Writes the chunks of bytes to the file for a key and returns its path.
+
+        The file is written to a temporary file first so that it is never read while it is incomplete.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".download-"
+        )
+        try:
+            size = 0
+            with os.fdopen(handle, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            self.total -= self.index.pop(key, 0)
+            self.index[key] = size
+            self.total += size
+            self.evict(keep=key)
+        return path
+
+    def evict(self, keep=None):
+        """Deletes the least recently used files until the total size is within the limit."""
+        for key in list(self.index.keys()):
+            if self.total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.total -= self.index.pop(key)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+
+def proxy_directory():
+    return imagedeck_settings.IMAGEDECK_IIIF_PROXY_DIR or os.path.join(
+        tempfile.gettempdir(), "imagedeck-iiif-proxy"
+    )
+
+
+def proxy_store():
+    """Returns the DiskLRUCache for the current settings which is shared by all the threads in this process."""
+    directory = proxy_directory()
+    max_bytes = imagedeck_settings.IMAGEDECK_IIIF_PROXY_MAX_BYTES
+    with _stores_lock:
+        if (directory, max_bytes) not in _stores:
+            _stores[(directory, max_bytes)] = DiskLRUCache(directory, max_bytes)
+        return _stores[(directory, max_bytes)]
+
+
+def proxy_key(url):
+    """Returns the name of the file for a remote URL keeping its extension."""
+    extension = os.path.splitext(url)[1]
+    return hashlib.sha1(url.encode()).hexdigest() + extension
+
+
+def fetch_proxied(url, session=None, timeout=None):
+    """
+    Returns the path to a local copy of the file at a remote URL, downloading it if it isn't in the cache.
+
+    Raises a requests.RequestException if it can't be downloaded.
+    """
+    store = proxy_store()
+    key = proxy_key(url)
+
+    def download():
+        with (session or requests).get(
+            url,
+            stream=True,
+            timeout=timeout or imagedeck_settings.IMAGEDECK_REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            return store.put(key, response.iter_content(CHUNK_SIZE))
+
+    return _download_locks.get_or_create(key, lambda: store.get(key), download)
@@ -11,5 +11,44 @@ IMAGEDECK_THUMBNAIL_WIDTH = get_setting("IMAGEDECK_THUMBNAIL_WIDTH", 250)
 IMAGEDECK_THUMBNAIL_HEIGHT = get_setting("IMAGEDECK_THUMBNAIL_HEIGHT", None)
 IMAGEDECK_THUMBNAIL_QUALITY = get_setting("IMAGEDECK_THUMBNAIL_QUALITY", 60)
 IMAGEDECK_THUMBNAIL_FORMAT = get_setting("IMAGEDECK_THUMBNAIL_FORMAT", "JPEG")
+IMAGEDECK_THUMBNAIL_PLACEHOLDER = get_setting("IMAGEDECK_THUMBNAIL_PLACEHOLDER", None)
 IMAGEDECK_DEFAULT_WIDTH = get_setting("IMAGEDECK_DEFAULT_WIDTH", 250)
 IMAGEDECK_DEFAULT_HEIGHT = get_setting("IMAGEDECK_DEFAULT_HEIGHT", 250)
+IMAGEDECK_RANK_GAP = get_setting("IMAGEDECK_RANK_GAP", 1024)
+IMAGEDECK_CONTACT_SHEET_DIR = get_setting(
+    "IMAGEDECK_CONTACT_SHEET_DIR", "imagedeck/contact-sheets"
+)
+IMAGEDECK_CONTACT_SHEET_COLUMNS = get_setting("IMAGEDECK_CONTACT_SHEET_COLUMNS", 10)
+IMAGEDECK_CONTACT_SHEET_IMAGES = get_setting("IMAGEDECK_CONTACT_SHEET_IMAGES", 100)
+IMAGEDECK_CONTACT_SHEET_CELL_WIDTH = get_setting(
+    "IMAGEDECK_CONTACT_SHEET_CELL_WIDTH", 150
+)
+IMAGEDECK_CONTACT_SHEET_CELL_HEIGHT = get_setting(
+    "IMAGEDECK_CONTACT_SHEET_CELL_HEIGHT", 150
+)
+IMAGEDECK_CONTACT_SHEET_BACKGROUND = get_setting(
+    "IMAGEDECK_CONTACT_SHEET_BACKGROUND", "white"
+)
+IMAGEDECK_RENDITION_FORMATS = get_setting(
+    "IMAGEDECK_RENDITION_FORMATS", ["avif", "webp"]
+)
+IMAGEDECK_PROBE_BYTES = get_setting("IMAGEDECK_PROBE_BYTES", 65536)
+IMAGEDECK_REQUEST_TIMEOUT = get_setting("IMAGEDECK_REQUEST_TIMEOUT", 10)
+IMAGEDECK_MANIFEST_TTL = get_setting("IMAGEDECK_MANIFEST_TTL", 3600)
+IMAGEDECK_PARSED_DOCUMENTS = get_setting("IMAGEDECK_PARSED_DOCUMENTS", 16)
+IMAGEDECK_INFO_JSON_CACHE = get_setting("IMAGEDECK_INFO_JSON_CACHE", "default")
+IMAGEDECK_INFO_JSON_TTL = get_setting("IMAGEDECK_INFO_JSON_TTL", 86400)
+IMAGEDECK_INFO_JSON_STALE = get_setting("IMAGEDECK_INFO_JSON_STALE", 604800)
+IMAGEDECK_INFO_JSON_DB = get_setting("IMAGEDECK_INFO_JSON_DB", False)
+IMAGEDECK_IIIF_PROXY = get_setting("IMAGEDECK_IIIF_PROXY", False)
+IMAGEDECK_IIIF_PROXY_DIR = get_setting("IMAGEDECK_IIIF_PROXY_DIR", None)
+IMAGEDECK_IIIF_PROXY_MAX_BYTES = get_setting(
+    "IMAGEDECK_IIIF_PROXY_MAX_BYTES", 1024 * 1024 * 1024
+)
+IMAGEDECK_IIIF_PROXY_MAX_AGE = get_setting("IMAGEDECK_IIIF_PROXY_MAX_AGE", 31536000)
+IMAGEDECK_IIIF_PROXY_MAX_SIZE = get_setting("IMAGEDECK_IIIF_PROXY_MAX_SIZE", 4096)
+IMAGEDECK_TILE_DIR = get_setting("IMAGEDECK_TILE_DIR", "imagedeck/tiles")
+IMAGEDECK_TILE_SIZE = get_setting("IMAGEDECK_TILE_SIZE", 512)
+IMAGEDECK_TILE_QUALITY = get_setting("IMAGEDECK_TILE_QUALITY", 85)
+IMAGEDECK_IIIF_MAX_AREA = get_setting("IMAGEDECK_IIIF_MAX_AREA", 4096 * 4096)
+IMAGEDECK_IIIF_MAX_AGE = get_setting("IMAGEDECK_IIIF_MAX_AGE", 86400)
@@ -1,13 +1,69 @@
 from django import template
+from django.utils.html import format_html
 import logging
 
+from ..formats import negotiate_format
+
 register = template.Library()
+logger = logging.getLogger(__name__)
 
 
 @register.filter
 def url_with_width(image, width=None):
-    # return str(type(image))
     try:
         return image.url(width=width)
-    except:
+    except Exception:
+        logger.exception("Cannot get the URL for %s with width %s", image, width)
         return str(image)
+
+
+def parse_widths(widths):
+    if isinstance(widths, str):
+        widths = widths.replace(",", " ").split()
+    return [int(width) for width in widths]
+
+
+def context_format(context, format=None):
+    """
+    Returns the rendition format for a template.
+
+    If it isn't given explicitly then it is negotiated from the Accept header of the request in the context.
+    Views which render these tags should vary on the Accept header (e.g. with django.views.decorators.vary.vary_on_headers).
+    """
+    if format is not None:
+        return format
+    request = context.get("request")
+    return negotiate_format(request) if request else ""
+
+
+@register.simple_tag(takes_context=True)
+def deck_image_srcset(
+    context, image, widths="320,640,1280,2560", sizes=None, format=None
+):
+    """
+    Renders the 'srcset' and 'sizes' attributes for an img element of a deck image.
+
+    The widths can be a comma separated string or a list of integers.
+    For example: {% deck_image_srcset image widths="320,640,1280" sizes="50vw" %}
+    The renditions are in the best format that the browser accepts unless 'format' is given (use format="" for the default format).
+    """
+    widths = parse_widths(widths)
+    if sizes is None:
+        largest = max(widths)
+        sizes = f"(max-width: {largest}px) 100vw, {largest}px"
+    srcset = image.srcset(widths, format=context_format(context, format))
+    return format_html('srcset="{}" sizes="{}"', srcset, sizes)
+
+
+@register.simple_tag(takes_context=True)
+def deck_image_thumbnail(context, image, format=None):
+    """
+    Returns the URL of the thumbnail of a deck image in the best format that the browser accepts.
+
+    For example: <img src="{% deck_image_thumbnail image %}">
+    """
+    try:
+        return image.thumbnail(format=context_format(context, format))
+    except Exception:
+        logger.exception("Cannot get the thumbnail for %s", image)
+        return ""
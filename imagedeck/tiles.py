@@ -0,0 +1,542 @@
+"""
+Serves local images (DeckImage and DeckImageFiler) with the IIIF Image API 2.1 and 3.0.
+
+The tiles of private Filer images are kept in Filer's private storage and are only served to users who can read the image.
+
+Only the tiles and sizes which are listed in the info.json are saved in the storage, under a canonical name
+for the request, so the storage used for an image is bounded. They are cut from a pyramid which is made by
+halving the image at each level so the full image is decoded once for all of them. This happens the first
+time one of them is requested or ahead of time with generate_tiles() (or the imagedeck_tiles management command).
+Any other request (another region, size, rotation, quality or format) is rendered from the saved tiles of the
+nearest level of the pyramid and isn't saved.
+"""
+
+import hashlib
+import json
+import mimetypes
+import re
+from io import BytesIO
+from math import ceil
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from . import settings as imagedeck_settings
+from .formats import MIME_TYPES
+from .locks import KeyedLocks
+from .processors import draft_pil_image
+
+PIL_FORMATS = {
+    "jpg": "JPEG",
+    "png": "PNG",
+    "webp": "WEBP",
+    "gif": "GIF",
+    "tif": "TIFF",
+}
+QUALITIES = ("default", "color", "gray", "bitonal")
+NUMBER = r"\d+(?:\.\d+)?"
+REGION_REGEX = re.compile(rf"(pct:)?({NUMBER}),({NUMBER}),({NUMBER}),({NUMBER})")
+SIZE_REGEX = re.compile(r"(!)?(\d*),(\d*)")
+ROTATION_REGEX = re.compile(rf"(!)?({NUMBER})")
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Requests for the tiles of the same image in this process wait for the pyramid to be generated once
+_pyramid_locks = KeyedLocks()
+
+
+class InvalidIIIFRequest(ValueError):
+    """Raised when the parameters of a IIIF Image API request are not valid for an image."""
+
+
+def tile_storage(image):
+    """Returns the storage for the tiles of an image. The tiles of private Filer images are in Filer's private storage."""
+    return image.tile_storage()
+
+
+def tile_directory(image):
+    """Returns the directory in the storage for the tiles of an image which changes when its source changes."""
+    version = hashlib.sha1(str(image.tile_version()).encode()).hexdigest()[:12]
+    return f"{imagedeck_settings.IMAGEDECK_TILE_DIR}/{image.pk}-{version}"
+
+
+def pyramid_key(image, public=None):
+    """Returns the cache key of the pyramid of an image which is different for its public and private storages."""
+    if public is None:
+        public = image.is_public()
+    privacy = "public" if public else "private"
+    return f"imagedeck:pyramid:{privacy}:{tile_directory(image)}"
+
+
+def delete_directory(directory, storage):
+    """Deletes the files in a directory of a storage and its subdirectories."""
+    try:
+        subdirectories, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        storage.delete(f"{directory}/{name}")
+    for name in subdirectories:
+        delete_directory(f"{directory}/{name}", storage)
+
+
+def delete_tiles(image, storage):
+    """Deletes the tiles of the current version of an image from a storage."""
+    delete_directory(tile_directory(image), storage)
+    cache.delete_many([pyramid_key(image, public) for public in (True, False)])
+
+
+def scale_factors(width, height, tile_size):
+    """Returns the scale factors (powers of two) down to the level where the whole image fits in a single tile."""
+    factors = [1]
+    while max(width, height) / factors[-1] > tile_size:
+        factors.append(factors[-1] * 2)
+    return factors
+
+
+def source_dimensions(file):
+    """Returns the width and height of an image file after it is rotated by its EXIF orientation."""
+    file.open()
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            if image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+    finally:
+        file.close()
+    return width, height
+
+
+def save_pyramid(image, pyramid, storage=None):
+    storage = storage or tile_storage(image)
+    name = f"{tile_directory(image)}/pyramid.json"
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(json.dumps(pyramid).encode()))
+    cache.set(pyramid_key(image), pyramid, None)
+
+
+def get_pyramid(image, storage=None):
+    """
+    Returns a dictionary with the 'width', 'height', 'tile_size' and 'scale_factors' of the tile pyramid of an image.
+
+    It also has 'tiled' which is True once all the tiles have been generated.
+    This is saved in the storage (and cached) so the source image is only opened the first time.
+    """
+    storage = storage or tile_storage(image)
+    key = pyramid_key(image)
+    pyramid = cache.get(key)
+    if pyramid:
+        return pyramid
+
+    name = f"{tile_directory(image)}/pyramid.json"
+    if storage.exists(name):
+        with storage.open(name) as f:
+            pyramid = json.loads(f.read())
+        cache.set(key, pyramid, None)
+        return pyramid
+
+    width, height = source_dimensions(image.tile_source())
+    tile_size = imagedeck_settings.IMAGEDECK_TILE_SIZE
+    pyramid = dict(
+        width=width,
+        height=height,
+        tile_size=tile_size,
+        scale_factors=scale_factors(width, height, tile_size),
+        tiled=False,
+    )
+    save_pyramid(image, pyramid, storage=storage)
+    return pyramid
+
+
+def parse_region(region, width, height):
+    """Returns the region of a IIIF request as a tuple of (x, y, w, h) in pixels of the full image."""
+    if region == "full":
+        return 0, 0, width, height
+    if region == "square":
+        side = min(width, height)
+        return (width - side) // 2, (height - side) // 2, side, side
+
+    match = REGION_REGEX.fullmatch(region)
+    if not match:
+        raise InvalidIIIFRequest(f"Invalid region '{region}'.")
+
+    values = [float(value) for value in match.groups()[1:]]
+    if match.group(1):
+        x, y, w, h = (
+            round(value * dimension / 100)
+            for value, dimension in zip(values, (width, height, width, height))
+        )
+    elif all(value.is_integer() for value in values):
+        x, y, w, h = (int(value) for value in values)
+    else:
+        raise InvalidIIIFRequest(f"Invalid region '{region}'.")
+
+    w = min(w, width - x)
+    h = min(h, height - y)
+    if w <= 0 or h <= 0:
+        raise InvalidIIIFRequest(f"The region '{region}' is outside of the image.")
+    return x, y, w, h
+
+
+def derived_dimension(requested, region_requested, region_other, factors):
+    """
+    Returns the other dimension of a size when only one is given so that the aspect ratio is kept.
+
+    If the requested size is a level of the pyramid then it is calculated in the same way as the tiles.
+    """
+    for factor in factors:
+        if ceil(region_requested / factor) == requested:
+            return ceil(region_other / factor)
+    return max(1, round(region_other * requested / region_requested))
+
+
+def parse_size(size, region_width, region_height, version=3, factors=(1,)):
+    """Returns the width and height of the response for the size of a IIIF request for a region."""
+    upscale = size.startswith("^")
+    if upscale:
+        if version < 3:
+            raise InvalidIIIFRequest("Upscaling with '^' needs version 3 of the API.")
+        size = size[1:]
+
+    max_area = imagedeck_settings.IMAGEDECK_IIIF_MAX_AREA
+    if size in ("full", "max"):
+        width, height = region_width, region_height
+        if width * height > max_area:
+            scale = (max_area / (width * height)) ** 0.5
+            width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    elif size.startswith("pct:"):
+        if not re.fullmatch(NUMBER, size[4:]):
+            raise InvalidIIIFRequest(f"Invalid size '{size}'.")
+        percent = float(size[4:])
+        width = max(1, round(region_width * percent / 100))
+        height = max(1, round(region_height * percent / 100))
+    else:
+        match = SIZE_REGEX.fullmatch(size)
+        if not match or not (match.group(2) or match.group(3)):
+            raise InvalidIIIFRequest(f"Invalid size '{size}'.")
+        best_fit, width, height = match.groups()
+        width = int(width) if width else None
+        height = int(height) if height else None
+        if best_fit:
+            if not width or not height:
+                raise InvalidIIIFRequest(f"Invalid size '{size}'.")
+            scale = min(width / region_width, height / region_height)
+            width = max(1, round(region_width * scale))
+            height = max(1, round(region_height * scale))
+        elif height is None:
+            height = derived_dimension(width, region_width, region_height, factors)
+        elif width is None:
+            width = derived_dimension(height, region_height, region_width, factors)
+
+    if not width or not height:
+        raise InvalidIIIFRequest(f"Invalid size '{size}'.")
+    if (
+        version >= 3
+        and not upscale
+        and (width > region_width or height > region_height)
+    ):
+        raise InvalidIIIFRequest(f"The size '{size}' is larger than the region.")
+    if width * height > max_area:
+        raise InvalidIIIFRequest(f"The size '{size}' is larger than the maximum area.")
+    return width, height
+
+
+def parse_rotation(rotation):
+    """Returns a tuple of whether to mirror the image and the degrees to rotate it clockwise."""
+    match = ROTATION_REGEX.fullmatch(rotation)
+    if not match or float(match.group(2)) > 360:
+        raise InvalidIIIFRequest(f"Invalid rotation '{rotation}'.")
+    degrees = float(match.group(2)) % 360
+    return bool(match.group(1)), int(degrees) if degrees.is_integer() else degrees
+
+
+def canonical_name(directory, box, size, mirror, degrees, quality, format):
+    """Returns the name in the storage for the response to a request."""
+    x, y, w, h = box
+    rotation = f"{'!' if mirror else ''}{degrees}"
+    quality = "default" if quality == "color" else quality
+    return (
+        f"{directory}/{x},{y},{w},{h}/{size[0]},{size[1]}/{rotation}/{quality}.{format}"
+    )
+
+
+def save_image(pil_image, format, quality):
+    """Returns the bytes of a PIL image in a IIIF format and quality."""
+    if quality == "gray":
+        pil_image = pil_image.convert("L")
+    elif quality == "bitonal":
+        pil_image = pil_image.convert("1")
+    elif format == "jpg" and pil_image.mode not in ("RGB", "L"):
+        pil_image = pil_image.convert("RGB")
+
+    f = BytesIO()
+    options = {}
+    if format in ("jpg", "webp"):
+        options["quality"] = imagedeck_settings.IMAGEDECK_TILE_QUALITY
+    pil_image.save(f, format=PIL_FORMATS[format], **options)
+    return f.getvalue()
+
+
+def advertised(pyramid, box, size, mirror, degrees, quality, format):
+    """Returns whether a request is for one of the tiles or sizes in the info.json which are saved in the storage."""
+    if mirror or degrees or quality not in ("default", "color") or format != "jpg":
+        return False
+
+    width, height = pyramid["width"], pyramid["height"]
+    x, y, w, h = box
+    for factor in pyramid["scale_factors"]:
+        if tuple(size) != (ceil(w / factor), ceil(h / factor)):
+            continue
+        # The whole image at the size of a level
+        if box == (0, 0, width, height):
+            return True
+        step = pyramid["tile_size"] * factor
+        if (
+            x % step == 0
+            and y % step == 0
+            and w == min(step, width - x)
+            and h == min(step, height - y)
+        ):
+            return True
+    return False
+
+
+def render(image, pyramid, box, size, mirror=False, degrees=0, storage=None):
+    """
+    Returns a region of an image resized to a size (and rotated) as a PIL image.
+
+    The region is cut from the saved tiles of the smallest level of the pyramid which is still at least as large as the size.
+    """
+    storage = storage or tile_storage(image)
+    width, height = pyramid["width"], pyramid["height"]
+    x, y, w, h = box
+    factor = 1
+    for level_factor in pyramid["scale_factors"]:
+        if w / level_factor >= size[0] and h / level_factor >= size[1]:
+            factor = level_factor
+
+    # Stitch the tiles of the level which overlap the region
+    step = pyramid["tile_size"] * factor
+    x0, y0 = x - x % step, y - y % step
+    x1 = min(ceil((x + w) / step) * step, width)
+    y1 = min(ceil((y + h) / step) * step, height)
+    level = Image.new("RGB", (ceil((x1 - x0) / factor), ceil((y1 - y0) / factor)))
+    directory = tile_directory(image)
+    for tile_y in range(y0, y1, step):
+        for tile_x in range(x0, x1, step):
+            tile_w, tile_h = min(step, width - tile_x), min(step, height - tile_y)
+            name = canonical_name(
+                directory,
+                (tile_x, tile_y, tile_w, tile_h),
+                (ceil(tile_w / factor), ceil(tile_h / factor)),
+                False,
+                0,
+                "default",
+                "jpg",
+            )
+            with storage.open(name) as f, Image.open(f) as tile:
+                level.paste(
+                    tile.convert("RGB"),
+                    ((tile_x - x0) // factor, (tile_y - y0) // factor),
+                )
+
+    pil_image = level.crop(
+        (
+            round((x - x0) / factor),
+            round((y - y0) / factor),
+            round((x + w - x0) / factor),
+            round((y + h - y0) / factor),
+        )
+    )
+    if pil_image.size != tuple(size):
+        pil_image = pil_image.resize(size, Image.LANCZOS)
+    if mirror:
+        pil_image = ImageOps.mirror(pil_image)
+    if degrees:
+        pil_image = pil_image.rotate(-degrees, expand=True)
+    return pil_image
+
+
+def iiif_response(
+    image, region, size, rotation, quality, format, version=3, storage=None
+):
+    """
+    Returns a file with the response to a IIIF Image API request and its content type.
+
+    Tiles and sizes in the info.json are read from the storage (and the pyramid is generated if they aren't there).
+    Other responses are rendered from the tiles and are not saved.
+    Raises InvalidIIIFRequest if the parameters are not valid.
+    """
+    storage = storage or tile_storage(image)
+    if format not in PIL_FORMATS:
+        raise InvalidIIIFRequest(f"Unsupported format '{format}'.")
+    if quality not in QUALITIES:
+        raise InvalidIIIFRequest(f"Unsupported quality '{quality}'.")
+
+    pyramid = get_pyramid(image, storage=storage)
+    box = parse_region(region, pyramid["width"], pyramid["height"])
+    dimensions = parse_size(
+        size, box[2], box[3], version=version, factors=pyramid["scale_factors"]
+    )
+    mirror, degrees = parse_rotation(rotation)
+    content_type = MIME_TYPES.get(format) or mimetypes.guess_type(f"image.{format}")[0]
+
+    if not pyramid["tiled"]:
+        with _pyramid_locks(tile_directory(image)):
+            generate_tiles(image, storage=storage)
+
+    if advertised(pyramid, box, dimensions, mirror, degrees, quality, format):
+        name = canonical_name(
+            tile_directory(image), box, dimensions, mirror, degrees, quality, format
+        )
+        if not storage.exists(name):
+            # The tiles were generated before but some have been removed since
+            generate_tiles(image, storage=storage, force=True)
+        return storage.open(name), content_type
+
+    try:
+        pil_image = render(image, pyramid, box, dimensions, mirror, degrees, storage)
+    except FileNotFoundError:
+        generate_tiles(image, storage=storage, force=True)
+        pil_image = render(image, pyramid, box, dimensions, mirror, degrees, storage)
+    return BytesIO(save_image(pil_image, format, quality)), content_type
+
+
+def level_size(pyramid, factor):
+    """
+    Returns the size of the whole image at a level of the pyramid or None if it is larger than IMAGEDECK_IIIF_MAX_AREA.
+
+    These are the sizes listed in the info.json. Larger ones would be refused by parse_size.
+    """
+    size = (ceil(pyramid["width"] / factor), ceil(pyramid["height"] / factor))
+    if size[0] * size[1] > imagedeck_settings.IMAGEDECK_IIIF_MAX_AREA:
+        return None
+    return size
+
+
+def tile_boxes(width, height, tile_size, factor):
+    """Yields the region and size of each tile at a scale factor."""
+    step = tile_size * factor
+    for y in range(0, height, step):
+        for x in range(0, width, step):
+            w = min(step, width - x)
+            h = min(step, height - y)
+            yield (x, y, w, h), (ceil(w / factor), ceil(h / factor))
+
+
+def generate_tiles(image, storage=None, force=False):
+    """
+    Generates the tiles and sizes listed in the info.json of an image and saves them in the storage.
+
+    Each level of the pyramid is made by halving the previous level so the full image is only decoded once.
+    Tiles which already exist are not saved again and nothing is done if all the tiles have been generated
+    unless 'force' is True.
+
+    Returns the number of tiles and sizes which were saved.
+    """
+    storage = storage or tile_storage(image)
+    pyramid = get_pyramid(image, storage=storage)
+    if pyramid["tiled"] and not force:
+        return 0
+
+    width, height = pyramid["width"], pyramid["height"]
+    directory = tile_directory(image)
+    file = image.tile_source()
+    file.open()
+    try:
+        level = draft_pil_image(file)
+    finally:
+        file.close()
+
+    count = 0
+    for factor in pyramid["scale_factors"]:
+        if factor > 1:
+            size = (ceil(width / factor), ceil(height / factor))
+            try:
+                level = level.reduce(2)
+            except ValueError:
+                pass
+            if level.size != size:
+                level = level.resize(size, Image.LANCZOS)
+
+        boxes = list(tile_boxes(width, height, pyramid["tile_size"], factor))
+        # The whole image at the size of this level
+        if level_size(pyramid, factor):
+            boxes.append(((0, 0, width, height), level.size))
+        for box, size in boxes:
+            name = canonical_name(directory, box, size, False, 0, "default", "jpg")
+            if storage.exists(name):
+                continue
+            x, y, w, h = box
+            tile = level.crop(
+                (x // factor, y // factor, x // factor + size[0], y // factor + size[1])
+            )
+            save_name = storage.save(
+                name, ContentFile(save_image(tile, "jpg", "default"))
+            )
+            # Another process saved it at the same time
+            if save_name != name:
+                storage.delete(save_name)
+            count += 1
+
+    pyramid["tiled"] = True
+    save_pyramid(image, pyramid, storage=storage)
+    return count
+
+
+def info_json(image, service_id, version=3, storage=None):
+    """Returns the image information (info.json) of an image for a version of the IIIF Image API."""
+    pyramid = get_pyramid(image, storage=storage)
+    width, height = pyramid["width"], pyramid["height"]
+    factors = pyramid["scale_factors"]
+    tiles = [
+        dict(
+            width=pyramid["tile_size"],
+            height=pyramid["tile_size"],
+            scaleFactors=factors,
+        )
+    ]
+    sizes = []
+    for factor in reversed(factors):
+        size = level_size(pyramid, factor)
+        if size:
+            sizes.append(dict(width=size[0], height=size[1]))
+    max_area = imagedeck_settings.IMAGEDECK_IIIF_MAX_AREA
+    if version == 2:
+        return {
+            "@context": "http://iiif.io/api/image/2/context.json",
+            "@id": service_id,
+            "protocol": "http://iiif.io/api/image",
+            "width": width,
+            "height": height,
+            "profile": [
+                "http://iiif.io/api/image/2/level2.json",
+                dict(
+                    formats=list(PIL_FORMATS),
+                    qualities=list(QUALITIES),
+                    maxArea=max_area,
+                ),
+            ],
+            "tiles": tiles,
+            "sizes": sizes,
+        }
+
+    return {
+        "@context": "http://iiif.io/api/image/3/context.json",
+        "id": service_id,
+        "type": "ImageService3",
+        "protocol": "http://iiif.io/api/image",
+        "profile": "level2",
+        "width": width,
+        "height": height,
+        "maxArea": max_area,
+        "tiles": tiles,
+        "sizes": sizes,
+        "extraFormats": [
+            format for format in PIL_FORMATS if format not in ("jpg", "png")
+        ],
+        "extraQualities": ["color", "gray", "bitonal"],
+        "extraFeatures": ["mirroring", "rotationArbitrary", "sizeUpscaling"],
+    }
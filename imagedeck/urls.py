@@ -1,4 +1,4 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 
 from . import views
 from .models import *
@@ -13,4 +13,30 @@ urlpatterns = [
         views.image_upload,
         name="upload",
     ),
+    re_path(
+        r"^iiif-proxy/(?P<pk>\d+)/"
+        r"(?P<region>full|square|(?:pct:)?[\d.]+,[\d.]+,[\d.]+,[\d.]+)/"
+        r"(?P<size>full|\d*,\d*)/"
+        r"(?P<rotation>0)/"
+        r"(?P<quality>default)\.(?P<format>jpg)$",
+        views.iiif_proxy,
+        name="iiif-proxy",
+    ),
+    re_path(
+        r"^iiif/(?P<version>[23])/(?P<pk>\d+)$",
+        views.iiif_base,
+        name="iiif-base",
+    ),
+    re_path(
+        r"^iiif/(?P<version>[23])/(?P<pk>\d+)/info\.json$",
+        views.iiif_info,
+        name="iiif-info",
+    ),
+    re_path(
+        r"^iiif/(?P<version>[23])/(?P<pk>\d+)/"
+        r"(?P<region>[^/]+)/(?P<size>[^/]+)/(?P<rotation>[^/]+)/"
+        r"(?P<quality>[a-z]+)\.(?P<format>[a-z]+)$",
+        views.iiif_image,
+        name="iiif-image",
+    ),
 ]
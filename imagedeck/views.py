@@ -1,8 +1,26 @@
+import mimetypes
+
+import requests
 from django.shortcuts import render
 from django.contrib.contenttypes.models import ContentType
-from django.http import JsonResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from . import settings as imagedeck_settings
+from .formats import MIME_TYPES, negotiate_format
+from .models import DeckImageBase, DeckImageIIIF
+from .proxy import fetch_proxied
+from .tiles import InvalidIIIFRequest, iiif_response, info_json
 
 
 @login_required
@@ -11,6 +29,7 @@ def image_upload(request, content_type_id, pk):
     Generic view to take an image (with the keyword 'file') and save it to the image deck of an object.
 
     It will be saved in the media storage. Returns a json reponse wiht the 'url', the 'thumbnail' url, the width and height of the thumbnail and the caption.
+    The thumbnail is in the best format in the 'Accept' header of the request and 'thumbnail_fallback' is in the default format.
     If the file is not valid, then the 'url' value is an empty string.
     """
     if request.method == "POST" and request.FILES["file"]:
@@ -20,9 +39,12 @@ def image_upload(request, content_type_id, pk):
         uploaded_file = obj.save_image_file(request.FILES["file"])
 
         width, height = uploaded_file.thumbnail_dimensions()
+        format = negotiate_format(request)
+        thumbnail = uploaded_file.thumbnail(format=format)
         data = dict(
             url=uploaded_file.url(),
-            thumbnail=uploaded_file.thumbnail(),
+            thumbnail=thumbnail,
+            thumbnail_fallback=uploaded_file.thumbnail() if format else thumbnail,
             height=height,
             width=width,
             caption=uploaded_file.get_caption(),
@@ -30,4 +52,110 @@ def image_upload(request, content_type_id, pk):
     else:
         data = {"url": ""}
 
-    return JsonResponse(data)
+    response = JsonResponse(data)
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@require_safe
+def iiif_proxy(request, pk, region, size, rotation, quality, format):
+    """
+    Serves an image from the IIIF image server of a DeckImageIIIF from a local cache.
+
+    The image is downloaded from the remote server the first time that it is requested (see imagedeck.proxy).
+    Only the URLs that DeckImageIIIF.proxy_url() generates can be requested,
+    so that this can't be used to proxy other URLs or to fill the cache with variants of an image.
+    The response can be cached by browsers for IMAGEDECK_IIIF_PROXY_MAX_AGE seconds.
+    """
+    image = get_object_or_404(DeckImageIIIF, pk=pk)
+    if region != image.region or not image.is_proxy_size(size):
+        raise Http404("This image is not served through the proxy in this size.")
+    url = image.iiif_url(
+        region=region, size=size, rotation=rotation, quality=quality, format=format
+    )
+    try:
+        path = fetch_proxied(url)
+    except requests.RequestException:
+        return HttpResponse("Cannot fetch the image from the IIIF server.", status=502)
+
+    content_type = MIME_TYPES.get(format) or mimetypes.guess_type(f"image.{format}")[0]
+    response = FileResponse(open(path, "rb"), content_type=content_type)
+    patch_cache_control(
+        response,
+        public=True,
+        immutable=True,
+        max_age=imagedeck_settings.IMAGEDECK_IIIF_PROXY_MAX_AGE,
+    )
+    return response
+
+
+def get_tiled_image(request, pk):
+    """
+    Returns the image with a primary key if it can be served through the IIIF Image API endpoint.
+
+    Images which the user can't read (like private Filer images) are not found, as in Filer's own views.
+    """
+    image = get_object_or_404(DeckImageBase, pk=pk)
+    if not image.tile_source() or not image.has_read_permission(request):
+        raise Http404("This image cannot be served with the IIIF Image API.")
+    return image
+
+
+def iiif_cache_headers(response, image):
+    """Lets public images be cached by anyone and used by viewers on any site. Private images are only cached by the browser."""
+    if image.is_public():
+        # IIIF viewers are often on other sites
+        response["Access-Control-Allow-Origin"] = "*"
+        patch_cache_control(
+            response, public=True, max_age=imagedeck_settings.IMAGEDECK_IIIF_MAX_AGE
+        )
+    else:
+        patch_cache_control(
+            response, private=True, max_age=imagedeck_settings.IMAGEDECK_IIIF_MAX_AGE
+        )
+    return response
+
+
+@require_safe
+def iiif_base(request, version, pk):
+    """Redirects the base URL of the IIIF image service of an image to its info.json."""
+    return redirect("imagedeck:iiif-info", version=version, pk=pk, permanent=False)
+
+
+@require_safe
+def iiif_info(request, version, pk):
+    """Returns the image information (info.json) of a DeckImage or DeckImageFiler for version 2 or 3 of the IIIF Image API."""
+    version = int(version)
+    image = get_tiled_image(request, pk)
+    service_id = request.build_absolute_uri(
+        reverse("imagedeck:iiif-base", kwargs=dict(version=version, pk=pk))
+    )
+    if version == 2:
+        content_type = "application/json"
+    else:
+        content_type = (
+            'application/ld+json;profile="http://iiif.io/api/image/3/context.json"'
+        )
+    response = JsonResponse(
+        info_json(image, service_id, version=version), content_type=content_type
+    )
+    return iiif_cache_headers(response, image)
+
+
+@require_safe
+def iiif_image(request, version, pk, region, size, rotation, quality, format):
+    """
+    Serves a DeckImage or DeckImageFiler with the IIIF Image API.
+
+    The tiles and sizes in the info.json are saved in the storage and other requests are rendered from them (see imagedeck.tiles).
+    """
+    image = get_tiled_image(request, pk)
+    try:
+        file, content_type = iiif_response(
+            image, region, size, rotation, quality, format, version=int(version)
+        )
+    except InvalidIIIFRequest as err:
+        return HttpResponseBadRequest(str(err))
+
+    response = FileResponse(file, content_type=content_type)
+    return iiif_cache_headers(response, image)
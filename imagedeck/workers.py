@@ -0,0 +1,92 @@
+"""
+Functions which are run in worker processes.
+
+This module doesn't import the models at the top level so that it can be imported by a
+spawned process before Django has been set up.
+"""
+
+import hashlib
+import mimetypes
+from itertools import islice
+from pathlib import Path
+
+import django
+
+HASH_CHUNK_SIZE = 1024 * 1024
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 36867
+
+
+def setup_worker():
+    """Initializes Django in a worker process."""
+    django.setup()
+
+
+def chunked(iterable, size):
+    """Yields lists of up to 'size' items from an iterable."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def generate_renditions(image_ids, widths):
+    """
+    Generates the thumbnail and the renditions at each width for the images with the given IDs.
+
+    Renditions which already exist are not generated again.
+    Returns the number of images processed and the number of renditions which were generated.
+    """
+    from .models import DeckImageBase
+
+    rendition_count = 0
+    images = DeckImageBase.objects.filter(pk__in=image_ids)
+    for image in images:
+        rendition_count += image.generate_renditions(widths)
+    return len(image_ids), rendition_count
+
+
+def sniff_file(path):
+    """
+    Reads the details of a file which Django Filer needs to import it without reading it again.
+
+    Returns a dictionary with the 'path', 'name', 'size', 'sha1' and 'mime_type' of the file.
+    If Pillow can read it as an image, 'is_image' is True and it has the 'width', 'height',
+    whether it is 'transparent' and the 'date_taken' from its EXIF data (as a string).
+    If the file can't be read then 'error' has the reason.
+    """
+    from PIL import Image
+    from easy_thumbnails.utils import is_transparent
+
+    path = Path(path)
+    details = dict(
+        path=str(path),
+        name=path.name,
+        mime_type=mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+        is_image=False,
+        error="",
+    )
+    try:
+        sha = hashlib.sha1()
+        size = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                sha.update(chunk)
+                size += len(chunk)
+        details.update(sha1=sha.hexdigest(), size=size)
+    except OSError as err:
+        details["error"] = str(err)
+        return details
+
+    try:
+        with Image.open(path) as image:
+            details.update(
+                is_image=True,
+                width=image.width,
+                height=image.height,
+                transparent=is_transparent(image),
+                date_taken=image.getexif().get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL),
+                mime_type=Image.MIME.get(image.format) or details["mime_type"],
+            )
+    except Exception:
+        pass
+    return details
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalServer:
+    """
+    A local HTTP server which stands in for remote image and IIIF servers in the tests.
+
+    Files are given as a dictionary of paths to (content type, content).
+    Each request is recorded with its headers, the number of bytes sent and the time that the response started.
+    Responses can be delayed by 'delay' seconds and the most requests handled at once is kept in 'max_active'.
+    'failures' gives the number of times a path responds with a 503 error before it succeeds.
+    Responses have an ETag header and conditional requests with a matching If-None-Match get a 304 response.
+
+    Use as a context manager:
+
+        with LocalServer({"/a.jpg": ("image/jpeg", data)}) as server:
+            probe_dimensions(server.url("/a.jpg"))
+    """
+
+    def __init__(self, files=None, ranges=True, delay=0, failures=None):
+        self.files = dict(files or {})
+        self.ranges = ranges
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}{path}"
+
+    def __enter__(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive so that clients can reuse them
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                # Only count the request as active until the response starts so that
+                # clients can't start another request before it has been counted as finished
+                with server.lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                time.sleep(server.delay)
+                with server.lock:
+                    server.active -= 1
+                self.respond()
+
+            def respond(self):
+                record = dict(
+                    path=self.path,
+                    headers=dict(self.headers),
+                    sent=0,
+                    time=time.monotonic(),
+                )
+                with server.lock:
+                    server.requests.append(record)
+                    failing = server.failures.get(self.path, 0) > 0
+                    if failing:
+                        server.failures[self.path] -= 1
+                if failing:
+                    self.send_error(503)
+                    return
+                if self.path not in server.files:
+                    self.send_error(404)
+                    return
+
+                content_type, content = server.files[self.path]
+                etag = '"%s"' % hashlib.sha1(content).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                status = 200
+                range_header = self.headers.get("Range", "")
+                if server.ranges and range_header.startswith("bytes="):
+                    start, _, end = range_header[len("bytes=") :].partition("-")
+                    start = int(start)
+                    end = min(int(end) if end else len(content) - 1, len(content) - 1)
+                    content = content[start : end + 1]
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                try:
+                    for start in range(0, len(content), 4096):
+                        self.wfile.write(content[start : start + 4096])
+                        record["sent"] += len(content[start : start + 4096])
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client has stopped reading
+                    pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
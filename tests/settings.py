@@ -50,3 +50,4 @@ MIDDLEWARE = [
 
 
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
+STATIC_URL = "/static/"
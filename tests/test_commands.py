@@ -0,0 +1,166 @@
+import hashlib
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from imagedeck.models import (
+    Deck,
+    DeckImage,
+    DeckImageBase,
+    DeckImageFiler,
+    DeckImageIIIF,
+)
+from imagedeck.workers import sniff_file
+
+from .test_models import create_filer_image
+
+
+class GenerateCommandTest(TestCase):
+    def setUp(self):
+        self.images = [
+            DeckImageIIIF.objects.create(
+                base_url=f"http://www.example.org/image-service/image{i}"
+            )
+            for i in range(5)
+        ]
+        self.deck = Deck.objects.create(name="Test Deck")
+        self.deck.add_images(self.images[:2])
+
+    def generate(self, *args):
+        stdout = StringIO()
+        call_command("imagedeck_generate", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_generate(self):
+        output = self.generate("200", "400", "--chunk-size", "2")
+        # IIIF images are resized by their server so nothing is generated
+        self.assertIn("Processed 5 images and generated 0 renditions", output)
+
+    def test_filters(self):
+        output = self.generate("200", "--deck", "Test Deck")
+        self.assertIn("Processed 2 images", output)
+        output = self.generate("200", "--type", "DeckImageFiler")
+        self.assertIn("Processed 0 images", output)
+        output = self.generate("200", "--modified-since", "2000-01-01")
+        self.assertIn("Processed 5 images", output)
+
+    def test_checkpoint(self):
+        checkpoint = Path(tempfile.mkdtemp()) / "checkpoint.txt"
+        checkpoint.write_text(str(self.images[2].pk))
+        output = self.generate("200", "--checkpoint", str(checkpoint))
+        self.assertIn(f"Resuming after image {self.images[2].pk}", output)
+        self.assertIn("Processed 2 images", output)
+        self.assertEqual(checkpoint.read_text(), str(self.images[-1].pk))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GenerateFilerCommandTest(TestCase):
+    def test_skip_existing(self):
+        deck = Deck.objects.create(name="Filer")
+        deck.add_images(
+            [
+                create_filer_image(f"generate{index}.jpg", size=(80, 60))
+                for index in range(2)
+            ]
+        )
+        stdout = StringIO()
+        call_command("imagedeck_generate", "20", "40", "--deck", "Filer", stdout=stdout)
+        # The thumbnail and the two widths of each image
+        self.assertIn(
+            "Processed 2 images and generated 6 renditions", stdout.getvalue()
+        )
+
+        stdout = StringIO()
+        call_command("imagedeck_generate", "20", "40", "--deck", "Filer", stdout=stdout)
+        self.assertIn(
+            "Processed 2 images and generated 0 renditions", stdout.getvalue()
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DimensionsCommandTest(TestCase):
+    def test_backfill(self):
+        data = BytesIO()
+        Image.new("RGB", (300, 200)).save(data, format="PNG")
+        image = DeckImage.objects.create(image=ContentFile(data.getvalue(), "a.png"))
+        DeckImageBase.objects.filter(pk=image.pk).update(
+            width=0, height=0, aspect_ratio=None
+        )
+
+        stdout = StringIO()
+        call_command("imagedeck_dimensions", stdout=stdout)
+        self.assertIn("Updated 1 images.", stdout.getvalue())
+        self.assertEqual(
+            DeckImageBase.objects.filter(pk=image.pk)
+            .values_list("width", "height", "aspect_ratio")
+            .get(),
+            (300, 200, 1.5),
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GlobCommandTest(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        for index in range(5):
+            image = Image.new("RGB", (30 + index, 20), "red")
+            image.save(self.directory / f"page-{index}.jpg", format="JPEG")
+        (self.directory / "notes.txt").write_text("Not an image")
+
+    def import_glob(self, *args):
+        call_command(
+            "imagedeck_glob",
+            "scans/delivery",
+            str(self.directory / "*"),
+            "--deck",
+            "Scans",
+            *args,
+            stdout=StringIO(),
+        )
+        return Deck.objects.get(name="Scans")
+
+    def test_import(self):
+        with mock.patch("filer.models.File.generate_sha1") as generate_sha1:
+            deck = self.import_glob("--batch-size", "2")
+        # The files were hashed before they were given to Filer
+        generate_sha1.assert_not_called()
+
+        images = list(deck.images_ordered())
+        self.assertEqual(len(images), 5)
+        for index, image in enumerate(images):
+            self.assertIsInstance(image, DeckImageFiler)
+            self.assertEqual(image.filer_image.original_filename, f"page-{index}.jpg")
+            self.assertEqual((image.width, image.height), (30 + index, 20))
+            self.assertEqual(image.filer_image.width, 30 + index)
+            self.assertEqual(len(image.filer_image.sha1), 40)
+            self.assertTrue(image.filer_image.file.name)
+
+        # Importing again reuses the images in the folder
+        deck = self.import_glob()
+        self.assertEqual(deck.images.count(), 5)
+        self.assertEqual(DeckImageFiler.objects.count(), 5)
+
+    def test_workers(self):
+        deck = self.import_glob("--workers", "2")
+        self.assertEqual(
+            [image.filer_image.original_filename for image in deck.images_ordered()],
+            [f"page-{index}.jpg" for index in range(5)],
+        )
+
+    def test_sniff_file(self):
+        details = sniff_file(self.directory / "page-3.jpg")
+        self.assertTrue(details["is_image"])
+        self.assertEqual((details["width"], details["height"]), (33, 20))
+        self.assertEqual(details["mime_type"], "image/jpeg")
+        self.assertEqual(
+            details["sha1"],
+            hashlib.sha1((self.directory / "page-3.jpg").read_bytes()).hexdigest(),
+        )
+        self.assertFalse(sniff_file(self.directory / "notes.txt")["is_image"])
+        self.assertTrue(sniff_file(self.directory / "missing.jpg")["error"])
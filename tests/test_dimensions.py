@@ -0,0 +1,121 @@
+import json
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from PIL import Image
+
+from imagedeck.dimensions import backfill_dimensions
+from imagedeck.models import (
+    DeckCachedDocument,
+    DeckImageBase,
+    DeckImageExternal,
+    DeckImageIIIF,
+)
+
+from .server import LocalServer
+
+
+def info_json(width, height):
+    return ("application/json", json.dumps(dict(width=width, height=height)).encode())
+
+
+def png(size):
+    data = BytesIO()
+    Image.new("RGB", size).save(data, format="PNG")
+    return ("image/png", data.getvalue())
+
+
+class BackfillDimensionsTest(TestCase):
+    def setUp(self):
+        files = {
+            f"/iiif/{index}/info.json": info_json(100 + index, 50) for index in range(6)
+        }
+        files["/a.png"] = png((30, 20))
+        self.server = LocalServer(files, delay=0.05, failures={"/iiif/0/info.json": 1})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+        self.iiif = [
+            DeckImageIIIF.objects.create(base_url=self.server.url(f"/iiif/{index}"))
+            for index in range(6)
+        ]
+        self.external = DeckImageExternal.objects.create(
+            external_url=self.server.url("/a.png")
+        )
+        self.missing = DeckImageExternal.objects.create(
+            external_url=self.server.url("/missing.png")
+        )
+
+    def test_backfill(self):
+        progress = []
+        updated, missing = backfill_dimensions(
+            workers=8,
+            per_host=2,
+            chunk_size=4,
+            callback=lambda *counts: progress.append(counts),
+        )
+        self.assertEqual((updated, missing), (7, 1))
+        self.assertEqual(progress, [(4, 0), (7, 1)])
+        # Requests were made concurrently but no more than two at a time
+        self.assertEqual(self.server.max_active, 2)
+
+        for index, image in enumerate(self.iiif):
+            image.refresh_from_db()
+            self.assertEqual((image.width, image.height), (100 + index, 50))
+            self.assertEqual(image.aspect_ratio, (100 + index) / 50)
+        self.external.refresh_from_db()
+        self.assertEqual((self.external.width, self.external.height), (30, 20))
+        self.missing.refresh_from_db()
+        self.assertEqual(self.missing.width, 0)
+
+        # The failed request was retried
+        paths = [request["path"] for request in self.server.requests]
+        self.assertEqual(paths.count("/iiif/0/info.json"), 2)
+
+    def test_slow_host(self):
+        DeckImageBase.objects.all().delete()
+        slow = LocalServer(
+            {f"/{index}.png": png((30, 20)) for index in range(3)}, delay=0.2
+        )
+        with slow, LocalServer({"/b.png": png((40, 20))}) as fast:
+            for index in range(3):
+                DeckImageExternal.objects.create(external_url=slow.url(f"/{index}.png"))
+            DeckImageExternal.objects.create(external_url=fast.url("/b.png"))
+            updated, missing = backfill_dimensions(workers=2, per_host=1)
+        self.assertEqual((updated, missing), (4, 0))
+        self.assertEqual(slow.max_active, 1)
+        # The other worker didn't wait for the slow host so the fast host was requested first
+        self.assertLess(fast.requests[0]["time"], slow.requests[0]["time"])
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command(
+            "imagedeck_dimensions",
+            "--type",
+            "DeckImageIIIF",
+            "--per-host",
+            "3",
+            stdout=stdout,
+        )
+        self.assertIn(
+            "Updated 6 images. Could not find the dimensions of 0 images.",
+            stdout.getvalue(),
+        )
+        self.assertLessEqual(self.server.max_active, 3)
+        self.external.refresh_from_db()
+        self.assertEqual(self.external.width, 0)
+
+
+class InfoJsonDatabaseTest(TransactionTestCase):
+    def test_backfill(self):
+        files = {f"/iiif/{index}/info.json": info_json(100, 50) for index in range(3)}
+        with LocalServer(files) as server:
+            for index in range(3):
+                DeckImageIIIF.objects.create(base_url=server.url(f"/iiif/{index}"))
+            # The worker threads keep the image information in the database
+            with mock.patch("imagedeck.settings.IMAGEDECK_INFO_JSON_DB", True):
+                updated, missing = backfill_dimensions(workers=4)
+        self.assertEqual((updated, missing), (3, 0))
+        self.assertEqual(DeckCachedDocument.objects.count(), 3)
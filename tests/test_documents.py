@@ -0,0 +1,244 @@
+import json
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from imagedeck.documents import (
+    cached_info_json,
+    clear_parsed,
+    fetch_document,
+    fetch_info_json,
+    fetch_json,
+    info_json_cache_key,
+)
+from imagedeck.iiif import IIIFImageInfo
+from imagedeck.models import DeckCachedDocument, DeckIIIF, DeckImageIIIF
+
+from .server import LocalServer
+
+
+def manifest(*service_ids):
+    canvases = [
+        {
+            "@type": "sc:Canvas",
+            "images": [
+                {
+                    "@type": "oa:Annotation",
+                    "resource": {
+                        "@type": "dctypes:Image",
+                        "service": {"@id": service_id},
+                    },
+                }
+            ],
+        }
+        for service_id in service_ids
+    ]
+    data = {"@type": "sc:Manifest", "sequences": [{"canvases": canvases}]}
+    return ("application/json", json.dumps(data).encode())
+
+
+class FetchDocumentTest(TestCase):
+    def setUp(self):
+        clear_parsed()
+        self.server = LocalServer({"/manifest.json": manifest("http://a", "http://b")})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.url = self.server.url("/manifest.json")
+
+    def test_ttl(self):
+        document = fetch_document(self.url, ttl=60)
+        self.assertEqual(json.loads(document.body)["@type"], "sc:Manifest")
+        self.assertTrue(document.etag)
+        fetch_document(self.url, ttl=60)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_revalidate(self):
+        first = fetch_json(self.url, ttl=0)
+        second = fetch_json(self.url, ttl=0)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(
+            self.server.requests[1]["headers"]["If-None-Match"],
+            DeckCachedDocument.objects.get(url=self.url).etag,
+        )
+        # The manifest hasn't changed so it isn't parsed again
+        self.assertIs(first, second)
+
+        self.server.files["/manifest.json"] = manifest("http://c")
+        third = fetch_json(self.url, ttl=0)
+        self.assertIsNot(first, third)
+        self.assertEqual(
+            third["sequences"][0]["canvases"][0]["images"][0]["resource"]["service"],
+            {"@id": "http://c"},
+        )
+
+    def test_memoized(self):
+        first = fetch_json(self.url, ttl=60)
+        with self.assertNumQueries(0):
+            self.assertIs(fetch_json(self.url, ttl=60), first)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_unreachable(self):
+        fetch_document(self.url)
+        self.server.files.clear()
+        self.assertEqual(fetch_document(self.url, refresh=True).url, self.url)
+
+    def test_deck(self):
+        deck = DeckIIIF.objects.create(name="Manifest", manifest_url=self.url)
+        self.assertEqual(deck.image_base_urls(), ["http://a", "http://b"])
+        self.assertEqual(deck.image_base_urls(), ["http://a", "http://b"])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(deck.images.count(), 2)
+
+
+def info_json(width=4000, height=3000, sizes=((250, 188), (1000, 750), (2000, 1500))):
+    data = {
+        "@context": "http://iiif.io/api/image/2/context.json",
+        "width": width,
+        "height": height,
+        "sizes": [dict(width=w, height=h) for w, h in sizes],
+        "tiles": [dict(width=512, scaleFactors=[1, 2, 4, 8])],
+    }
+    return ("application/json", json.dumps(data).encode())
+
+
+def run_now(function, *args, **kwargs):
+    function(*args, **kwargs)
+
+
+class InfoJsonTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.server = LocalServer({"/image/info.json": info_json()})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.base_url = self.server.url("/image")
+        self.url = self.server.url("/image/info.json")
+
+    def test_shared(self):
+        images = [
+            DeckImageIIIF.objects.create(base_url=self.base_url) for _ in range(3)
+        ]
+        images.append(
+            DeckImageIIIF.objects.create(
+                base_url=self.base_url, region="pct:0,0,50,100"
+            )
+        )
+        for image in images:
+            self.assertEqual(image.get_info_json()["width"], 4000)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_while_revalidate(self):
+        fetch_info_json(self.url)
+        self.server.files["/image/info.json"] = info_json(width=5000)
+
+        # Within the TTL the cached copy is used without a request
+        with mock.patch("imagedeck.settings.IMAGEDECK_INFO_JSON_TTL", 60):
+            self.assertEqual(fetch_info_json(self.url)["width"], 4000)
+        self.assertEqual(len(self.server.requests), 1)
+
+        # Stale copies are returned while they are revalidated
+        with mock.patch("imagedeck.settings.IMAGEDECK_INFO_JSON_TTL", 0), mock.patch(
+            "imagedeck.documents.run_in_background", run_now
+        ):
+            self.assertEqual(fetch_info_json(self.url)["width"], 4000)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(fetch_info_json(self.url)["width"], 5000)
+        self.assertIsNone(
+            caches["default"].get(info_json_cache_key(self.url) + ":refreshing")
+        )
+
+    def test_revalidate_failure(self):
+        fetch_info_json(self.url)
+        self.server.files.clear()
+        key = info_json_cache_key(self.url)
+        with mock.patch("imagedeck.settings.IMAGEDECK_INFO_JSON_TTL", 0), mock.patch(
+            "imagedeck.documents.run_in_background", run_now
+        ):
+            with self.assertLogs("imagedeck.documents", "WARNING"):
+                self.assertEqual(fetch_info_json(self.url)["width"], 4000)
+            # The marker is left so that it isn't tried again until it expires
+            self.assertTrue(caches["default"].get(key + ":refreshing"))
+            self.assertEqual(fetch_info_json(self.url)["width"], 4000)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_expired(self):
+        fetch_info_json(self.url)
+        # Copies older than the TTL and the stale period are evicted from the cache
+        caches["default"].delete(info_json_cache_key(self.url))
+        fetch_info_json(self.url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_database(self):
+        with mock.patch("imagedeck.settings.IMAGEDECK_INFO_JSON_DB", True):
+            fetch_info_json(self.url)
+            caches["default"].clear()
+            fetch_info_json(self.url)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(self.server.requests[1]["headers"]["If-None-Match"])
+        self.assertTrue(DeckCachedDocument.objects.filter(url=self.url).exists())
+
+    def test_snap_width(self):
+        image = DeckImageIIIF.objects.create(base_url=self.base_url)
+        # Without a cached info.json the width is used as it is
+        self.assertIsNone(cached_info_json(self.url))
+        self.assertEqual(
+            image.url(width=600), f"{self.base_url}/full/600,/0/default.jpg"
+        )
+        self.assertEqual(len(self.server.requests), 0)
+
+        image.get_info()
+        self.assertEqual(
+            image.url(width=600), f"{self.base_url}/full/1000,/0/default.jpg"
+        )
+        self.assertEqual(
+            image.url(width=5000), f"{self.base_url}/full/5000,/0/default.jpg"
+        )
+        self.assertEqual(
+            image.url(width=600, height=600),
+            f"{self.base_url}/full/600,600/0/default.jpg",
+        )
+        self.assertEqual(
+            image.srcset([200, 250, 600, 900]),
+            f"{self.base_url}/full/250,/0/default.jpg 250w, "
+            f"{self.base_url}/full/1000,/0/default.jpg 1000w",
+        )
+
+        region = DeckImageIIIF.objects.create(
+            base_url=self.base_url, region="pct:0,0,50,100"
+        )
+        self.assertEqual(
+            region.url(width=600), f"{self.base_url}/pct:0,0,50,100/600,/0/default.jpg"
+        )
+
+
+class IIIFImageInfoTest(TestCase):
+    def test_info(self):
+        info = IIIFImageInfo(
+            {
+                "width": 4000,
+                "height": 3000,
+                "sizes": [
+                    {"width": 1000, "height": 750},
+                    {"width": 250, "height": 188},
+                ],
+                "tiles": [{"width": 512, "scaleFactors": [1, 2, 4]}],
+            }
+        )
+        self.assertEqual(info.width, 4000)
+        self.assertEqual(info.height, 3000)
+        self.assertEqual(info.sizes, [(250, 188), (1000, 750)])
+        self.assertEqual(
+            info.tiles, [dict(width=512, height=512, scaleFactors=[1, 2, 4])]
+        )
+        self.assertEqual(info.snap_width(100), 250)
+        self.assertEqual(info.snap_width("250"), 250)
+        self.assertEqual(info.snap_width(251), 1000)
+        self.assertEqual(info.snap_width(1200), 1200)
+
+    def test_empty(self):
+        info = IIIFImageInfo({})
+        self.assertEqual(info.sizes, [])
+        self.assertEqual(info.tiles, [])
+        self.assertEqual(info.snap_width(300), 300)
@@ -0,0 +1,34 @@
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase
+
+from imagedeck.formats import accepted_mime_types, negotiate_format
+
+CHROME_ACCEPT = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+
+
+class NegotiateFormatTest(SimpleTestCase):
+    def test_accepted_mime_types(self):
+        self.assertEqual(
+            accepted_mime_types("image/webp;q=0.9, image/avif;q=0, */*"),
+            {"image/webp", "*/*"},
+        )
+
+    @mock.patch("imagedeck.settings.IMAGEDECK_RENDITION_FORMATS", ["avif", "webp"])
+    def test_preference(self):
+        self.assertEqual(negotiate_format(CHROME_ACCEPT), "avif")
+        self.assertEqual(negotiate_format("image/webp,*/*"), "webp")
+
+    @mock.patch("imagedeck.settings.IMAGEDECK_RENDITION_FORMATS", ["webp"])
+    def test_setting(self):
+        self.assertEqual(negotiate_format(CHROME_ACCEPT), "webp")
+
+    def test_fallback(self):
+        self.assertEqual(negotiate_format("image/*,*/*;q=0.8"), "")
+        self.assertEqual(negotiate_format(""), "")
+        self.assertEqual(negotiate_format(None), "")
+
+    def test_request(self):
+        request = RequestFactory().get("/", HTTP_ACCEPT="image/webp,*/*")
+        self.assertEqual(negotiate_format(request), "webp")
+        self.assertEqual(negotiate_format(RequestFactory().get("/")), "")
@@ -0,0 +1,176 @@
+import json
+
+from django.test import SimpleTestCase
+
+from imagedeck.iiif import (
+    IIIFImageRecord,
+    iiif_image_records,
+    iiif_label,
+    images_in_iiif_json,
+    iter_json_events,
+)
+
+from .test_models import iiif_manifest
+
+
+def iiif_manifest_v3(count):
+    canvases = [
+        {
+            "id": f"http://www.example.org/canvas/{index}",
+            "type": "Canvas",
+            "label": {"en": [f"Page {index}"]},
+            "width": 2000,
+            "height": 3000,
+            "items": [
+                {
+                    "type": "AnnotationPage",
+                    "items": [
+                        {
+                            "type": "Annotation",
+                            "motivation": "painting",
+                            "body": {
+                                "id": f"http://www.example.org/iiif/{index}/full/max/0/default.jpg",
+                                "type": "Image",
+                                "service": [
+                                    {
+                                        "id": f"http://www.example.org/iiif/{index}",
+                                        "type": "ImageService3",
+                                    }
+                                ],
+                            },
+                            "target": f"http://www.example.org/canvas/{index}",
+                        }
+                    ],
+                }
+            ],
+        }
+        for index in range(1, count + 1)
+    ]
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "type": "Manifest",
+        "label": {"en": ["A manifest"]},
+        "items": canvases,
+        "structures": [
+            {
+                "type": "Range",
+                "items": [{"id": "http://www.example.org/canvas/1", "type": "Canvas"}],
+            }
+        ],
+    }
+
+
+class IIIFImageRecordsTest(SimpleTestCase):
+    def test_v2(self):
+        manifest = iiif_manifest(2)
+        expected = [
+            IIIFImageRecord(
+                "http://www.example.org/image-service/image1", 1001, 1500, "f. 1r"
+            ),
+            IIIFImageRecord(
+                "http://www.example.org/image-service/image2", 1002, 1500, "f. 2r"
+            ),
+        ]
+        self.assertEqual(list(iiif_image_records(manifest)), expected)
+        self.assertEqual(list(iiif_image_records(json.dumps(manifest))), expected)
+        self.assertEqual(
+            images_in_iiif_json(manifest),
+            [record.service_id for record in expected],
+        )
+
+    def test_v2_choice(self):
+        manifest = iiif_manifest(1)
+        annotation = manifest["sequences"][0]["canvases"][0]["images"][0]
+        annotation["resource"] = {
+            "@type": "oa:Choice",
+            "default": annotation["resource"],
+            "item": [{"@type": "dctypes:Image", "service": {"@id": "http://other"}}],
+        }
+        self.assertEqual(
+            [record.service_id for record in iiif_image_records(manifest)],
+            ["http://www.example.org/image-service/image1"],
+        )
+
+    def test_v3(self):
+        manifest = iiif_manifest_v3(3)
+        expected = [
+            IIIFImageRecord(
+                f"http://www.example.org/iiif/{index}", 2000, 3000, f"Page {index}"
+            )
+            for index in range(1, 4)
+        ]
+        self.assertEqual(list(iiif_image_records(manifest)), expected)
+        self.assertEqual(list(iiif_image_records(json.dumps(manifest))), expected)
+
+    def test_streamed_in_small_chunks(self):
+        manifest = iiif_manifest_v3(3)
+        manifest["items"][0]["label"] = {"fr": ["Côté écrit – ✓"]}
+        data = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        chunks = (data[start : start + 7] for start in range(0, len(data), 7))
+        records = list(iiif_image_records(chunks))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0].label, "Côté écrit – ✓")
+
+    def test_list_of_chunks(self):
+        manifest = iiif_manifest_v3(3)
+        for data in [json.dumps(manifest), json.dumps(manifest).encode("utf-8")]:
+            chunks = [data[start : start + 10] for start in range(0, len(data), 10)]
+            self.assertEqual(
+                list(iiif_image_records(chunks)), list(iiif_image_records(manifest))
+            )
+        # A list of parsed JSON objects isn't taken to be chunks
+        self.assertEqual(len(list(iiif_image_records([manifest]))), 3)
+
+    def test_yields_before_the_end(self):
+        data = json.dumps(iiif_manifest(100))
+        consumed = []
+
+        def chunks():
+            for start in range(0, len(data), 1024):
+                consumed.append(start)
+                yield data[start : start + 1024]
+
+        first = next(iiif_image_records(chunks()))
+        self.assertEqual(
+            first.service_id, "http://www.example.org/image-service/image1"
+        )
+        self.assertLess(len(consumed) * 1024, len(data) / 10)
+
+    def test_deeply_nested(self):
+        depth = 100000
+        data = '{"a": ' + "[" * depth + "]" * depth + "}"
+        self.assertEqual(list(iiif_image_records(data)), [])
+
+    def test_label(self):
+        self.assertEqual(iiif_label([{"@value": "a"}, "b"]), "a b")
+        self.assertEqual(iiif_label({"en": ["a", "b"]}), "a b")
+        self.assertEqual(iiif_label(None), "")
+
+
+class JSONEventsTest(SimpleTestCase):
+    def test_events(self):
+        data = '{"a": [1, -2.5e3, "x\\"y", true, false, null], "b": {}}'
+        events = list(iter_json_events(data[i : i + 3] for i in range(0, len(data), 3)))
+        self.assertEqual(
+            events,
+            [
+                ("start_map", None),
+                ("map_key", "a"),
+                ("start_array", None),
+                ("value", 1),
+                ("value", -2500.0),
+                ("value", 'x"y'),
+                ("value", True),
+                ("value", False),
+                ("value", None),
+                ("end_array", None),
+                ("map_key", "b"),
+                ("start_map", None),
+                ("end_map", None),
+                ("end_map", None),
+            ],
+        )
+
+    def test_incomplete(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_events(['{"a": [1, 2']))
@@ -1,11 +1,29 @@
-from django.test import TestCase
+import json
+import tempfile
+from io import BytesIO
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.files import File as DjangoFile
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from imagekit.cachefiles.backends import BaseAsync
+from PIL import Image
 from django.template import Context, Template
+from django.forms import inlineformset_factory, modelform_factory
 from django.test import RequestFactory
 
 from .models import TestModel, ImageDeckModel
 from .views import TestListView
-from django.db import models
+from django.db import connection, models
 
+from imagedeck.admin import DeckMembershipFormSet
+from imagedeck.cachefiles import cachefile_exists
+from imagedeck.checks import check_thumbnail_backend
+from imagedeck.contactsheets import render_sheet as render_sheet_function
+from imagedeck.processors import draft_pil_image
 from imagedeck.models import (
     Deck,
     DeckBase,
@@ -13,9 +31,24 @@ from imagedeck.models import (
     DeckImageBase,
     DeckImageIIIF,
     DeckIIIF,
+    DeckImage,
+    DeckImageExternal,
+    DeckLicence,
+    DeckMembership,
+    DeckRendition,
+    import_django_file,
 )
 
 
+def create_filer_image(name, size=(40, 30)):
+    """Creates a small image in Django Filer and returns its DeckImageFiler."""
+    data = BytesIO()
+    Image.new("RGB", size, color="red").save(data, format="JPEG")
+    data.seek(0)
+    filer_image = import_django_file(DjangoFile(data, name=name), folder=None)
+    return filer_image.deckimagefiler
+
+
 class DeckTest(TestCase):
     def test_create(self):
         deck_base = DeckBase.objects.create(name="test deck2")
@@ -66,6 +99,49 @@ class DeckImageIIIFTest(TestCase):
             images[1].url(),
         )
 
+    def test_split_dimensions(self):
+        self.image.set_size(3000, 2000)
+        self.image.save()
+        images = self.image.split(width_pct=60)
+        for image in images:
+            self.assertEqual((image.width, image.height), (1800, 2000))
+            self.assertEqual(image.aspect_ratio, 0.9)
+
+        # Splitting again reuses the same images
+        self.assertEqual(
+            [image.pk for image in self.image.split(width_pct=60)],
+            [image.pk for image in images],
+        )
+
+    def test_split_fetch_dimensions(self):
+        images = self.image.split(width_pct=60)
+        info_json = {"width": 3000, "height": 2000}
+        with mock.patch.object(DeckImageIIIF, "get_info_json", return_value=info_json):
+            for image in images:
+                self.assertEqual(image.fetch_dimensions(), (1800, 2000))
+
+                image.set_dimensions()
+                image.refresh_from_db()
+                self.assertEqual((image.width, image.height), (1800, 2000))
+
+    def test_region_dimensions(self):
+        for region, dimensions in [
+            ("full", (3000, 2000)),
+            ("square", (2000, 2000)),
+            ("pct:25,0,50,50", (1500, 1000)),
+            ("100,100,500,400", (500, 400)),
+            ("2800,0,500,400", (200, 400)),
+        ]:
+            self.image.region = region
+            self.assertEqual(self.image.region_dimensions(3000, 2000), dimensions)
+
+    def test_split_rtl(self):
+        images = self.image.split(rtl=True)
+        self.assertEqual(
+            [image.region for image in images],
+            ["pct:50,0,100,100", "pct:0,0,50,100"],
+        )
+
 
 class DeckIIIFTest(TestCase):
     def setUp(self):
@@ -97,3 +173,735 @@ class DeckIIIFTest(TestCase):
                 gold_url,
                 image.url(),
             )
+
+    def test_split_queries(self):
+        def split_queries(count):
+            deck = DeckIIIF.objects.create(name=f"Deck {count}")
+            deck.add_images(
+                DeckImageIIIF.objects.create(
+                    base_url=f"http://www.example.org/image-service/{count}/{index}",
+                    width=2000,
+                    height=1500,
+                )
+                for index in range(count)
+            )
+            with CaptureQueriesContext(connection) as context:
+                new_deck = deck.split()
+            self.assertEqual(new_deck.images.count(), count * 2)
+            return len(context.captured_queries)
+
+        self.assertEqual(split_queries(5), split_queries(50))
+
+    def test_split_mixed(self):
+        external = DeckImageExternal.objects.create(
+            external_url="http://www.example.org/image.jpg"
+        )
+        deck = Deck.objects.create(name="Mixed")
+        deck.add_images([self.images[0], external, self.images[1]])
+        new_deck = deck.split()
+        self.assertEqual(
+            [image.url() for image in new_deck.images_ordered()],
+            [
+                "http://www.example.org/image-service/image1/pct:0,0,50,100/full/0/default.jpg",
+                "http://www.example.org/image-service/image1/pct:50,0,100,100/full/0/default.jpg",
+                "http://www.example.org/image.jpg",
+                "http://www.example.org/image-service/image2/pct:0,0,50,100/full/0/default.jpg",
+                "http://www.example.org/image-service/image2/pct:50,0,100,100/full/0/default.jpg",
+            ],
+        )
+
+
+def iiif_manifest(count, prefix="http://www.example.org/image-service/image"):
+    canvases = [
+        {
+            "@type": "sc:Canvas",
+            "label": f"f. {index}r",
+            "width": 2000,
+            "height": 3000,
+            "images": [
+                {
+                    "@type": "oa:Annotation",
+                    "motivation": "sc:painting",
+                    "resource": {
+                        "@type": "dctypes:Image",
+                        "width": 1000 + index,
+                        "height": 1500,
+                        "service": {"@id": f"{prefix}{index}"},
+                    },
+                }
+            ],
+        }
+        for index in range(1, count + 1)
+    ]
+    return {"@type": "sc:Manifest", "sequences": [{"canvases": canvases}]}
+
+
+class DeckIIIFManifestTest(TestCase):
+    def import_manifest(self, manifest, name="Manifest"):
+        with mock.patch.object(
+            DeckIIIF, "get_manifest_text", return_value=json.dumps(manifest)
+        ):
+            deck = DeckIIIF.objects.create(
+                name=name, manifest_url="http://www.example.org/manifest.json"
+            )
+        return deck
+
+    def test_import(self):
+        existing = DeckImageIIIF.objects.create(
+            base_url="http://www.example.org/image-service/image2"
+        )
+        manifest = iiif_manifest(3)
+        # A repeated image is only added once
+        manifest["sequences"][0]["canvases"].append(
+            manifest["sequences"][0]["canvases"][0]
+        )
+        deck = self.import_manifest(manifest)
+
+        images = list(deck.images_ordered())
+        self.assertEqual(
+            [image.base_url for image in images],
+            [
+                f"http://www.example.org/image-service/image{index}"
+                for index in (1, 2, 3)
+            ],
+        )
+        self.assertEqual(images[1].pk, existing.pk)
+        self.assertTrue(all(isinstance(image, DeckImageIIIF) for image in images))
+        self.assertEqual(
+            [(image.width, image.height, image.label) for image in images],
+            [(1001, 1500, "f. 1r"), (1002, 1500, "f. 2r"), (1003, 1500, "f. 3r")],
+        )
+        self.assertEqual(images[0].aspect_ratio, 1001 / 1500)
+        self.assertEqual(images[0].get_caption(), "f. 1r.")
+
+        with mock.patch("requests.get") as get:
+            self.assertEqual(images[2].get_width(), 1003)
+        get.assert_not_called()
+
+    def test_constant_queries(self):
+        queries = []
+        # The first import also looks up and caches content types
+        for count in (1, 5, 50):
+            with CaptureQueriesContext(connection) as context:
+                deck = self.import_manifest(
+                    iiif_manifest(count, prefix=f"http://{count}/")
+                )
+            self.assertEqual(deck.images.count(), count)
+            queries.append(len(context))
+        self.assertEqual(queries[1], queries[2])
+
+
+class DeckAddImagesTest(TestCase):
+    def setUp(self):
+        self.deck = Deck.objects.create(name="Test Deck")
+        self.images = [
+            DeckImageIIIF.objects.create(
+                base_url=f"http://www.example.org/image-service/image{i}"
+            )
+            for i in range(10)
+        ]
+
+    def test_add_images(self):
+        self.deck.add_image(self.images[0])
+        with self.assertNumQueries(7):
+            memberships = self.deck.add_images(self.images, primary=True)
+        self.assertEqual(len(memberships), 9)
+        self.assertEqual(
+            [membership.rank for membership in self.deck.memberships()],
+            [i * 1024 for i in range(1, 11)],
+        )
+        self.assertEqual(self.deck.primary_image(), self.images[1])
+
+    def test_add_images_ranks(self):
+        self.deck.add_images(self.images[:3], ranks=[5, None, 2])
+        self.assertEqual(
+            list(self.deck.memberships().values_list("image_id", "rank")),
+            [
+                (self.images[2].id, 2),
+                (self.images[0].id, 5),
+                (self.images[1].id, 1029),
+            ],
+        )
+
+    def test_add_image_existing(self):
+        membership = self.deck.add_image(self.images[0])
+        self.assertEqual(self.deck.add_image(self.images[0]).id, membership.id)
+        self.assertEqual(self.deck.add_image(self.images[0], rank=7).rank, 7)
+        self.assertEqual(self.deck.memberships().count(), 1)
+
+    def test_add_images_ranks_length(self):
+        with self.assertRaises(ValueError):
+            self.deck.add_images(self.images, ranks=[1])
+
+
+class DeckReorderTest(TestCase):
+    def setUp(self):
+        self.deck = Deck.objects.create(name="Test Deck")
+        self.images = [
+            DeckImageIIIF.objects.create(
+                base_url=f"http://www.example.org/image-service/image{i}"
+            )
+            for i in range(4)
+        ]
+        self.deck.add_images(self.images[:3])
+
+    def image_ids(self):
+        return list(self.deck.memberships().values_list("image_id", flat=True))
+
+    def test_move_image(self):
+        a, b, c, _ = self.images
+        self.deck.move_image(c, after=a)
+        self.assertEqual(self.image_ids(), [a.id, c.id, b.id])
+        self.deck.move_image(a, before=b)
+        self.assertEqual(self.image_ids(), [c.id, a.id, b.id])
+        with self.assertRaises(ValueError):
+            self.deck.move_image(a)
+
+    def test_insert_image(self):
+        a, b, c, d = self.images
+        self.deck.insert_image(d, 1)
+        self.assertEqual(self.image_ids(), [a.id, d.id, b.id, c.id])
+        self.deck.insert_image(a, 10)
+        self.assertEqual(self.image_ids(), [d.id, b.id, c.id, a.id])
+        self.deck.insert_image(c, 0)
+        self.assertEqual(self.image_ids(), [c.id, d.id, b.id, a.id])
+
+    def test_rebalance(self):
+        a, b, c, _ = self.images
+        self.deck.memberships().filter(image=b).update(rank=1025)
+        self.deck.move_image(c, after=a)
+        self.assertEqual(self.image_ids(), [a.id, c.id, b.id])
+        self.assertEqual(
+            list(self.deck.memberships().values_list("rank", flat=True)),
+            [1024, 1536, 2048],
+        )
+
+
+class DeckMembershipPositionTest(TestCase):
+    def setUp(self):
+        self.deck = Deck.objects.create(name="Test Deck")
+        self.deck.add_images(
+            DeckImageIIIF.objects.create(
+                base_url=f"http://www.example.org/image-service/image{i}"
+            )
+            for i in range(5)
+        )
+
+    def test_with_position(self):
+        with self.assertNumQueries(1):
+            memberships = list(self.deck.memberships().with_position())
+            self.assertEqual(
+                [membership.index() for membership in memberships], list(range(5))
+            )
+            self.assertEqual({membership.total for membership in memberships}, {5})
+
+    def test_index_without_position(self):
+        membership = self.deck.memberships()[3]
+        self.assertEqual(membership.index(), 3)
+
+
+class DeckNavigationTest(TestCase):
+    def setUp(self):
+        self.deck = Deck.objects.create(name="Test Deck")
+        self.images = [
+            DeckImageIIIF.objects.create(
+                base_url=f"http://www.example.org/image-service/image{i}"
+            )
+            for i in range(6)
+        ]
+        self.deck.add_images(self.images)
+        other_deck = Deck.objects.create(name="Other Deck")
+        other_deck.add_images(reversed(self.images))
+
+    def test_neighbours(self):
+        self.assertEqual(self.deck.neighbours(self.images[3]), self.images[2:5])
+        self.assertEqual(
+            self.deck.neighbours(self.images[1], before=2, after=2), self.images[:4]
+        )
+        self.assertEqual(
+            self.deck.neighbours(self.images[5], before=0), [self.images[5]]
+        )
+        outsider = DeckImageIIIF.objects.create(base_url="http://www.example.org/x")
+        self.assertEqual(self.deck.neighbours(outsider), [])
+
+    def test_next_previous(self):
+        self.assertEqual(self.deck.next_image(self.images[2]), self.images[3])
+        self.assertEqual(self.deck.previous_image(self.images[2]), self.images[1])
+        self.assertIsNone(self.deck.next_image(self.images[5]))
+        self.assertIsNone(self.deck.previous_image(self.images[0]))
+
+    def test_images_before_after(self):
+        self.assertEqual(list(self.deck.images_before(self.images[2])), self.images[:2])
+        self.assertEqual(list(self.deck.images_after(self.images[2])), self.images[3:])
+
+
+class DeckPrimaryImageTest(TestCase):
+    def setUp(self):
+        self.decks = [Deck.objects.create(name=f"Test Deck {i}") for i in range(3)]
+        self.images = [
+            DeckImageIIIF.objects.create(
+                base_url=f"http://www.example.org/image-service/image{i}"
+            )
+            for i in range(3)
+        ]
+        for deck in self.decks:
+            deck.add_images(self.images)
+
+    def test_primary_image(self):
+        deck = self.decks[0]
+        self.assertEqual(deck.primary_image(), self.images[0])
+        deck.set_primary_image(self.images[2])
+        self.assertEqual(deck.primary_image(), self.images[2])
+        deck.set_primary_image(self.images[1])
+        self.assertEqual(deck.primary_image(), self.images[1])
+        self.assertEqual(deck.memberships().filter(primary=True).count(), 1)
+
+        deck = Deck.objects.get(pk=deck.pk)
+        self.assertEqual(deck.primary_membership.image, self.images[1])
+
+    def test_unset_primary(self):
+        deck = self.decks[0]
+        membership = deck.set_primary_image(self.images[2])
+        membership.primary = False
+        membership.save()
+        self.assertIsNone(deck.primary_membership)
+        self.assertIsNone(Deck.objects.get(pk=deck.pk).primary_membership)
+
+    def test_form_swap_primary(self):
+        deck = self.decks[0]
+        deck.set_primary_image(self.images[0])
+        Form = modelform_factory(
+            DeckMembership, fields=("deck", "image", "rank", "primary")
+        )
+        membership = deck.deckmembership_set.get(image=self.images[1])
+        data = dict(
+            deck=deck.pk, image=membership.image_id, rank=membership.rank, primary=True
+        )
+        form = Form(data, instance=membership)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(Deck.objects.get(pk=deck.pk).primary_image(), self.images[1])
+        self.assertEqual(deck.memberships().filter(primary=True).count(), 1)
+
+    def test_inline_formset_primary(self):
+        deck = self.decks[0]
+        deck.set_primary_image(self.images[0])
+        FormSet = inlineformset_factory(
+            DeckBase,
+            DeckMembership,
+            formset=DeckMembershipFormSet,
+            fields=("image", "rank", "primary"),
+            extra=0,
+        )
+        memberships = list(deck.deckmembership_set.order_by("rank"))
+
+        def data(primary):
+            data = {
+                "deckmembership_set-TOTAL_FORMS": len(memberships),
+                "deckmembership_set-INITIAL_FORMS": len(memberships),
+            }
+            for index, membership in enumerate(memberships):
+                prefix = f"deckmembership_set-{index}-"
+                data[prefix + "id"] = membership.pk
+                data[prefix + "deck"] = deck.pk
+                data[prefix + "image"] = membership.image_id
+                data[prefix + "rank"] = membership.rank
+                if index in primary:
+                    data[prefix + "primary"] = "on"
+            return data
+
+        formset = FormSet(data=data({0, 2}), instance=deck)
+        self.assertFalse(formset.is_valid())
+
+        formset = FormSet(data=data({2}), instance=deck)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        formset.save()
+        self.assertEqual(Deck.objects.get(pk=deck.pk).primary_image(), self.images[2])
+        self.assertEqual(deck.memberships().filter(primary=True).count(), 1)
+
+    def test_with_primary_image(self):
+        for deck, image in zip(self.decks, reversed(self.images)):
+            deck.set_primary_image(image)
+
+        with self.assertNumQueries(5):
+            decks = list(DeckBase.objects.with_primary_image())
+            covers = [deck.primary_image() for deck in decks]
+        self.assertEqual(covers, list(reversed(self.images)))
+
+    def test_with_primary_image_fallback(self):
+        # Decks without a primary image use their first image
+        self.decks[0].set_primary_image(self.images[2])
+        self.decks[1].move_image(self.images[0], after=self.images[1])
+        empty = Deck.objects.create(name="Test Deck 3")
+
+        with self.assertNumQueries(7):
+            decks = list(DeckBase.objects.with_primary_image())
+            covers = [deck.primary_image() for deck in decks]
+        self.assertEqual(covers, [self.images[2], self.images[1], self.images[0], None])
+
+    def test_save_without_primary_change(self):
+        membership = self.decks[0].deckmembership_set.get(image=self.images[1])
+        membership.rank += 1
+        with self.assertNumQueries(1):
+            membership.save()
+        # Moving an image only writes its membership
+        with CaptureQueriesContext(connection) as context:
+            self.decks[0].move_image(self.images[0], after=self.images[2])
+        updates = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("imagedeck_deckmembership", updates[0])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeckImagesForDisplayTest(TestCase):
+    def setUp(self):
+        self.licence = DeckLicence.objects.create(
+            name="CC-BY", logo="http://www.example.org/logo.png", info="http://x.org"
+        )
+        self.deck = Deck.objects.create(name="Test Deck")
+
+    def add_images(self, count):
+        images = []
+        for i in range(count):
+            image = create_filer_image(f"filer{self.deck.images.count()}.jpg")
+            image.licence = self.licence
+            image.save()
+            images.append(image)
+            images.append(
+                DeckImageIIIF.objects.create(
+                    base_url=f"http://www.example.org/{self.deck.images.count()}",
+                    width=100,
+                    height=100,
+                    licence=self.licence,
+                )
+            )
+        self.deck.add_images(images)
+
+    def assertDisplayQueries(self, number):
+        # Generate the thumbnails first so that only reading them is counted
+        for image in self.deck.images_for_display():
+            image.thumbnail()
+
+        with self.assertNumQueries(number):
+            for image in self.deck.images_for_display():
+                image.get_caption()
+                image.get_width()
+                image.get_height()
+                image.thumbnail()
+
+    def test_images_for_display(self):
+        self.add_images(1)
+        self.assertDisplayQueries(6)
+        self.add_images(4)
+        self.assertDisplayQueries(6)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeckRenditionTest(TestCase):
+    def setUp(self):
+        self.image = create_filer_image("rendition.jpg", size=(80, 60))
+
+    def test_url_uses_registry(self):
+        url = self.image.url(width=40)
+        self.assertEqual(DeckRendition.objects.count(), 1)
+        rendition = DeckRendition.objects.get()
+        self.assertEqual(rendition.url, url)
+        self.assertEqual(
+            (rendition.rendition_width, rendition.rendition_height), (40, 30)
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.image.url(width=40), url)
+
+    def test_large_source_is_reduced(self):
+        image = create_filer_image("large.jpg", size=(1600, 1200))
+        image.url(width=100)
+        rendition = DeckRendition.objects.get(image=image)
+        self.assertEqual(
+            (rendition.rendition_width, rendition.rendition_height), (100, 75)
+        )
+
+    def test_subject_location_invalidates(self):
+        self.image.url(width=40)
+        self.image.filer_image.subject_location = "10,10"
+        self.image.filer_image.save()
+        self.assertEqual(DeckRendition.objects.count(), 0)
+        self.image.url(width=40)
+        self.assertEqual(DeckRendition.objects.get().subject_location, "10,10")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SrcsetTest(TestCase):
+    def test_iiif_srcset(self):
+        image = DeckImageIIIF.objects.create(base_url="http://www.example.org/iiif/a")
+        self.assertEqual(
+            image.srcset([320, 640]),
+            "http://www.example.org/iiif/a/full/320,/0/default.jpg 320w, "
+            "http://www.example.org/iiif/a/full/640,/0/default.jpg 640w",
+        )
+
+    def test_filer_srcset_single_decode(self):
+        image = create_filer_image("pyramid.jpg", size=(1600, 1200))
+        with mock.patch(
+            "imagedeck.processors.draft_pil_image", wraps=draft_pil_image
+        ) as draft:
+            srcset = image.srcset([100, 400, 200])
+        self.assertEqual(draft.call_count, 1)
+        self.assertEqual(srcset.count("w, "), 2)
+        renditions = image.get_renditions([100, 200, 400])
+        self.assertEqual(
+            {
+                width: (rendition.rendition_width, rendition.rendition_height)
+                for width, rendition in renditions.items()
+            },
+            {100: (100, 75), 200: (200, 150), 400: (400, 300)},
+        )
+        self.assertEqual(
+            image.srcset([100, 200, 400]).split(", ")[0].split()[-1], "100w"
+        )
+
+    def test_deck_image_srcset(self):
+        data = BytesIO()
+        Image.new("RGB", (800, 600), color="green").save(data, format="JPEG")
+        image = DeckImage(image=ContentFile(data.getvalue(), name="srcset.jpg"))
+        image.save()
+        # The original is the only version so it is listed once at its own width
+        self.assertEqual(image.srcset([100, 200, 400]), f"{image.image.url} 800w")
+
+    def test_template_tag(self):
+        image = DeckImageIIIF.objects.create(base_url="http://www.example.org/iiif/a")
+        template = Template(
+            '{% load imagedeck %}<img {% deck_image_srcset image widths="320,640" %}>'
+        )
+        html = template.render(Context({"image": image}))
+        self.assertIn(
+            'srcset="http://www.example.org/iiif/a/full/320,/0/default.jpg 320w', html
+        )
+        self.assertIn('sizes="(max-width: 640px) 100vw, 640px"', html)
+
+    def test_filer_formats(self):
+        image = create_filer_image("formats.jpg", size=(800, 600))
+        self.assertTrue(image.url(width=100).endswith(".jpg"))
+        webp = image.get_rendition(width=100, format="webp")
+        self.assertEqual(webp.format, "webp")
+        self.assertTrue(webp.url.endswith(".webp"))
+        self.assertEqual(image.srcset([100, 200], format="webp").count(".webp "), 2)
+        # The default format is still available and recorded separately
+        self.assertTrue(image.url(width=100).endswith(".jpg"))
+        self.assertEqual(image.renditions.filter(width=100).count(), 2)
+
+    def test_template_tag_negotiates_format(self):
+        image = create_filer_image("negotiate.jpg", size=(800, 600))
+        template = Template(
+            '{% load imagedeck %}<img {% deck_image_srcset image widths="100" %}>'
+        )
+        request = RequestFactory().get("/", HTTP_ACCEPT="image/webp,*/*")
+        with mock.patch("imagedeck.settings.IMAGEDECK_RENDITION_FORMATS", ["webp"]):
+            html = template.render(Context({"image": image, "request": request}))
+        self.assertIn(".webp 100w", html)
+
+        html = template.render(Context({"image": image}))
+        self.assertIn(".jpg 100w", html)
+
+
+class QueueingBackend(BaseAsync):
+    """A cache file backend which records generation requests instead of generating files."""
+
+    scheduled = []
+
+    def schedule_generation(self, file, force=False):
+        self.scheduled.append(file.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeckImageThumbnailTest(TestCase):
+    def create_image(self, name):
+        data = BytesIO()
+        Image.new("RGB", (1000, 500), color="green").save(data, format="JPEG")
+        image = DeckImage(image=ContentFile(data.getvalue(), name=name))
+        image.save()
+        return image
+
+    def test_thumbnail(self):
+        image = self.create_image("thumbnail.jpg")
+        url = image.thumbnail()
+        self.assertNotEqual(url, image.image.url)
+        self.assertIn("CACHE", url)
+        with Image.open(image.thumbnail_generator.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (250, 125))
+
+    def test_thumbnail_format(self):
+        image = self.create_image("format.jpg")
+        url = image.thumbnail(format="webp")
+        self.assertTrue(url.endswith(".webp"))
+        self.assertNotEqual(url, image.thumbnail())
+        with Image.open(image.thumbnail_webp.path) as thumbnail:
+            self.assertEqual(thumbnail.format, "WEBP")
+            self.assertEqual(thumbnail.size, (250, 125))
+
+    def test_thumbnail_formats_on_demand(self):
+        image = self.create_image("on-demand.jpg")
+        self.assertTrue(cachefile_exists(image.thumbnail_generator))
+        self.assertFalse(cachefile_exists(image.thumbnail_webp))
+        image.thumbnail(format="webp")
+        self.assertTrue(cachefile_exists(image.thumbnail_webp))
+
+    def test_thumbnail_unavailable_format(self):
+        image = self.create_image("unavailable.jpg")
+        self.assertEqual(image.thumbnail(format="tif"), image.thumbnail())
+
+    @override_settings(
+        IMAGEKIT_DEFAULT_CACHEFILE_BACKEND="tests.test_models.QueueingBackend"
+    )
+    def test_thumbnail_queued(self):
+        image = self.create_image("queued.jpg")
+        QueueingBackend.scheduled.clear()
+        self.assertEqual(
+            image.thumbnail(), "/static/imagedeck/thumbnail-placeholder.svg"
+        )
+        self.assertEqual(QueueingBackend.scheduled, [image.thumbnail_generator.name])
+
+        with mock.patch(
+            "imagedeck.settings.IMAGEDECK_THUMBNAIL_PLACEHOLDER", "/placeholder.png"
+        ):
+            self.assertEqual(image.thumbnail(), "/placeholder.png")
+
+    def test_backend_check(self):
+        self.assertEqual(
+            [warning.id for warning in check_thumbnail_backend(None)],
+            ["imagedeck.W001"],
+        )
+        with override_settings(
+            IMAGEKIT_DEFAULT_CACHEFILE_BACKEND="tests.test_models.QueueingBackend"
+        ):
+            self.assertEqual(check_thumbnail_backend(None), [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DimensionsTest(TestCase):
+    def test_stored_at_ingest(self):
+        filer_image = create_filer_image("dimensions.jpg", size=(80, 40))
+        self.assertEqual((filer_image.width, filer_image.height), (80, 40))
+        self.assertEqual(filer_image.aspect_ratio, 2.0)
+
+    def test_deck_image(self):
+        def jpeg(size):
+            data = BytesIO()
+            Image.new("RGB", size).save(data, format="JPEG")
+            return ContentFile(data.getvalue(), name="dimensions.jpg")
+
+        image = DeckImage(image=jpeg((80, 40)))
+        image.save()
+        self.assertEqual((image.width, image.height, image.aspect_ratio), (80, 40, 2))
+
+        # The file isn't read when an image is loaded, even without dimensions
+        DeckImageBase.objects.filter(pk=image.pk).update(width=0, height=0)
+        with mock.patch("django.core.files.images.get_image_dimensions") as read:
+            image = DeckImage.objects.get(pk=image.pk)
+        read.assert_not_called()
+        self.assertEqual(image.width, 0)
+
+        # They are read when it is saved and when the file is replaced
+        image.save()
+        self.assertEqual((image.width, image.height), (80, 40))
+        image.image = jpeg((30, 60))
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height, image.aspect_ratio), (30, 60, 0.5))
+
+    def test_thumbnail_dimensions_without_io(self):
+        image = DeckImageExternal.objects.create(
+            external_url="http://www.example.org/a.jpg", width=1000, height=500
+        )
+        image = DeckImageBase.objects.get(pk=image.pk)
+        with mock.patch("requests.get") as get, self.assertNumQueries(0):
+            self.assertEqual(image.thumbnail_dimensions(), (250, 125))
+        get.assert_not_called()
+
+    def test_thumbnail_dimensions_unknown(self):
+        image = DeckImageExternal.objects.create(
+            external_url="http://www.example.org/a.jpg"
+        )
+        with mock.patch("requests.get") as get:
+            self.assertEqual(image.thumbnail_dimensions(), (250, 250))
+        get.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContactSheetTest(TestCase):
+    def setUp(self):
+        self.storage = FileSystemStorage(location=tempfile.mkdtemp())
+        self.deck = Deck.objects.create(name="Contact Sheet")
+        self.images = []
+        for index, size in enumerate([(200, 100), (100, 200), (100, 100)]):
+            data = BytesIO()
+            Image.new("RGB", size, color="blue").save(data, format="JPEG")
+            image = DeckImage(image=ContentFile(data.getvalue(), name=f"{index}.jpg"))
+            image.save()
+            self.images.append(image)
+        self.deck.add_images(self.images)
+
+    def contact_sheet(self):
+        return self.deck.contact_sheet(
+            columns=2,
+            images_per_sheet=2,
+            cell_width=50,
+            cell_height=50,
+            storage=self.storage,
+        )
+
+    def test_layout(self):
+        contact_sheet = self.contact_sheet()
+        self.assertEqual(len(contact_sheet["sheets"]), 2)
+        self.assertEqual(
+            [
+                (entry["image"], entry["sheet"], entry["x"], entry["y"])
+                for entry in contact_sheet["images"]
+            ],
+            [
+                (self.images[0].pk, 0, 0, 12),
+                (self.images[1].pk, 0, 62, 0),
+                (self.images[2].pk, 1, 0, 0),
+            ],
+        )
+        self.assertEqual(
+            [(entry["width"], entry["height"]) for entry in contact_sheet["images"]],
+            [(50, 25), (25, 50), (50, 50)],
+        )
+
+        with self.storage.open(contact_sheet["sheets"][0]["name"]) as f:
+            sheet = Image.open(f)
+            self.assertEqual(sheet.size, (100, 50))
+            # The image is drawn in its cell and the rest of the cell is the background
+            red, green, blue = sheet.getpixel((25, 25))
+            self.assertGreater(blue, 200)
+            self.assertLess(red, 50)
+            # The rest of the cell is the background
+            self.assertGreater(min(sheet.getpixel((25, 2))), 200)
+
+    def test_incremental(self):
+        first = self.contact_sheet()
+        with mock.patch("imagedeck.contactsheets.render_sheet") as render_sheet:
+            self.assertEqual(self.contact_sheet(), first)
+        render_sheet.assert_not_called()
+
+        data = BytesIO()
+        Image.new("RGB", (100, 100), color="blue").save(data, format="JPEG")
+        image = DeckImage(image=ContentFile(data.getvalue(), name="new.jpg"))
+        image.save()
+        self.deck.add_image(image)
+
+        with mock.patch(
+            "imagedeck.contactsheets.render_sheet", wraps=render_sheet_function
+        ) as render_sheet:
+            second = self.contact_sheet()
+        self.assertEqual(render_sheet.call_count, 1)
+        self.assertEqual(first["sheets"][0], second["sheets"][0])
+        self.assertNotEqual(first["sheets"][1]["name"], second["sheets"][1]["name"])
+        self.assertEqual(second["images"][-1]["image"], image.pk)
+        # The old sheets are removed
+        self.assertFalse(self.storage.exists(first["sheets"][1]["name"]))
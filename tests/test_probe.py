@@ -0,0 +1,120 @@
+import os
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from imagedeck.probe import dimensions_from_header, probe_dimensions
+
+from .server import LocalServer
+
+
+def image_data(size, format, **options):
+    data = BytesIO()
+    Image.new("RGB", size, color="blue").save(data, format=format, **options)
+    return data.getvalue()
+
+
+def large_jpeg(size=(1200, 900)):
+    """A JPEG of noise with a large EXIF block before the frame header."""
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    exif = Image.Exif()
+    exif[0x010E] = "x" * 30000  # ImageDescription
+    data = BytesIO()
+    image.save(data, format="JPEG", exif=exif, quality=95)
+    return data.getvalue()
+
+
+class DimensionsFromHeaderTest(SimpleTestCase):
+    def test_formats(self):
+        cases = [
+            ("JPEG", {}),
+            ("JPEG", {"progressive": True}),
+            ("PNG", {}),
+            ("GIF", {}),
+            ("WEBP", {}),
+            ("WEBP", {"lossless": True}),
+            ("TIFF", {}),
+        ]
+        for format, options in cases:
+            with self.subTest(format=format, options=options):
+                data = image_data((321, 123), format, **options)
+                self.assertEqual(dimensions_from_header(data[:1024]), (321, 123))
+
+    def test_big_endian_tiff(self):
+        header = (
+            b"MM\x00*\x00\x00\x00\x08"
+            b"\x00\x02"
+            b"\x01\x00\x00\x04\x00\x00\x00\x01\x00\x01\x00\x00"
+            b"\x01\x01\x00\x03\x00\x00\x00\x01\x00\x20\x00\x00"
+        )
+        self.assertEqual(dimensions_from_header(header), (65536, 32))
+
+    def test_webp_extended(self):
+        image = Image.new("RGBA", (500, 40), color=(0, 0, 255, 128))
+        data = BytesIO()
+        image.save(data, format="WEBP", exif=Image.Exif().tobytes())
+        self.assertEqual(dimensions_from_header(data.getvalue()[:64]), (500, 40))
+
+    def test_needs_more_data(self):
+        data = large_jpeg()
+        self.assertIsNone(dimensions_from_header(data[:1024]))
+        self.assertEqual(dimensions_from_header(data[:40000]), (1200, 900))
+
+    def test_unknown(self):
+        self.assertIsNone(dimensions_from_header(image_data((10, 10), "BMP")))
+        self.assertIsNone(dimensions_from_header(b""))
+
+
+class ProbeDimensionsTest(SimpleTestCase):
+    def test_range(self):
+        data = large_jpeg()
+        with LocalServer({"/a.jpg": ("image/jpeg", data)}) as server:
+            self.assertEqual(
+                probe_dimensions(server.url("/a.jpg"), max_bytes=65536), (1200, 900)
+            )
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]["headers"]["Range"], "bytes=0-65535")
+        self.assertLessEqual(server.requests[0]["sent"], 65536)
+        self.assertGreater(len(data), 65536)
+
+    def test_range_ignored(self):
+        with LocalServer(
+            {"/a.png": ("image/png", image_data((640, 480), "PNG"))}, ranges=False
+        ) as server:
+            self.assertEqual(probe_dimensions(server.url("/a.png")), (640, 480))
+        self.assertEqual(len(server.requests), 1)
+
+    def test_small_unknown_format(self):
+        # The whole file fits in the probe so it is opened without another request
+        with LocalServer(
+            {"/a.bmp": ("image/bmp", image_data((30, 20), "BMP"))}
+        ) as server:
+            self.assertEqual(probe_dimensions(server.url("/a.bmp")), (30, 20))
+        self.assertEqual(len(server.requests), 1)
+
+    def test_fallback(self):
+        with LocalServer(
+            {"/a.bmp": ("image/bmp", image_data((300, 200), "BMP"))}
+        ) as server:
+            self.assertEqual(
+                probe_dimensions(server.url("/a.bmp"), max_bytes=1024), (300, 200)
+            )
+        self.assertEqual(len(server.requests), 2)
+        self.assertNotIn("Range", server.requests[1]["headers"])
+
+    def test_tiff_directory_at_end(self):
+        data = image_data((321, 123), "TIFF", compression="tiff_lzw")
+        with LocalServer({"/a.tif": ("image/tiff", data)}) as server:
+            self.assertEqual(
+                probe_dimensions(server.url("/a.tif"), max_bytes=256), (321, 123)
+            )
+        self.assertEqual(len(server.requests), 2)
+        offset = int.from_bytes(data[4:8], "little")
+        self.assertEqual(
+            server.requests[1]["headers"]["Range"], f"bytes={offset}-{offset + 4095}"
+        )
+
+    def test_missing(self):
+        with LocalServer() as server:
+            self.assertIsNone(probe_dimensions(server.url("/missing.jpg")))
@@ -0,0 +1,49 @@
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from imagedeck.processors import (
+    DraftThumbnail,
+    draft_pil_image,
+    reduce_image,
+    reduction_factor,
+    scale_subject_location,
+)
+
+
+def image_bytes(size, format="JPEG"):
+    data = BytesIO()
+    Image.new("RGB", size, color="blue").save(data, format=format)
+    data.seek(0)
+    return data
+
+
+class ProcessorsTest(SimpleTestCase):
+    def test_reduction_factor(self):
+        self.assertEqual(reduction_factor((4000, 3000), (250, None)), 8)
+        self.assertEqual(reduction_factor((1000, 800), (250, 0)), 2)
+        self.assertEqual(reduction_factor((1000, 800), (500, 500)), 1)
+        self.assertEqual(reduction_factor((1000, 800), (None, None)), 1)
+        self.assertEqual(reduction_factor((None, None), (100, 100)), 1)
+
+    def test_reduce_jpeg_uses_draft(self):
+        image = reduce_image(Image.open(image_bytes((1600, 1200))), 4)
+        self.assertEqual(image.size, (400, 300))
+
+    def test_reduce_png(self):
+        image = reduce_image(Image.open(image_bytes((1600, 1200), "PNG")), 4)
+        self.assertEqual(image.size, (400, 300))
+
+    def test_draft_pil_image(self):
+        image = draft_pil_image(image_bytes((1600, 1200)), reduce=2)
+        self.assertEqual(image.size, (800, 600))
+
+    def test_draft_thumbnail(self):
+        image = DraftThumbnail(200, 150).process(Image.open(image_bytes((1600, 1200))))
+        self.assertEqual(image.size, (200, 150))
+
+    def test_scale_subject_location(self):
+        self.assertEqual(scale_subject_location("400,300", 4), "100,75")
+        self.assertEqual(scale_subject_location("", 4), "")
+        self.assertEqual(scale_subject_location("400,300", 1), "400,300")
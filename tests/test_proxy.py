@@ -0,0 +1,191 @@
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from imagedeck.models import DeckImageIIIF
+from imagedeck.proxy import DiskLRUCache
+
+from .server import LocalServer
+
+
+def jpeg(width, height):
+    f = BytesIO()
+    Image.new("RGB", (width, height), "red").save(f, format="JPEG")
+    return f.getvalue()
+
+
+class DiskLRUCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_evict(self):
+        store = DiskLRUCache(self.directory, max_bytes=25)
+        store.put("aa1", [b"x" * 10])
+        store.put("bb2", [b"x" * 10])
+        # Using a file makes it the most recently used
+        self.assertTrue(store.get("aa1"))
+        store.put("cc3", [b"x" * 10])
+
+        self.assertTrue(store.get("aa1"))
+        self.assertIsNone(store.get("bb2"))
+        self.assertTrue(store.get("cc3"))
+        self.assertEqual(store.total, 20)
+
+    def test_existing_files(self):
+        store = DiskLRUCache(self.directory, max_bytes=100)
+        store.put("aa1", [b"x" * 60])
+
+        # Another process reads the files which are already in the directory
+        other = DiskLRUCache(self.directory, max_bytes=100)
+        other.put("bb2", [b"x" * 60])
+        self.assertEqual(other.total, 60)
+        self.assertFalse(os.path.exists(store.path("aa1")))
+        self.assertIsNone(store.get("aa1"))
+
+
+@override_settings(ROOT_URLCONF="tests.urls")
+class IIIFProxyTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, value in [
+            ("IMAGEDECK_IIIF_PROXY_DIR", directory.name),
+            ("IMAGEDECK_IIIF_PROXY_MAX_BYTES", 1024 * 1024),
+            ("IMAGEDECK_IIIF_PROXY", True),
+        ]:
+            patcher = mock.patch(f"imagedeck.settings.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.content = jpeg(40, 30)
+        self.server = LocalServer(
+            {
+                "/image/full/20,/0/default.jpg": ("image/jpeg", self.content),
+                "/image/pct:0,0,50,100/full/0/default.jpg": (
+                    "image/jpeg",
+                    self.content,
+                ),
+            }
+        )
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.image = DeckImageIIIF.objects.create(base_url=self.server.url("/image"))
+
+    def test_url(self):
+        self.assertEqual(
+            self.image.url(width=20),
+            f"/imagedeck/iiif-proxy/{self.image.pk}/full/20,/0/default.jpg",
+        )
+        self.assertEqual(
+            self.image.remote_url(width=20),
+            self.server.url("/image/full/20,/0/default.jpg"),
+        )
+        with mock.patch("imagedeck.settings.IMAGEDECK_IIIF_PROXY", False):
+            self.assertEqual(self.image.url(width=20), self.image.remote_url(width=20))
+
+    def test_proxy(self):
+        for _ in range(3):
+            response = self.client.get(self.image.url(width=20))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "image/jpeg")
+            self.assertIn("max-age=31536000", response["Cache-Control"])
+            self.assertIn("immutable", response["Cache-Control"])
+            self.assertEqual(b"".join(response.streaming_content), self.content)
+        # Only the first request goes to the remote server
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_region(self):
+        image = DeckImageIIIF.objects.create(
+            base_url=self.server.url("/image"), region="pct:0,0,50,100"
+        )
+        response = self.client.get(image.url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.server.requests[0]["path"], "/image/pct:0,0,50,100/full/0/default.jpg"
+        )
+
+    def test_evict(self):
+        with mock.patch(
+            "imagedeck.settings.IMAGEDECK_IIIF_PROXY_MAX_BYTES", len(self.content)
+        ):
+            region = DeckImageIIIF.objects.create(
+                base_url=self.server.url("/image"), region="pct:0,0,50,100"
+            )
+            for url in [
+                self.image.url(width=20),
+                region.url(),
+                self.image.url(width=20),
+            ]:
+                self.assertEqual(self.client.get(url).status_code, 200)
+        # The first image was removed to make room for the second so it was downloaded again
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_errors(self):
+        response = self.client.get(
+            f"/imagedeck/iiif-proxy/{self.image.pk}/full/30,/0/default.jpg"
+        )
+        self.assertEqual(response.status_code, 502)
+
+        response = self.client.get(
+            f"/imagedeck/iiif-proxy/{self.image.pk + 1}/full/20,/0/default.jpg"
+        )
+        self.assertEqual(response.status_code, 404)
+
+        # Only IIIF image requests are proxied
+        response = self.client.get(
+            f"/imagedeck/iiif-proxy/{self.image.pk}/../info.json"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_only_generated_urls(self):
+        prefix = f"/imagedeck/iiif-proxy/{self.image.pk}"
+        for path in [
+            "pct:0,0,50,100/20,/0/default.jpg",
+            "full/max/0/default.jpg",
+            "full/pct:50/0/default.jpg",
+            "full/!20,20/0/default.jpg",
+            "full/^20,/0/default.jpg",
+            "full/,/0/default.jpg",
+            "full/0,/0/default.jpg",
+            "full/020,/0/default.jpg",
+            "full/20,/90/default.jpg",
+            "full/20,/!0/default.jpg",
+            "full/20,/0/gray.jpg",
+            "full/20,/0/default.png",
+        ]:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(f"{prefix}/{path}").status_code, 404)
+        self.assertEqual(self.server.requests, [])
+
+    def test_max_size(self):
+        with mock.patch("imagedeck.settings.IMAGEDECK_IIIF_PROXY_MAX_SIZE", 10):
+            response = self.client.get(
+                f"/imagedeck/iiif-proxy/{self.image.pk}/full/20,/0/default.jpg"
+            )
+            self.assertEqual(response.status_code, 404)
+            # Larger sizes link to the IIIF server
+            self.assertEqual(self.image.url(width=20), self.image.remote_url(width=20))
+            self.assertEqual(
+                self.image.url(width=10),
+                f"/imagedeck/iiif-proxy/{self.image.pk}/full/10,/0/default.jpg",
+            )
+        self.assertEqual(self.server.requests, [])
+
+    def test_snapped_width(self):
+        info_json = {"sizes": [{"width": 25, "height": 20}]}
+        with mock.patch("imagedeck.documents.cached_info_json", return_value=info_json):
+            self.assertEqual(
+                self.image.url(width=20),
+                f"/imagedeck/iiif-proxy/{self.image.pk}/full/25,/0/default.jpg",
+            )
+            response = self.client.get(
+                f"/imagedeck/iiif-proxy/{self.image.pk}/full/20,/0/default.jpg"
+            )
+            self.assertEqual(response.status_code, 404)
@@ -0,0 +1,292 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from filer.models import Image as FilerImage
+from PIL import Image
+
+from imagedeck.models import Deck, DeckImage, DeckImageIIIF
+from imagedeck.tiles import (
+    InvalidIIIFRequest,
+    parse_region,
+    parse_rotation,
+    parse_size,
+    scale_factors,
+    tile_boxes,
+    tile_directory,
+)
+
+from .test_models import create_filer_image
+
+
+class ParseTest(TestCase):
+    def test_region(self):
+        self.assertEqual(parse_region("full", 300, 200), (0, 0, 300, 200))
+        self.assertEqual(parse_region("square", 300, 200), (50, 0, 200, 200))
+        self.assertEqual(parse_region("10,20,30,40", 300, 200), (10, 20, 30, 40))
+        self.assertEqual(parse_region("256,0,512,512", 300, 200), (256, 0, 44, 200))
+        self.assertEqual(parse_region("pct:50,0,50,100", 300, 200), (150, 0, 150, 200))
+        for region in ["300,0,10,10", "0,0,0,10", "a,b,c,d", "1.5,0,10,10"]:
+            with self.assertRaises(InvalidIIIFRequest):
+                parse_region(region, 300, 200)
+
+    def test_size(self):
+        self.assertEqual(parse_size("max", 300, 200), (300, 200))
+        self.assertEqual(parse_size("full", 300, 200, version=2), (300, 200))
+        self.assertEqual(parse_size("150,", 300, 200), (150, 100))
+        self.assertEqual(parse_size(",50", 300, 200), (75, 50))
+        self.assertEqual(parse_size("pct:50", 300, 200), (150, 100))
+        self.assertEqual(parse_size("!100,100", 300, 200), (100, 67))
+        self.assertEqual(parse_size("30,40", 300, 200), (30, 40))
+        self.assertEqual(parse_size("^600,", 300, 200), (600, 400))
+        self.assertEqual(parse_size("600,", 300, 200, version=2), (600, 400))
+        # The heights of tiles at a level of the pyramid are rounded up
+        self.assertEqual(parse_size("151,", 301, 1024, factors=[1, 2]), (151, 512))
+        for size in ["600,", "^600,", "0,", ",", "pct:abc", "!100,"]:
+            with self.assertRaises(InvalidIIIFRequest):
+                parse_size(size, 300, 200, version=2 if size == "^600," else 3)
+        with mock.patch("imagedeck.settings.IMAGEDECK_IIIF_MAX_AREA", 100):
+            self.assertEqual(parse_size("max", 300, 200), (12, 8))
+            with self.assertRaises(InvalidIIIFRequest):
+                parse_size("20,20", 300, 200)
+
+    def test_rotation(self):
+        self.assertEqual(parse_rotation("0"), (False, 0))
+        self.assertEqual(parse_rotation("!90"), (True, 90))
+        self.assertEqual(parse_rotation("22.5"), (False, 22.5))
+        with self.assertRaises(InvalidIIIFRequest):
+            parse_rotation("361")
+
+    def test_pyramid(self):
+        self.assertEqual(scale_factors(300, 200, 64), [1, 2, 4, 8])
+        self.assertEqual(scale_factors(64, 64, 64), [1])
+        boxes = list(tile_boxes(300, 200, 64, 2))
+        self.assertEqual(len(boxes), 6)
+        self.assertEqual(boxes[-1], ((256, 128, 44, 72), (22, 36)))
+
+
+@override_settings(ROOT_URLCONF="tests.urls")
+class IIIFImageTest(TestCase):
+    def setUp(self):
+        # Each test has its own storage so that no tiles are left from another test
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        media_settings = self.settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        patcher = mock.patch("imagedeck.settings.IMAGEDECK_TILE_SIZE", 64)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.image = create_filer_image("tiles.jpg", size=(300, 200))
+        self.base = f"/imagedeck/iiif/3/{self.image.pk}"
+
+    def get_image(self, path):
+        response = self.client.get(self.base + path)
+        self.assertEqual(response.status_code, 200, path)
+        return Image.open(BytesIO(b"".join(response.streaming_content)))
+
+    def test_info(self):
+        self.assertEqual(
+            self.image.iiif_service_url(), f"/imagedeck/iiif/3/{self.image.pk}"
+        )
+        response = self.client.get(self.base)
+        self.assertRedirects(
+            response, self.base + "/info.json", fetch_redirect_response=False
+        )
+
+        info = self.client.get(self.base + "/info.json").json()
+        self.assertEqual(info["id"], f"http://testserver{self.base}")
+        self.assertEqual(info["type"], "ImageService3")
+        self.assertEqual((info["width"], info["height"]), (300, 200))
+        self.assertEqual(
+            info["tiles"], [dict(width=64, height=64, scaleFactors=[1, 2, 4, 8])]
+        )
+        self.assertEqual(info["sizes"][0], dict(width=38, height=25))
+
+        response = self.client.get(f"/imagedeck/iiif/2/{self.image.pk}/info.json")
+        self.assertEqual(response["Access-Control-Allow-Origin"], "*")
+        self.assertEqual(
+            response.json()["@id"],
+            f"http://testserver/imagedeck/iiif/2/{self.image.pk}",
+        )
+
+    def test_image(self):
+        self.assertEqual(self.get_image("/full/max/0/default.jpg").size, (300, 200))
+        self.assertEqual(self.get_image("/full/150,/0/default.png").size, (150, 100))
+        self.assertEqual(self.get_image("/0,0,100,50/50,25/0/gray.jpg").mode, "L")
+        self.assertEqual(self.get_image("/full/150,/90/default.jpg").size, (100, 150))
+        self.assertEqual(self.get_image("/square/!64,64/0/default.webp").size, (64, 64))
+
+        self.assertEqual(
+            self.client.get(self.base + "/full/600,/0/default.jpg").status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(self.base + "/full/max/0/default.bmp").status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(
+                f"/imagedeck/iiif/3/{self.image.pk + 1}/info.json"
+            ).status_code,
+            404,
+        )
+
+    def test_cached(self):
+        self.get_image("/0,0,128,128/64,64/0/default.jpg")
+        # Later requests (in either version) are read from the storage
+        with mock.patch("imagedeck.tiles.render") as render:
+            self.get_image("/0,0,128,128/64,64/0/default.jpg")
+            response = self.client.get(
+                f"/imagedeck/iiif/2/{self.image.pk}/0,0,128,128/64,/0/color.jpg"
+            )
+            self.assertEqual(response.status_code, 200)
+        render.assert_not_called()
+
+    def test_generate_tiles(self):
+        # 5x4 tiles + 3x2 + 2x1 + 1x1 and the whole image at the first 3 levels
+        # (the only tile at the last level is the whole image)
+        self.assertEqual(self.image.generate_tiles(), 20 + 6 + 2 + 1 + 3)
+        self.assertEqual(self.image.generate_tiles(), 0)
+
+        info = self.client.get(self.base + "/info.json").json()
+        with mock.patch("imagedeck.tiles.render") as render:
+            for factor in info["tiles"][0]["scaleFactors"]:
+                step = 64 * factor
+                for y in range(0, 200, step):
+                    for x in range(0, 300, step):
+                        w, h = min(step, 300 - x), min(step, 200 - y)
+                        tile = self.get_image(
+                            f"/{x},{y},{w},{h}/{-(-w // factor)},/0/default.jpg"
+                        )
+                        self.assertEqual(tile.size, (-(-w // factor), -(-h // factor)))
+            for size in info["sizes"]:
+                self.get_image(f"/full/{size['width']},{size['height']}/0/default.jpg")
+        render.assert_not_called()
+
+    def test_only_advertised_saved(self):
+        self.get_image("/0,0,64,64/64,64/0/default.jpg")
+        # The first tile generates the whole pyramid (the other files are pyramid.json and the source)
+        self.assertEqual(self.count_files(self.media_root), 32 + 1 + 1)
+
+        with mock.patch("imagedeck.tiles.draft_pil_image") as draft_pil_image:
+            self.assertEqual(
+                self.get_image("/10,20,100,50/50,25/0/default.jpg").size, (50, 25)
+            )
+            self.assertEqual(self.get_image("/full/100,/0/gray.png").mode, "L")
+            self.assertEqual(
+                self.get_image("/full/max/!0/default.jpg").size, (300, 200)
+            )
+        draft_pil_image.assert_not_called()
+        self.assertEqual(self.count_files(self.media_root), 32 + 1 + 1)
+
+    def test_render_from_tiles(self):
+        data = BytesIO()
+        source = Image.new("RGB", (300, 200), "blue")
+        source.paste("lime", (150, 0, 300, 200))
+        source.save(data, format="PNG")
+        image = DeckImage.objects.create(
+            image=ContentFile(data.getvalue(), "halves.png")
+        )
+        base = f"/imagedeck/iiif/3/{image.pk}"
+        for path, colour in [
+            ("/120,10,40,20/20,10/0/default.png", None),
+            ("/0,0,140,200/70,100/0/default.png", (0, 0, 255)),
+            ("/160,0,140,200/7,10/0/default.png", (0, 255, 0)),
+        ]:
+            response = self.client.get(base + path)
+            tile = Image.open(BytesIO(b"".join(response.streaming_content)))
+            if colour:
+                for (low, high), value in zip(tile.getextrema(), colour):
+                    self.assertLess(max(abs(low - value), abs(high - value)), 40, path)
+            else:
+                # The region is cut across two tiles and the boundary between the halves
+                self.assertEqual(tile.size, (20, 10))
+                self.assertLess(tile.getpixel((2, 5))[1], 60)
+                self.assertGreater(tile.getpixel((18, 5))[1], 200)
+
+    def test_sizes_within_max_area(self):
+        with mock.patch("imagedeck.settings.IMAGEDECK_IIIF_MAX_AREA", 100 * 100):
+            info = self.client.get(self.base + "/info.json").json()
+            self.assertEqual(
+                [(size["width"], size["height"]) for size in info["sizes"]],
+                [(38, 25), (75, 50)],
+            )
+            for size in info["sizes"]:
+                response = self.client.get(
+                    self.base + f"/full/{size['width']},{size['height']}/0/default.jpg"
+                )
+                self.assertEqual(response.status_code, 200)
+
+            # The whole image isn't saved at the levels which are too large to be served
+            directory = f"{self.media_root}/{tile_directory(self.image)}"
+            self.assertFalse(os.path.exists(f"{directory}/0,0,300,200/300,200"))
+            self.assertFalse(os.path.exists(f"{directory}/0,0,300,200/150,100"))
+            self.assertTrue(os.path.exists(f"{directory}/0,0,300,200/75,50"))
+
+    def test_deck_image(self):
+        data = BytesIO()
+        Image.new("RGB", (100, 80), "blue").save(data, format="PNG")
+        image = DeckImage.objects.create(
+            image=ContentFile(data.getvalue(), "tiles.png")
+        )
+        response = self.client.get(f"/imagedeck/iiif/3/{image.pk}/info.json")
+        self.assertEqual(
+            (response.json()["width"], response.json()["height"]), (100, 80)
+        )
+
+        # Remote images don't have a IIIF service here
+        remote = DeckImageIIIF.objects.create(base_url="http://www.example.org/iiif/a")
+        self.assertEqual(remote.iiif_service_url(), "http://www.example.org/iiif/a")
+        self.assertEqual(
+            self.client.get(f"/imagedeck/iiif/3/{remote.pk}/info.json").status_code, 404
+        )
+
+    def count_files(self, directory):
+        return sum(len(files) for _, _, files in os.walk(directory))
+
+    def test_private(self):
+        private_root = tempfile.TemporaryDirectory()
+        self.addCleanup(private_root.cleanup)
+        storages = FilerImage._meta.get_field("file").storages
+        patcher = mock.patch.dict(
+            storages, private=FileSystemStorage(location=private_root.name)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Tiles made while the image was public are removed when it is made private
+        self.get_image("/full/64,/0/default.jpg")
+        self.assertGreater(self.count_files(self.media_root + "/imagedeck"), 0)
+        self.image.filer_image.is_public = False
+        self.image.filer_image.save()
+        self.assertEqual(self.count_files(self.media_root + "/imagedeck"), 0)
+
+        for path in ["/info.json", "/full/64,/0/default.jpg"]:
+            self.assertEqual(self.client.get(self.base + path).status_code, 404)
+
+        self.client.force_login(User.objects.create_superuser("admin"))
+        response = self.client.get(self.base + "/info.json")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Access-Control-Allow-Origin", response)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+        self.assertEqual(self.get_image("/full/64,/0/default.jpg").size, (64, 43))
+
+        # The tiles are in Filer's private storage
+        self.assertEqual(self.count_files(self.media_root + "/imagedeck"), 0)
+        self.assertGreater(self.count_files(private_root.name + "/imagedeck"), 0)
+
+    def test_command(self):
+        deck = Deck.objects.create(name="Tiles")
+        deck.add_image(self.image)
+        stdout = StringIO()
+        call_command("imagedeck_tiles", "Tiles", stdout=stdout)
+        self.assertIn("Generated 32 tiles for 1 images", stdout.getvalue())